@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Alarm
+from .models import Alarm, NotificationOutbox, AlarmExport
 
 @admin.register(Alarm)
 class AlarmAdmin(admin.ModelAdmin):
@@ -8,3 +8,16 @@ class AlarmAdmin(admin.ModelAdmin):
     search_fields = ('subject__name', 'subject__custodian__user__username', 'location')
     date_hierarchy = 'timestamp'
     readonly_fields = ('timestamp', 'created_at', 'updated_at')
+
+@admin.register(NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = ('dedup_key', 'task_name', 'created_at', 'dispatched_at', 'relay_attempts')
+    list_filter = ('task_name',)
+    search_fields = ('dedup_key',)
+    readonly_fields = ('created_at', 'dispatched_at', 'relay_attempts', 'last_error')
+
+@admin.register(AlarmExport)
+class AlarmExportAdmin(admin.ModelAdmin):
+    list_display = ('requested_by', 'export_format', 'status', 'row_count', 'created_at', 'completed_at')
+    list_filter = ('export_format', 'status')
+    readonly_fields = ('created_at', 'completed_at', 'row_count', 'error')
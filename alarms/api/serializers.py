@@ -1,8 +1,9 @@
 from rest_framework import serializers
 from ..models import Alarm, NotificationAttempt
 from subjects.models import Subject, SubjectQR
+from core.api import SparseFieldsetMixin
 
-class AlarmSerializer(serializers.ModelSerializer):
+class AlarmSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     subject_name = serializers.CharField(source='subject.name', read_only=True)
     custodian_name = serializers.CharField(source='subject.custodian.user.get_full_name', read_only=True)
     qr_code_uuid = serializers.UUIDField(source='qr_code.uuid', read_only=True)
@@ -28,7 +29,7 @@ class NotificationAttemptSerializer(serializers.ModelSerializer):
     class Meta:
         model = NotificationAttempt
         fields = [
-            'id', 'alarm', 'recipient', 'recipient_name', 'channel',
-            'status', 'sent_at', 'error_message', 'retry_count', 'created_at'
+            'id', 'alarm', 'recipient', 'recipient_name', 'channel', 'destination', 'priority',
+            'status', 'sent_at', 'delivered_at', 'latency_ms', 'error_message', 'retry_count', 'created_at'
         ]
-        read_only_fields = ['sent_at', 'error_message', 'retry_count', 'created_at'] 
\ No newline at end of file
+        read_only_fields = ['sent_at', 'delivered_at', 'latency_ms', 'error_message', 'retry_count', 'created_at'] 
\ No newline at end of file
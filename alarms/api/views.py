@@ -7,24 +7,26 @@ from subjects.models import Subject
 from ..models import Alarm, NotificationStatus, NotificationAttempt
 from .serializers import AlarmSerializer, NotificationAttemptSerializer
 from ..tasks import send_whatsapp_notification
+from ..queues import notification_queue
+from ..statistics import api_statistics
 from django.utils import timezone
-from django.db.models import Count, Max, Q, FloatField
-from django.db.models.functions import Cast, ExtractHour
-from datetime import timedelta
+from django.utils.decorators import method_decorator
+from core.api import DeltaSyncMixin, KeysetPagination, paginate
+from core.conditional import ConditionalGetMixin, conditional_on_changes
 import json
 
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
+@conditional_on_changes
 def alarm_list_api(request):
     if request.method == 'GET':
         # Filter alarms based on user's role
-        if request.user.is_staff:
-            alarms = Alarm.objects.all()
-        else:
-            alarms = Alarm.objects.filter(subject__custodian__user=request.user)
-        
-        serializer = AlarmSerializer(alarms, many=True)
-        return Response(serializer.data)
+        alarms = Alarm.objects.select_related('subject__custodian__user', 'qr_code').prefetch_related(
+            'notification_attempts'
+        )
+        if not request.user.is_staff:
+            alarms = alarms.filter(custodian__user=request.user)
+        return paginate(request, alarms, AlarmSerializer)
     
     elif request.method == 'POST':
         data = request.data.copy()
@@ -54,27 +56,20 @@ def alarm_list_api(request):
         
         serializer = AlarmSerializer(data=data)
         if serializer.is_valid():
-            alarm = serializer.save()
-            
-            # Queue notification task
-            try:
-                send_whatsapp_notification.delay(alarm.id)
-            except Exception as e:
-                # Log the error but don't prevent alarm creation
-                alarm.notification_error = str(e)
-                alarm.save()
-            
+            # The notification is queued through the alarm outbox
+            serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['GET', 'DELETE'])
 @permission_classes([IsAuthenticated])
+@conditional_on_changes
 def alarm_detail_api(request, pk):
     try:
         if request.user.is_staff:
             alarm = Alarm.objects.get(pk=pk)
         else:
-            alarm = Alarm.objects.get(pk=pk, subject__custodian__user=request.user)
+            alarm = Alarm.objects.get(pk=pk, custodian__user=request.user)
     except Alarm.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
@@ -91,23 +86,20 @@ def alarm_detail_api(request, pk):
         alarm.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-class AlarmViewSet(viewsets.ModelViewSet):
+class AlarmViewSet(ConditionalGetMixin, DeltaSyncMixin, viewsets.ModelViewSet):
     """ViewSet for viewing and editing alarms."""
     serializer_class = AlarmSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        """Filter alarms based on user's role."""
+        """Filter alarms based on user's role; attempts are prefetched for the page only."""
+        alarms = Alarm.objects.select_related('subject__custodian__user', 'qr_code').prefetch_related(
+            'notification_attempts'
+        )
         if self.request.user.is_staff:
-            return Alarm.objects.all()
-        return Alarm.objects.filter(subject__custodian__user=self.request.user)
-
-    def get_serializer_context(self):
-        context = super().get_serializer_context()
-        context['notification_attempts'] = NotificationAttempt.objects.filter(
-            alarm__in=self.get_queryset()
-        ).select_related('recipient', 'recipient__user')
-        return context
+            return alarms
+        return alarms.filter(custodian__user=self.request.user)
 
     @action(detail=True, methods=['post'])
     def resolve(self, request, pk=None):
@@ -119,6 +111,7 @@ class AlarmViewSet(viewsets.ModelViewSet):
         return Response({'status': 'alarm resolved'})
 
     @action(detail=False, methods=['get'])
+    @method_decorator(conditional_on_changes(windowed=True))
     def statistics(self, request):
         """Get alarm statistics."""
         try:
@@ -134,58 +127,7 @@ class AlarmViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=days)
-        
-        alarms = self.get_queryset()
-        filtered_alarms = alarms.filter(timestamp__range=[start_date, end_date])
-        
-        data = {
-            'total_alarms': alarms.count(),
-            'recent_alarms': filtered_alarms.count(),
-            'subject_stats': [],
-            'date_stats': [],
-            'notifications': {
-                'sent': filtered_alarms.filter(notification_status=NotificationStatus.SENT).count(),
-                'delivered': filtered_alarms.filter(notification_status=NotificationStatus.DELIVERED).count(),
-                'failed': filtered_alarms.filter(notification_status__in=[NotificationStatus.FAILED, NotificationStatus.ERROR]).count(),
-                'pending': filtered_alarms.filter(notification_status__in=[NotificationStatus.PENDING, NotificationStatus.PROCESSING]).count(),
-            },
-            'time_range': {
-                'start_date': start_date.isoformat(),
-                'end_date': end_date.isoformat(),
-                'days': days
-            }
-        }
-        
-        subject_stats = filtered_alarms.values(
-            'subject__name',
-            'subject__id'
-        ).annotate(
-            count=Count('id'),
-            last_alarm=Max('timestamp'),
-            notification_success_rate=Cast(
-                Count('id', filter=Q(notification_status=NotificationStatus.SENT)) * 100.0 / Count('id'),
-                output_field=FloatField()
-            )
-        ).order_by('-count')
-        data['subject_stats'] = list(subject_stats)
-        
-        daily_stats = filtered_alarms.values('timestamp__date').annotate(
-            count=Count('id'),
-            notifications_sent=Count('id', filter=Q(notification_status=NotificationStatus.SENT)),
-            notifications_failed=Count('id', filter=Q(notification_status__in=[NotificationStatus.FAILED, NotificationStatus.ERROR]))
-        ).order_by('timestamp__date')
-        data['date_stats'] = list(daily_stats)
-        
-        hour_stats = filtered_alarms.annotate(
-            hour=ExtractHour('timestamp')
-        ).values('hour').annotate(
-            count=Count('id')
-        ).order_by('hour')
-        data['hour_stats'] = list(hour_stats)
-        
-        return Response(data)
+        return Response(api_statistics(request.user, days))
 
 class NotificationAttemptViewSet(viewsets.ModelViewSet):
     """ViewSet for viewing and editing notification attempts."""
@@ -196,7 +138,7 @@ class NotificationAttemptViewSet(viewsets.ModelViewSet):
         """Filter notification attempts based on user's role."""
         if self.request.user.is_staff:
             return NotificationAttempt.objects.all()
-        return NotificationAttempt.objects.filter(alarm__subject__custodian__user=self.request.user)
+        return NotificationAttempt.objects.filter(custodian__user=self.request.user)
 
     @action(detail=True, methods=['post'])
     def mark_sent(self, request, pk=None):
@@ -217,6 +159,7 @@ class NotificationAttemptViewSet(viewsets.ModelViewSet):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional_on_changes(windowed=True)
 def alarm_statistics_api(request):
     """API endpoint for alarm statistics"""
     try:
@@ -232,67 +175,7 @@ def alarm_statistics_api(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    end_date = timezone.now()
-    start_date = end_date - timedelta(days=days)
-    
-    if request.user.is_staff:
-        alarms = Alarm.objects.all()
-    else:
-        alarms = Alarm.objects.filter(subject__custodian__user=request.user)
-    
-    # Get filtered data
-    filtered_alarms = alarms.filter(timestamp__range=[start_date, end_date])
-    
-    # Prepare statistics
-    data = {
-        'total_alarms': alarms.count(),
-        'recent_alarms': filtered_alarms.count(),
-        'subject_stats': [],
-        'date_stats': [],
-        'notifications': {
-            'sent': filtered_alarms.filter(notification_status=NotificationStatus.SENT).count(),
-            'delivered': filtered_alarms.filter(notification_status=NotificationStatus.DELIVERED).count(),
-            'failed': filtered_alarms.filter(notification_status__in=[NotificationStatus.FAILED, NotificationStatus.ERROR]).count(),
-            'pending': filtered_alarms.filter(notification_status__in=[NotificationStatus.PENDING, NotificationStatus.PROCESSING]).count(),
-        },
-        'time_range': {
-            'start_date': start_date.isoformat(),
-            'end_date': end_date.isoformat(),
-            'days': days
-        }
-    }
-    
-    # Get subject statistics
-    subject_stats = filtered_alarms.values(
-        'subject__name',
-        'subject__id'
-    ).annotate(
-        count=Count('id'),
-        last_alarm=Max('timestamp'),
-        notification_success_rate=Cast(
-            Count('id', filter=Q(notification_status=NotificationStatus.SENT)) * 100.0 / Count('id'),
-            output_field=FloatField()
-        )
-    ).order_by('-count')
-    data['subject_stats'] = list(subject_stats)
-    
-    # Get daily statistics
-    daily_stats = filtered_alarms.values('timestamp__date').annotate(
-        count=Count('id'),
-        notifications_sent=Count('id', filter=Q(notification_status=NotificationStatus.SENT)),
-        notifications_failed=Count('id', filter=Q(notification_status__in=[NotificationStatus.FAILED, NotificationStatus.ERROR]))
-    ).order_by('timestamp__date')
-    data['date_stats'] = list(daily_stats)
-    
-    # Get hourly distribution
-    hour_stats = filtered_alarms.annotate(
-        hour=ExtractHour('timestamp')
-    ).values('hour').annotate(
-        count=Count('id')
-    ).order_by('hour')
-    data['hour_stats'] = list(hour_stats)
-    
-    return Response(data)
+    return Response(api_statistics(request.user, days))
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -304,7 +187,7 @@ def retry_notification_api(request, alarm_id):
         else:
             alarm = Alarm.objects.get(
                 id=alarm_id,
-                subject__custodian__user=request.user
+                custodian__user=request.user
             )
     except Alarm.DoesNotExist:
         return Response(
@@ -319,8 +202,10 @@ def retry_notification_api(request, alarm_id):
         )
     
     try:
-        # Queue the notification task
-        send_whatsapp_notification.delay(alarm.id)
+        # Queue the notification task; manual retries don't jump ahead of new alarms
+        send_whatsapp_notification.apply_async(
+            (alarm.id,), queue=notification_queue(alarm.is_test, retry=True)
+        )
         
         return Response({
             'success': True,
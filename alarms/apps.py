@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AlarmsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'alarms'
+
+    def ready(self):
+        import alarms.receivers  # noqa
@@ -0,0 +1,176 @@
+"""
+Streaming alarm exports.
+
+Rows are read with ``values_list`` projections and ``.iterator()`` so no
+model instances (or per-row subject/custodian queries) are created, and every
+writer keeps memory bounded: CSV is streamed to the client, XLSX is written in
+xlsxwriter's constant-memory mode to a temporary file, and PDF pages are drawn
+one at a time straight onto the canvas.
+"""
+
+import csv
+import tempfile
+
+import xlsxwriter
+from django.conf import settings
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+from core.db_router import read_database
+from .models import Alarm
+
+EXPORT_FIELDS = (
+    'timestamp',
+    'subject__name',
+    'subject__custodian__user__first_name',
+    'subject__custodian__user__last_name',
+    'location',
+    'notification_sent',
+)
+
+
+def chunk_size():
+    return getattr(settings, 'ALARM_EXPORT_CHUNK_SIZE', 2000)
+
+
+def export_queryset(user):
+    """Return the alarms a user may export, newest first, read from the replica if there is one."""
+    if user.is_staff:
+        alarms = Alarm.objects.all()
+    else:
+        alarms = Alarm.objects.filter(custodian__user=user)
+    return alarms.using(read_database()).order_by('-timestamp')
+
+
+def iter_rows(queryset):
+    """Yield (timestamp, subject, custodian, location, notification_sent) tuples."""
+    rows = queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size())
+    for timestamp, subject_name, first_name, last_name, location, notification_sent in rows:
+        custodian_name = f"{first_name} {last_name}".strip()
+        yield timestamp, subject_name, custodian_name, location or 'N/A', notification_sent
+
+
+class Echo:
+    """File-like object that hands back what is written, for streaming csv.writer output."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(queryset, rows_per_chunk=500):
+    """Yield the CSV export in chunks of encoded rows."""
+    writer = csv.writer(Echo())
+    buffer = [writer.writerow(['Timestamp', 'Subject', 'Custodian', 'Location', 'Notification Status'])]
+    for timestamp, subject_name, custodian_name, location, notification_sent in iter_rows(queryset):
+        buffer.append(writer.writerow([
+            timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+            subject_name,
+            custodian_name,
+            location,
+            'Sent' if notification_sent else 'Pending'
+        ]))
+        if len(buffer) >= rows_per_chunk:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def write_xlsx(queryset, output):
+    """Write the Excel export to a binary file object using constant memory."""
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True, 'tmpdir': tempfile.gettempdir()})
+    worksheet = workbook.add_worksheet()
+
+    headers = ['Date', 'Time', 'Subject', 'Location', 'Notification Status']
+    for col, header in enumerate(headers):
+        worksheet.write(0, col, header)
+
+    # constant_memory mode requires rows to be written in order
+    row_count = 0
+    for row, (timestamp, subject_name, _, location, notification_sent) in enumerate(iter_rows(queryset), start=1):
+        worksheet.write(row, 0, timestamp.strftime('%Y-%m-%d'))
+        worksheet.write(row, 1, timestamp.strftime('%H:%M:%S'))
+        worksheet.write(row, 2, subject_name)
+        worksheet.write(row, 3, location)
+        worksheet.write(row, 4, 'Sent' if notification_sent else 'Failed')
+        row_count = row
+
+    workbook.close()
+    return row_count
+
+
+PDF_COLUMNS = [
+    ('Date', 70),
+    ('Time', 60),
+    ('Subject', 140),
+    ('Location', 170),
+    ('Notification Status', 100),
+]
+PDF_MARGIN = 40
+PDF_ROW_HEIGHT = 18
+
+
+def _fit(text, width, font, size):
+    """Truncate text so it fits in a table cell."""
+    text = str(text)
+    if stringWidth(text, font, size) <= width:
+        return text
+    while text and stringWidth(text + '...', font, size) > width:
+        text = text[:-1]
+    return text + '...'
+
+
+def write_pdf(queryset, output):
+    """
+    Draw the PDF report page by page onto a binary file object.
+    Each page is flushed by the canvas as soon as it is full, so memory stays
+    flat however many alarms are exported.
+    """
+    pdf = canvas.Canvas(output, pagesize=letter)
+    page_width, page_height = letter
+    table_width = sum(width for _, width in PDF_COLUMNS)
+    left = (page_width - table_width) / 2
+
+    def draw_row(y, values, header=False):
+        font = 'Helvetica-Bold' if header else 'Helvetica'
+        size = 10 if header else 9
+        pdf.setFillColor(colors.grey if header else colors.beige)
+        pdf.rect(left, y, table_width, PDF_ROW_HEIGHT, stroke=1, fill=1)
+        pdf.setFillColor(colors.whitesmoke if header else colors.black)
+        pdf.setFont(font, size)
+        x = left
+        for value, (_, width) in zip(values, PDF_COLUMNS):
+            pdf.drawCentredString(x + width / 2, y + 5, _fit(value, width - 6, font, size))
+            pdf.line(x, y, x, y + PDF_ROW_HEIGHT)
+            x += width
+
+    def start_page(first=False):
+        y = page_height - PDF_MARGIN
+        if first:
+            pdf.setFont('Helvetica-Bold', 18)
+            pdf.drawCentredString(page_width / 2, y - 18, 'Alarm Report')
+            y -= 40
+        y -= PDF_ROW_HEIGHT
+        draw_row(y, [title for title, _ in PDF_COLUMNS], header=True)
+        return y
+
+    y = start_page(first=True)
+    row_count = 0
+    for timestamp, subject_name, _, location, notification_sent in iter_rows(queryset):
+        y -= PDF_ROW_HEIGHT
+        if y < PDF_MARGIN:
+            pdf.showPage()
+            y = start_page() - PDF_ROW_HEIGHT
+        draw_row(y, [
+            timestamp.strftime('%Y-%m-%d'),
+            timestamp.strftime('%H:%M:%S'),
+            subject_name,
+            location,
+            'Sent' if notification_sent else 'Failed'
+        ])
+        row_count += 1
+
+    pdf.save()
+    return row_count
@@ -0,0 +1,208 @@
+"""
+Multi-recipient, multi-channel alarm notifications.
+
+Each send of an alarm fans out to every route in ALARM_FANOUT_ROUTES that the
+custodian has a contact for (WhatsApp and SMS to the main and emergency
+phones, email to the account address). Every route gets its own
+NotificationAttempt and all of them are sent concurrently on the delivery
+engine, each lower-priority route after an ALARM_FANOUT_STAGGER_SECONDS head
+start for the one before it. Each attempt's outcome and provider message id
+are saved as soon as its send returns, so a receipt for an early route can
+arrive while later routes are still waiting. The first delivery receipt for any attempt
+delivers the alarm (alarms.receipts) and marks it in Redis; routes still
+waiting out their head start are then cancelled instead of sent.
+
+Test alarms only use the primary route, so they never page emergency
+contacts, and a retry skips the routes that already reached someone.
+"""
+
+import logging
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+from core.redis_client import get_redis
+from .models import NotificationAttempt, NotificationChannel, NotificationStatus
+
+logger = logging.getLogger(__name__)
+
+DELIVERED_KEY = 'alarms:delivered:{alarm_id}'
+DELIVERED_TTL = 60 * 60 * 24
+
+DEFAULT_ROUTES = [
+    ('phone_number', NotificationChannel.WHATSAPP),
+    ('phone_number', NotificationChannel.SMS),
+    ('emergency_phone', NotificationChannel.WHATSAPP),
+    ('emergency_phone', NotificationChannel.SMS),
+    ('email', NotificationChannel.EMAIL),
+]
+
+ATTEMPT_RESULT_FIELDS = ['status', 'message_id', 'sent_at', 'latency_ms', 'error_message']
+
+
+def format_phone(phone_number):
+    """Return the phone number as an E.164 string."""
+    phone_str = str(phone_number)
+    if not phone_str.startswith('+'):
+        phone_str = f"+{phone_str}"
+    return phone_str
+
+
+def result_message_id(result):
+    """Return the provider message id in a MessageService result, if any."""
+    meta_result = result.get('meta_result') if isinstance(result.get('meta_result'), dict) else {}
+    return result.get('message_id') or result.get('message_sid') or meta_result.get('message_id')
+
+
+def result_error(result):
+    """Return the error in a failed MessageService result."""
+    return result.get('error') or (result.get('meta_result') or {}).get('error', 'Unknown error')
+
+
+def is_success(result):
+    meta_result = result.get('meta_result') if isinstance(result.get('meta_result'), dict) else {}
+    return result.get('status') == 'success' or bool(meta_result.get('success'))
+
+
+def routes_for(alarm):
+    """
+    Return the (priority, channel, destination) routes for an alarm, skipping
+    missing and repeated contacts. Test alarms get the primary route only.
+    """
+    custodian = alarm.subject.custodian
+    contacts = {
+        'phone_number': custodian.phone_number,
+        'emergency_phone': custodian.emergency_phone,
+        'email': custodian.user.email,
+    }
+    routes = []
+    seen = set()
+    for priority, (contact, channel) in enumerate(getattr(settings, 'ALARM_FANOUT_ROUTES', DEFAULT_ROUTES)):
+        destination = contacts.get(contact)
+        if not destination:
+            continue
+        destination = str(destination) if channel == NotificationChannel.EMAIL else format_phone(destination)
+        if (channel, destination) in seen:
+            continue
+        seen.add((channel, destination))
+        routes.append((priority, channel, destination))
+    return routes[:1] if alarm.is_test else routes
+
+
+def succeeded_routes(alarm):
+    """Return the (channel, destination) routes of the alarm that already reached someone."""
+    attempts = NotificationAttempt.objects.filter(alarm=alarm).filter(
+        # Email has no delivery receipts, so SENT is as far as it gets
+        models.Q(status=NotificationStatus.DELIVERED)
+        | models.Q(channel=NotificationChannel.EMAIL, status=NotificationStatus.SENT)
+    )
+    return set(attempts.values_list('channel', 'destination'))
+
+
+def mark_delivered(alarm_ids):
+    """Record that alarms reached someone, so their staggered routes are not sent."""
+    if not alarm_ids:
+        return
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for alarm_id in alarm_ids:
+            pipe.set(DELIVERED_KEY.format(alarm_id=alarm_id), 1, ex=DELIVERED_TTL)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not mark alarms {sorted(alarm_ids)} delivered: {str(e)}")
+
+
+def is_delivered(alarm_id):
+    try:
+        return bool(get_redis().exists(DELIVERED_KEY.format(alarm_id=alarm_id)))
+    except Exception as e:
+        # Sending a redundant message beats holding back an emergency one
+        logger.warning(f"Could not check delivery of alarm {alarm_id}: {str(e)}")
+        return False
+
+
+def _record_result(attempt, result):
+    """Save the outcome of one route's send on its attempt."""
+    attempt.latency_ms = result.get('latency_ms')
+    if result.get('status') == 'cancelled':
+        attempt.status = NotificationStatus.CANCELLED
+    elif is_success(result):
+        # Email has no delivery receipts, so handing it to the backend is as far as it goes
+        attempt.status = NotificationStatus.SENT if attempt.channel == NotificationChannel.EMAIL else NotificationStatus.ACCEPTED
+        attempt.sent_at = timezone.now()
+        attempt.message_id = result_message_id(result)
+    else:
+        attempt.status = NotificationStatus.FAILED
+        attempt.error_message = result_error(result)
+    # Saved before the next route is sent, so its receipt finds the attempt
+    NotificationAttempt.objects.filter(pk=attempt.pk).update(
+        **{field: getattr(attempt, field) for field in ATTEMPT_RESULT_FIELDS}
+    )
+
+
+def notify(service, alarm, message):
+    """
+    Send message to every route of the alarm concurrently, recording one
+    NotificationAttempt per route with its latency and outcome. Returns the
+    result of the highest-priority route the provider accepted, or an error
+    result listing why every route failed.
+    """
+    routes = routes_for(alarm)
+    if not routes:
+        return {'status': 'error', 'error': f"No contact found for custodian of subject {alarm.subject.name}"}
+    if alarm.notification_attempt_count:
+        # A retry only goes to the routes that haven't reached anyone yet
+        succeeded = succeeded_routes(alarm)
+        routes = [route for route in routes if route[1:] not in succeeded]
+        if not routes:
+            return {'status': 'error', 'error': 'Every route already reached its recipient'}
+
+    # One INSERT; the alarm counts the whole fan-out as a single attempt
+    attempts = NotificationAttempt.objects.bulk_create([
+        NotificationAttempt(
+            alarm=alarm,
+            recipient_id=alarm.subject.custodian_id,
+            custodian_id=alarm.custodian_id,
+            channel=channel,
+            destination=destination,
+            priority=priority,
+            status=NotificationStatus.PROCESSING,
+            # The fan-out round: how many times the alarm was sent before
+            retry_count=alarm.notification_attempt_count,
+        )
+        for priority, channel, destination in routes
+    ])
+
+    stagger = getattr(settings, 'ALARM_FANOUT_STAGGER_SECONDS', 10)
+    results = service.send_routes(
+        [
+            {
+                'channel': attempt.channel,
+                'to': attempt.destination,
+                'message': message,
+                'subject': f"Keryu alarm: {alarm.subject.name}",
+                'delay': position * stagger,
+            }
+            for position, attempt in enumerate(attempts)
+        ],
+        should_send=lambda: not is_delivered(alarm.id),
+        on_result=lambda index, result: _record_result(attempts[index], result)
+    )
+
+    accepted = None
+    errors = []
+    for attempt, result in zip(attempts, results):
+        if attempt.status == NotificationStatus.PROCESSING:
+            # A service that doesn't report routes as they finish
+            _record_result(attempt, result)
+        if attempt.status in (NotificationStatus.ACCEPTED, NotificationStatus.SENT):
+            accepted = accepted or result
+        elif attempt.status == NotificationStatus.FAILED:
+            errors.append(f"{attempt.channel} to {attempt.destination}: {attempt.error_message}")
+
+    logger.info(
+        f"Fanned out alarm {alarm.id} to {len(attempts)} routes: "
+        + ', '.join(f"{a.channel}:{a.status}:{a.latency_ms}ms" for a in attempts)
+    )
+    return accepted or {'status': 'error', 'error': '; '.join(errors) or 'Every route was cancelled'}
@@ -0,0 +1,105 @@
+from django.core.management.base import BaseCommand
+from core.redis_client import get_redis
+from alarms.queues import DELIVERY_QUEUES, URGENT, notification_queue
+import json
+import threading
+import time
+
+KEY = 'benchmark:queues:{queue}'
+
+
+class Command(BaseCommand):
+    help = 'Measures how long real alarms wait in the queue behind a backlog of test alarms and retries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backlog', type=int, default=200, help='Test alarms and retries queued before the run')
+        parser.add_argument('--real', type=int, default=20, help='Real alarms arriving during the run')
+        parser.add_argument('--interval', type=float, default=0.05, help='Seconds between real alarms')
+        parser.add_argument('--send-ms', type=float, default=50, help='Simulated provider round trip per send')
+        parser.add_argument('--concurrency', type=int, default=32, help='Threads of the delivery worker')
+        parser.add_argument('--urgent-concurrency', type=int, default=16, help='Threads of the urgent worker')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'profile':<10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'backlog done':>14}")
+        for profile in ('baseline', 'tuned'):
+            result = self._run(profile == 'tuned', options)
+            self.stdout.write(
+                f"{profile:<10}{result['p50']:>10.1f}{result['p99']:>10.1f}{result['max']:>10.1f}"
+                f"{result['backlog_done']:>14}"
+            )
+
+    def _queue(self, tuned, is_test=False, situation_type=None, retry=False):
+        return notification_queue(is_test, situation_type, retry) if tuned else 'alarms'
+
+    def _push(self, client, queue, kind):
+        # LPUSH/BRPOP, as the Redis transport does
+        client.lpush(KEY.format(queue=queue), json.dumps({'kind': kind, 'queued_at': time.time()}))
+
+    def _run(self, tuned, options):
+        """
+        Baseline: one alarms queue and one worker process, as before.
+        Tuned: the priority queues, an urgent thread-pool worker and a delivery
+        thread-pool worker polling the alarm queues in priority order.
+        """
+        client = get_redis()
+        keys = [KEY.format(queue=queue) for queue in DELIVERY_QUEUES]
+        client.delete(*keys)
+
+        for i in range(options['backlog']):
+            if i % 2:
+                self._push(client, self._queue(tuned, is_test=True), 'backlog')
+            else:
+                self._push(client, self._queue(tuned, retry=True), 'backlog')
+
+        if tuned:
+            pools = [([URGENT], options['urgent_concurrency']), (list(DELIVERY_QUEUES), options['concurrency'])]
+        else:
+            pools = [(['alarms'], 1)]
+
+        lock = threading.Lock()
+        stats = {'latencies': [], 'backlog_done': 0}
+        done = threading.Event()
+        send_seconds = options['send_ms'] / 1000
+
+        def worker(queues):
+            worker_client = get_redis()
+            worker_keys = [KEY.format(queue=queue) for queue in queues]
+            while not done.is_set():
+                item = worker_client.brpop(worker_keys, timeout=1)
+                if item is None:
+                    continue
+                message = json.loads(item[1])
+                waited = time.time() - message['queued_at']
+                time.sleep(send_seconds)
+                with lock:
+                    if message['kind'] == 'real':
+                        stats['latencies'].append(waited)
+                        if len(stats['latencies']) == options['real']:
+                            done.set()
+                    else:
+                        stats['backlog_done'] += 1
+
+        threads = [
+            threading.Thread(target=worker, args=(queues,), daemon=True)
+            for queues, concurrency in pools for _ in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+
+        situations = ('INJURED', 'LOST', 'CONTACT')
+        for i in range(options['real']):
+            self._push(client, self._queue(tuned, situation_type=situations[i % len(situations)]), 'real')
+            time.sleep(options['interval'])
+
+        done.wait()
+        for thread in threads:
+            thread.join()
+        client.delete(*keys)
+
+        latencies = sorted(latency * 1000 for latency in stats['latencies'])
+        return {
+            'p50': latencies[len(latencies) // 2],
+            'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+            'max': latencies[-1],
+            'backlog_done': stats['backlog_done'],
+        }
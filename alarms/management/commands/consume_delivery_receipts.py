@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from alarms.receipts import consume
+import logging
+import socket
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Applies queued Twilio and WhatsApp delivery receipts to alarms in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'DELIVERY_RECEIPT_BATCH_SIZE', 200),
+                            help='Receipts applied per batch')
+        parser.add_argument('--block', type=float, default=1.0,
+                            help='Seconds to wait for new receipts before reading again')
+        parser.add_argument('--consumer', default=f'{socket.gethostname()}-{os.getpid()}',
+                            help='Consumer name within the receipt consumer group')
+        parser.add_argument('--once', action='store_true',
+                            help='Apply the queued receipts once and exit')
+
+    def handle(self, *args, **options):
+        consumer = options['consumer']
+        if options['once']:
+            total = 0
+            while count := consume(consumer, options['batch_size']):
+                total += count
+            self.stdout.write(self.style.SUCCESS(f'Applied {total} delivery receipts'))
+            return
+
+        self.stdout.write(f'Delivery receipt consumer {consumer} started')
+        block_ms = int(options['block'] * 1000)
+        while True:
+            try:
+                count = consume(consumer, options['batch_size'], block=block_ms)
+                if count:
+                    logger.info(f"Applied {count} delivery receipts")
+            except KeyboardInterrupt:
+                break
+            except Exception as e:
+                logger.error(f"Delivery receipt consumer error: {str(e)}")
+                time.sleep(options['block'])
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from alarms.rollups import rebuild_rollups, reconcile_recent
+
+class Command(BaseCommand):
+    help = 'Rebuilds the alarm statistics rollup tables from the alarm history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Only rebuild the last N days (default: all history)')
+
+    def handle(self, *args, **options):
+        if options['days'] is None:
+            total = rebuild_rollups()
+        else:
+            total = reconcile_recent(options['days'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rollups for {total} alarms'))
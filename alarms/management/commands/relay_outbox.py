@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from alarms.outbox import relay_pending, wait_for_wakeup
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Relays alarm notifications from the transactional outbox to Celery'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'NOTIFICATION_OUTBOX_BATCH_SIZE', 100),
+                            help='Outbox entries published per batch')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to wait for a wakeup before polling again')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the outbox once and exit')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            count = relay_pending(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Relayed {count} outbox entries'))
+            return
+
+        self.stdout.write('Outbox relay started')
+        while True:
+            try:
+                count = relay_pending(options['batch_size'])
+                if count:
+                    logger.info(f"Relayed {count} outbox entries")
+                    continue
+                wait_for_wakeup(options['interval'])
+            except KeyboardInterrupt:
+                break
+            except Exception as e:
+                logger.error(f"Outbox relay error: {str(e)}")
+                wait_for_wakeup(options['interval'])
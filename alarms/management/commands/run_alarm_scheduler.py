@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from alarms.scheduler import dispatch_pending, wait_for_due
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Publishes alarm notification retries and escalations to Celery at their due time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'ALARM_SCHEDULER_BATCH_SIZE', 100),
+                            help='Due jobs published per batch')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Longest wait for the next due job or a wakeup, in seconds')
+        parser.add_argument('--once', action='store_true',
+                            help='Publish the jobs that are due now and exit')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            count = dispatch_pending(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Dispatched {count} scheduled alarm jobs'))
+            return
+
+        self.stdout.write('Alarm scheduler started')
+        while True:
+            try:
+                count = dispatch_pending(options['batch_size'])
+                if count:
+                    logger.info(f"Dispatched {count} scheduled alarm jobs")
+                wait_for_due(options['interval'])
+            except KeyboardInterrupt:
+                break
+            except Exception as e:
+                logger.error(f"Alarm scheduler error: {str(e)}")
+                wait_for_due(options['interval'])
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.2 on 2026-10-18 00:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("alarms", "0010_remove_alarm_issue_type_alarm_ip_address_and_more"),
+        ("subjects", "0007_delete_alarm"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="alarm",
+            index=models.Index(
+                fields=["notification_status", "timestamp", "id"],
+                name="alarms_status_sweep_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.0.2 on 2026-10-18 00:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("alarms", "0011_alarm_status_sweep_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NotificationOutbox",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("task_name", models.CharField(max_length=100)),
+                ("task_kwargs", models.JSONField(default=dict)),
+                ("dedup_key", models.CharField(max_length=100, unique=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("dispatched_at", models.DateTimeField(blank=True, null=True)),
+                ("relay_attempts", models.IntegerField(default=0)),
+                ("last_error", models.TextField(blank=True, null=True)),
+                (
+                    "alarm",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="outbox_entries",
+                        to="alarms.alarm",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Notification Outbox Entry",
+                "verbose_name_plural": "Notification Outbox",
+                "ordering": ["id"],
+                "indexes": [
+                    models.Index(
+                        fields=["dispatched_at", "id"], name="outbox_pending_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,162 @@
+# Generated by Django 5.0.2 on 2026-10-18 00:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("alarms", "0013_alarm_export"),
+        ("custodians", "0006_alter_custodian_verification_code_timestamp"),
+        ("subjects", "0007_delete_alarm"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AlarmHourlyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "situation_type",
+                    models.CharField(blank=True, default="", max_length=20),
+                ),
+                (
+                    "notification_status",
+                    models.CharField(
+                        choices=[
+                            ("PENDING", "Pending"),
+                            ("PROCESSING", "Processing"),
+                            ("ACCEPTED", "Accepted"),
+                            ("SENT", "Sent"),
+                            ("DELIVERED", "Delivered"),
+                            ("FAILED", "Failed"),
+                            ("ERROR", "Error"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("count", models.IntegerField(default=0)),
+                ("hour", models.DateTimeField()),
+                (
+                    "custodian",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="custodians.custodian",
+                    ),
+                ),
+                (
+                    "subject",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="subjects.subject",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["hour"],
+            },
+        ),
+        migrations.CreateModel(
+            name="AlarmDailyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "situation_type",
+                    models.CharField(blank=True, default="", max_length=20),
+                ),
+                (
+                    "notification_status",
+                    models.CharField(
+                        choices=[
+                            ("PENDING", "Pending"),
+                            ("PROCESSING", "Processing"),
+                            ("ACCEPTED", "Accepted"),
+                            ("SENT", "Sent"),
+                            ("DELIVERED", "Delivered"),
+                            ("FAILED", "Failed"),
+                            ("ERROR", "Error"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("count", models.IntegerField(default=0)),
+                ("day", models.DateField()),
+                ("last_alarm", models.DateTimeField(blank=True, null=True)),
+                (
+                    "custodian",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="custodians.custodian",
+                    ),
+                ),
+                (
+                    "subject",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="subjects.subject",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["day"],
+                "indexes": [
+                    models.Index(
+                        fields=["custodian", "day"], name="alarm_daily_custodian_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="alarmdailyrollup",
+            constraint=models.UniqueConstraint(
+                fields=(
+                    "day",
+                    "custodian",
+                    "subject",
+                    "situation_type",
+                    "notification_status",
+                ),
+                name="alarm_daily_rollup_key",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="alarmhourlyrollup",
+            index=models.Index(
+                fields=["custodian", "hour"], name="alarm_hourly_custodian_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="alarmhourlyrollup",
+            constraint=models.UniqueConstraint(
+                fields=(
+                    "hour",
+                    "custodian",
+                    "subject",
+                    "situation_type",
+                    "notification_status",
+                ),
+                name="alarm_hourly_rollup_key",
+            ),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.0.2 on 2026-10-18 00:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("alarms", "0014_alarm_rollups"),
+        ("subjects", "0008_qr_regeneration_job"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="alarm",
+            index=models.Index(fields=["message_sid"], name="alarms_message_sid_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="alarm",
+            index=models.Index(
+                fields=["whatsapp_message_id"], name="alarms_whatsapp_msg_id_idx"
+            ),
+        ),
+    ]
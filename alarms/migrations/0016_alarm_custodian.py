@@ -0,0 +1,92 @@
+# Generated by Django 5.0.2 on 2026-10-18 00:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+BATCH_SIZE = 5000
+
+
+def _backfill(model, owner_query, owner_field):
+    """Copy the owner's custodian into model rows in id ranges, to keep each write transaction short."""
+    last_id = model.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    custodian = Subquery(owner_query.filter(id=OuterRef(owner_field)).values('custodian_id')[:1])
+    for start in range(0, last_id, BATCH_SIZE):
+        model.objects.filter(id__gt=start, id__lte=start + BATCH_SIZE, custodian__isnull=True).update(
+            custodian_id=custodian
+        )
+
+
+def backfill_custodians(apps, schema_editor):
+    Alarm = apps.get_model('alarms', 'Alarm')
+    NotificationAttempt = apps.get_model('alarms', 'NotificationAttempt')
+    Subject = apps.get_model('subjects', 'Subject')
+    _backfill(Alarm, Subject.objects.all(), 'subject_id')
+    _backfill(NotificationAttempt, Alarm.objects.all(), 'alarm_id')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("alarms", "0015_alarm_message_id_indexes"),
+        ("custodians", "0006_alter_custodian_verification_code_timestamp"),
+        ("subjects", "0008_qr_regeneration_job"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="alarm",
+            name="custodian",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="alarms",
+                to="custodians.custodian",
+            ),
+        ),
+        migrations.AddField(
+            model_name="notificationattempt",
+            name="custodian",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="custodians.custodian",
+            ),
+        ),
+        migrations.RunPython(backfill_custodians, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="alarm",
+            index=models.Index(
+                fields=["custodian", "timestamp"], name="alarms_custodian_ts_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="alarm",
+            index=models.Index(
+                fields=["custodian", "notification_status", "timestamp"],
+                name="alarms_custodian_status_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="alarm",
+            index=models.Index(
+                fields=["custodian", "situation_type", "timestamp"],
+                name="alarms_custodian_sit_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="notificationattempt",
+            index=models.Index(
+                fields=["custodian", "created_at"], name="notif_custodian_created_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.2 on 2026-10-18 00:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("alarms", "0016_alarm_custodian"),
+        ("custodians", "0006_alter_custodian_verification_code_timestamp"),
+        ("subjects", "0008_qr_regeneration_job"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="alarm",
+            index=models.Index(
+                fields=["custodian", "updated_at", "id"],
+                name="alarms_custodian_updated_idx",
+            ),
+        ),
+    ]
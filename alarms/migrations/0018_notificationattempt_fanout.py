@@ -0,0 +1,113 @@
+# Generated by Django 5.0.2 on 2026-10-18 00:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("alarms", "0017_alarm_custodian_updated_index"),
+        ("custodians", "0006_alter_custodian_verification_code_timestamp"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notificationattempt",
+            name="delivered_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="notificationattempt",
+            name="destination",
+            field=models.CharField(blank=True, default="", max_length=255),
+        ),
+        migrations.AddField(
+            model_name="notificationattempt",
+            name="latency_ms",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="notificationattempt",
+            name="message_id",
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name="notificationattempt",
+            name="priority",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="alarm",
+            name="notification_status",
+            field=models.CharField(
+                choices=[
+                    ("PENDING", "Pending"),
+                    ("PROCESSING", "Processing"),
+                    ("ACCEPTED", "Accepted"),
+                    ("SENT", "Sent"),
+                    ("DELIVERED", "Delivered"),
+                    ("FAILED", "Failed"),
+                    ("ERROR", "Error"),
+                    ("CANCELLED", "Cancelled"),
+                ],
+                default="PENDING",
+                max_length=20,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="alarmdailyrollup",
+            name="notification_status",
+            field=models.CharField(
+                choices=[
+                    ("PENDING", "Pending"),
+                    ("PROCESSING", "Processing"),
+                    ("ACCEPTED", "Accepted"),
+                    ("SENT", "Sent"),
+                    ("DELIVERED", "Delivered"),
+                    ("FAILED", "Failed"),
+                    ("ERROR", "Error"),
+                    ("CANCELLED", "Cancelled"),
+                ],
+                max_length=20,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="alarmhourlyrollup",
+            name="notification_status",
+            field=models.CharField(
+                choices=[
+                    ("PENDING", "Pending"),
+                    ("PROCESSING", "Processing"),
+                    ("ACCEPTED", "Accepted"),
+                    ("SENT", "Sent"),
+                    ("DELIVERED", "Delivered"),
+                    ("FAILED", "Failed"),
+                    ("ERROR", "Error"),
+                    ("CANCELLED", "Cancelled"),
+                ],
+                max_length=20,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="notificationattempt",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("PENDING", "Pending"),
+                    ("PROCESSING", "Processing"),
+                    ("ACCEPTED", "Accepted"),
+                    ("SENT", "Sent"),
+                    ("DELIVERED", "Delivered"),
+                    ("FAILED", "Failed"),
+                    ("ERROR", "Error"),
+                    ("CANCELLED", "Cancelled"),
+                ],
+                default="PENDING",
+                max_length=20,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="notificationattempt",
+            index=models.Index(fields=["message_id"], name="notif_message_id_idx"),
+        ),
+    ]
@@ -1,7 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from core.conditional import record_change
 
 class NotificationStatus:
     PENDING = 'PENDING'
@@ -11,6 +12,7 @@ class NotificationStatus:
     DELIVERED = 'DELIVERED'  # Message delivered to device
     FAILED = 'FAILED'
     ERROR = 'ERROR'
+    CANCELLED = 'CANCELLED'  # Attempt suppressed because another one was delivered first
 
     CHOICES = [
         (PENDING, 'Pending'),
@@ -20,6 +22,7 @@ class NotificationStatus:
         (DELIVERED, 'Delivered'),
         (FAILED, 'Failed'),
         (ERROR, 'Error'),
+        (CANCELLED, 'Cancelled'),
     ]
 
 class NotificationChannel:
@@ -42,6 +45,11 @@ class Alarm(models.Model):
     ]
 
     subject = models.ForeignKey('subjects.Subject', on_delete=models.CASCADE, related_name='alarms')
+    # Owner of the subject, copied so custodian-scoped queries skip the subject join
+    custodian = models.ForeignKey(
+        'custodians.Custodian', on_delete=models.CASCADE, null=True, blank=True, editable=False,
+        related_name='alarms', db_index=False
+    )
     qr_code = models.ForeignKey('subjects.SubjectQR', on_delete=models.SET_NULL, null=True, related_name='alarms')
     timestamp = models.DateTimeField(auto_now_add=True)
     location = models.CharField(max_length=255, default='')
@@ -87,14 +95,47 @@ class Alarm(models.Model):
         indexes = [
             models.Index(fields=['timestamp'], name='alarms_timestamp_idx'),
             models.Index(fields=['notification_status'], name='alarms_status_idx'),
+            models.Index(fields=['notification_status', 'timestamp', 'id'], name='alarms_status_sweep_idx'),
             models.Index(fields=['subject', 'timestamp'], name='alarms_subject_timestamp_idx'),
             models.Index(fields=['resolved_at'], name='alarms_resolved_at_idx'),
             models.Index(fields=['situation_type'], name='alarms_situation_type_idx'),
+            models.Index(fields=['message_sid'], name='alarms_message_sid_idx'),
+            models.Index(fields=['whatsapp_message_id'], name='alarms_whatsapp_msg_id_idx'),
+            models.Index(fields=['custodian', 'timestamp'], name='alarms_custodian_ts_idx'),
+            models.Index(fields=['custodian', 'notification_status', 'timestamp'], name='alarms_custodian_status_idx'),
+            models.Index(fields=['custodian', 'situation_type', 'timestamp'], name='alarms_custodian_sit_idx'),
+            models.Index(fields=['custodian', 'updated_at', 'id'], name='alarms_custodian_updated_idx'),
         ]
 
     def __str__(self):
         return f"Alarm for {self.subject.name} at {self.timestamp}"
 
+    ROLLUP_FIELDS = ('subject_id', 'situation_type', 'notification_status', 'timestamp')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.snapshot_rollup_state()
+        return instance
+
+    def snapshot_rollup_state(self):
+        """Remember the fields that place this alarm in a statistics rollup bucket."""
+        if all(field in self.__dict__ for field in self.ROLLUP_FIELDS):
+            self._rollup_state = tuple(self.__dict__[field] for field in self.ROLLUP_FIELDS)
+        else:
+            self._rollup_state = None
+
+    def save(self, *args, **kwargs):
+        """Insert new alarms atomically with their post_save outbox entry."""
+        if self.custodian_id is None and self.subject_id is not None:
+            self.custodian_id = self.subject.custodian_id
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'custodian'}
+        if self._state.adding:
+            with transaction.atomic():
+                return super().save(*args, **kwargs)
+        return super().save(*args, **kwargs)
+
     def resolve(self, notes=""):
         """Mark the alarm as resolved with optional notes."""
         self.resolved_at = timezone.now()
@@ -111,9 +152,20 @@ class NotificationAttempt(models.Model):
         related_name='notification_attempts'
     )
     recipient = models.ForeignKey('custodians.Custodian', on_delete=models.CASCADE)
+    # Owner of the alarm, copied from it for custodian-scoped queries
+    custodian = models.ForeignKey(
+        'custodians.Custodian', on_delete=models.CASCADE, null=True, blank=True, editable=False,
+        related_name='+', db_index=False
+    )
     channel = models.CharField(max_length=20, choices=NotificationChannel.CHOICES)
+    destination = models.CharField(max_length=255, blank=True, default='')
+    # Position in the fan-out routes; lower numbers are preferred
+    priority = models.PositiveSmallIntegerField(default=0)
     status = models.CharField(max_length=20, choices=NotificationStatus.CHOICES, default=NotificationStatus.PENDING)
+    message_id = models.CharField(max_length=100, null=True, blank=True)
     sent_at = models.DateTimeField(null=True, blank=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    latency_ms = models.IntegerField(null=True, blank=True)  # Duration of the provider call
     error_message = models.TextField(null=True, blank=True)
     retry_count = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -124,6 +176,8 @@ class NotificationAttempt(models.Model):
             models.Index(fields=['alarm', 'channel'], name='notif_alarm_channel_idx'),
             models.Index(fields=['status'], name='notif_status_idx'),
             models.Index(fields=['created_at'], name='notif_created_at_idx'),
+            models.Index(fields=['custodian', 'created_at'], name='notif_custodian_created_idx'),
+            models.Index(fields=['message_id'], name='notif_message_id_idx'),
         ]
     
     def mark_sent(self):
@@ -132,10 +186,9 @@ class NotificationAttempt(models.Model):
         self.sent_at = timezone.now()
         self.save(update_fields=['status', 'sent_at'])
         
-        # Update alarm status
-        self.alarm.notification_sent = True
-        self.alarm.notification_status = NotificationStatus.SENT
-        self.alarm.save(update_fields=['notification_sent', 'notification_status'])
+        # Update alarm status, unless it has already moved past SENT
+        from .transitions import transition
+        transition(self.alarm, NotificationStatus.SENT, notification_sent=True)
     
     def mark_failed(self, error_message):
         """Mark the notification attempt as failed."""
@@ -149,17 +202,136 @@ class NotificationAttempt(models.Model):
         
         # Update alarm status if max retries reached
         if self.retry_count >= self.MAX_RETRIES:
-            self.alarm.notification_status = NotificationStatus.FAILED
-            self.alarm.save()
+            from .transitions import transition
+            transition(self.alarm, NotificationStatus.FAILED, notification_sent=False)
 
     def save(self, *args, **kwargs):
         """Override save to update alarm's notification attempt count."""
         is_new = self._state.adding
+        if self.custodian_id is None:
+            self.custodian_id = self.alarm.custodian_id
         super().save(*args, **kwargs)
         
         if is_new:
-            # Update alarm's notification attempt count
-            self.alarm.notification_attempt_count = (
-                NotificationAttempt.objects.filter(alarm=self.alarm).count()
+            # Count the attempt on the alarm without overwriting concurrent changes
+            Alarm.objects.filter(id=self.alarm_id).update(
+                notification_attempt_count=models.F('notification_attempt_count') + 1,
+                updated_at=timezone.now()
             )
-            self.alarm.save()
+            self.alarm.notification_attempt_count += 1
+            record_change(self.custodian_id)
+
+class NotificationOutbox(models.Model):
+    """
+    Notification dispatches recorded in the same transaction as their alarm.
+    The outbox relay publishes undispatched rows to Celery in batches.
+    """
+    alarm = models.ForeignKey(Alarm, on_delete=models.CASCADE, related_name='outbox_entries')
+    task_name = models.CharField(max_length=100)
+    task_kwargs = models.JSONField(default=dict)
+    dedup_key = models.CharField(max_length=100, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    relay_attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = 'Notification Outbox Entry'
+        verbose_name_plural = 'Notification Outbox'
+        indexes = [
+            models.Index(fields=['dispatched_at', 'id'], name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.dedup_key} ({'dispatched' if self.dispatched_at else 'pending'})"
+
+
+class AlarmExport(models.Model):
+    """Export file built in the background for download once ready."""
+    STATUS_PENDING = 'PENDING'
+    STATUS_RUNNING = 'RUNNING'
+    STATUS_READY = 'READY'
+    STATUS_FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_READY, 'Ready'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    FORMAT_PDF = 'pdf'
+    FORMAT_XLSX = 'xlsx'
+    FORMAT_CHOICES = [
+        (FORMAT_PDF, 'PDF'),
+        (FORMAT_XLSX, 'Excel'),
+    ]
+
+    requested_by = models.ForeignKey('auth.User', on_delete=models.CASCADE, related_name='alarm_exports')
+    export_format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    row_count = models.IntegerField(default=0)
+    file = models.FileField(upload_to='exports/', blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.get_export_format_display()} export for {self.requested_by} ({self.status})"
+
+    @property
+    def is_ready(self):
+        return self.status == self.STATUS_READY and bool(self.file)
+
+class AlarmRollup(models.Model):
+    """Alarm counts for one bucket, maintained incrementally by alarms.rollups."""
+    custodian = models.ForeignKey('custodians.Custodian', on_delete=models.CASCADE, related_name='+')
+    subject = models.ForeignKey('subjects.Subject', on_delete=models.CASCADE, related_name='+')
+    situation_type = models.CharField(max_length=20, blank=True, default='')
+    notification_status = models.CharField(max_length=20, choices=NotificationStatus.CHOICES)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+class AlarmDailyRollup(AlarmRollup):
+    """Alarm counts per local day."""
+    day = models.DateField()
+    last_alarm = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['day']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'custodian', 'subject', 'situation_type', 'notification_status'],
+                name='alarm_daily_rollup_key'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['custodian', 'day'], name='alarm_daily_custodian_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.subject_id} {self.notification_status}: {self.count}"
+
+class AlarmHourlyRollup(AlarmRollup):
+    """Alarm counts per hour."""
+    hour = models.DateTimeField()
+
+    class Meta:
+        ordering = ['hour']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['hour', 'custodian', 'subject', 'situation_type', 'notification_status'],
+                name='alarm_hourly_rollup_key'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['custodian', 'hour'], name='alarm_hourly_custodian_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.hour} {self.subject_id} {self.notification_status}: {self.count}"
@@ -0,0 +1,124 @@
+"""
+Transactional outbox for alarm notifications.
+
+A NotificationOutbox row is written in the same transaction as each new alarm.
+The relay (``manage.py relay_outbox``, with the ``relay_notification_outbox``
+beat task as a fallback) claims undispatched rows in batches and publishes
+them to Celery, so every alarm is dispatched exactly once no matter how many
+code paths create it.
+"""
+
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.celery import app
+from core.redis_client import get_redis
+from .models import NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_TASK = 'alarms.tasks.send_whatsapp_notification'
+WAKEUP_KEY = 'alarms:outbox:wakeup'
+PUBLISHED_KEY = 'alarms:outbox:published:{dedup_key}'
+PUBLISHED_TTL = 60 * 60 * 24
+
+
+def notify_dedup_key(alarm_id):
+    """Return the outbox dedup key, and Celery task id, of an alarm's first notification."""
+    return f"alarm:{alarm_id}:notify"
+
+
+def enqueue_alarm_notification(alarm):
+    """Record the notification for a new alarm in the current transaction."""
+    entry, created = NotificationOutbox.objects.get_or_create(
+        dedup_key=notify_dedup_key(alarm.id),
+        defaults={
+            'alarm': alarm,
+            'task_name': NOTIFY_TASK,
+            # situation_type only routes the task to its priority queue (alarms.queues)
+            'task_kwargs': {'alarm_id': alarm.id, 'is_test': alarm.is_test, 'situation_type': alarm.situation_type},
+        }
+    )
+    if created:
+        transaction.on_commit(wake_relay)
+    return entry
+
+
+def wake_relay():
+    """Wake the relay so it drains the outbox without waiting for its next poll."""
+    try:
+        get_redis().rpush(WAKEUP_KEY, 1)
+    except Exception as e:
+        logger.warning(f"Could not wake outbox relay: {str(e)}")
+
+
+def wait_for_wakeup(timeout):
+    """Block until an alarm is enqueued or the timeout expires."""
+    try:
+        client = get_redis()
+        if client.blpop([WAKEUP_KEY], timeout=timeout):
+            # Collapse a burst of wakeups into one drain
+            client.delete(WAKEUP_KEY)
+    except Exception as e:
+        logger.warning(f"Outbox wakeup unavailable, polling instead: {str(e)}")
+        time.sleep(timeout)
+
+
+def _publish(entry):
+    """
+    Publish an outbox entry to Celery.
+    The dedup key is recorded in Redis only once the broker has the task, so a
+    relay that crashes after publishing but before marking the row skips it
+    next time. A crash between the two publishes the task again under the same
+    task id, which send_whatsapp_notification ignores once the alarm has left
+    PENDING; a notification is never dropped.
+    """
+    client = get_redis()
+    published_key = PUBLISHED_KEY.format(dedup_key=entry.dedup_key)
+    if client.exists(published_key):
+        logger.info(f"Outbox entry {entry.dedup_key} was already published")
+        return
+    app.send_task(entry.task_name, kwargs=entry.task_kwargs, task_id=entry.dedup_key)
+    client.set(published_key, 1, ex=PUBLISHED_TTL)
+
+
+def relay_batch(batch_size=None):
+    """Publish one batch of undispatched outbox entries and return its size."""
+    batch_size = batch_size or getattr(settings, 'NOTIFICATION_OUTBOX_BATCH_SIZE', 100)
+    with transaction.atomic():
+        entries = list(
+            NotificationOutbox.objects.filter(dispatched_at__isnull=True)
+            .select_for_update(skip_locked=True)
+            .order_by('id')[:batch_size]
+        )
+        if not entries:
+            return 0
+
+        now = timezone.now()
+        for entry in entries:
+            try:
+                _publish(entry)
+                entry.dispatched_at = now
+                entry.last_error = None
+            except Exception as e:
+                entry.relay_attempts += 1
+                entry.last_error = str(e)
+                logger.error(f"Failed to relay outbox entry {entry.dedup_key}: {str(e)}")
+
+        NotificationOutbox.objects.bulk_update(entries, ['dispatched_at', 'relay_attempts', 'last_error'])
+    return len(entries)
+
+
+def relay_pending(batch_size=None):
+    """Drain the outbox batch by batch and return the number of entries handled."""
+    batch_size = batch_size or getattr(settings, 'NOTIFICATION_OUTBOX_BATCH_SIZE', 100)
+    total = 0
+    while True:
+        count = relay_batch(batch_size)
+        total += count
+        if count < batch_size:
+            return total
@@ -0,0 +1,63 @@
+"""
+Priority queues for alarm work.
+
+First sends of real alarms go to ``alarms_urgent`` when the subject is
+injured or lost (or no situation was given) and to ``alarms`` otherwise;
+scheduled retries and escalations go to ``alarms_retry``, test alarms to
+``alarms_test`` and housekeeping to ``maintenance``. One worker consumes only
+``alarms_urgent`` and another drains every alarm queue in strict priority
+order (see supervisor/celery.conf), so a backlog of test alarms, retries or
+exports never sits in front of a real emergency.
+
+route_task() is the Celery router; publishers that know more than the task
+arguments (the alarm scheduler, manual retries) pass ``queue=`` themselves.
+"""
+
+from django.conf import settings
+
+URGENT = 'alarms_urgent'
+ALARMS = 'alarms'
+RETRY = 'alarms_retry'
+TEST = 'alarms_test'
+MAINTENANCE = 'maintenance'
+
+# In the order a delivery worker consumes them
+DELIVERY_QUEUES = (URGENT, ALARMS, RETRY, TEST)
+
+NOTIFY_TASK = 'alarms.tasks.send_whatsapp_notification'
+
+RETRY_TASKS = {
+    'alarms.tasks.escalate_undelivered_alarm',
+    'alarms.tasks.retry_failed_notifications',
+    'alarms.tasks.process_pending_alarms',
+}
+
+MAINTENANCE_TASKS = {
+    'alarms.tasks.build_alarm_export',
+    'alarms.tasks.cleanup_old_alarm_exports',
+    'alarms.tasks.cleanup_old_alarms',
+    'alarms.tasks.reconcile_alarm_rollups',
+}
+
+
+def notification_queue(is_test, situation_type=None, retry=False):
+    """Return the queue for a notification of an alarm."""
+    if is_test:
+        return TEST
+    if retry:
+        return RETRY
+    if not situation_type or situation_type in getattr(settings, 'ALARM_URGENT_SITUATIONS', ('INJURED', 'LOST')):
+        return URGENT
+    return ALARMS
+
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """Celery router: pick an alarm task's queue from its name and arguments."""
+    if name == NOTIFY_TASK:
+        kwargs = kwargs or {}
+        return {'queue': notification_queue(kwargs.get('is_test'), kwargs.get('situation_type'))}
+    if name in RETRY_TASKS:
+        return {'queue': RETRY}
+    if name in MAINTENANCE_TASKS:
+        return {'queue': MAINTENANCE}
+    return None
@@ -0,0 +1,336 @@
+"""
+Batched ingestion of message delivery receipts.
+
+The Twilio and Meta webhooks only validate a callback, normalize it into
+receipts (provider, message id, status, error) and append them to a Redis
+stream, so a storm of callbacks costs the web workers one XADD each. The
+consumer (``manage.py consume_delivery_receipts``, with the
+``apply_delivery_receipts`` beat task as a fallback) reads the stream through
+a consumer group and applies each batch with one query over the indexed
+message id columns and conditional bulk updates that follow the notification
+state machine (alarms.transitions), so late or repeated receipts never undo a
+newer status. Receipts for fan-out attempts (alarms.fanout) update the attempt
+and move the alarm to the best status any route of its latest round reached.
+
+A receipt can beat the send result it belongs to into the database. Receipts
+that match no attempt or alarm are therefore left unacknowledged, reclaimed
+and applied again after DELIVERY_RECEIPT_CLAIM_IDLE_MS, and only dropped once
+they are DELIVERY_RECEIPT_MAX_AGE seconds old.
+"""
+
+import logging
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from redis.exceptions import ResponseError
+
+from core.redis_client import get_redis
+from .fanout import mark_delivered
+from .models import Alarm, NotificationAttempt, NotificationStatus
+from .scheduler import schedule_followups
+from .transitions import can_transition, transition_many
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = 'alarms:receipts'
+GROUP = 'receipt-appliers'
+
+PROVIDER_TWILIO = 'twilio'
+PROVIDER_META = 'meta'
+
+# Provider message id column per provider
+MESSAGE_ID_FIELDS = {
+    PROVIDER_TWILIO: 'message_sid',
+    PROVIDER_META: 'whatsapp_message_id',
+}
+
+TWILIO_STATUS_MAP = {
+    'QUEUED': NotificationStatus.ACCEPTED,
+    'ACCEPTED': NotificationStatus.ACCEPTED,
+    'SENDING': NotificationStatus.ACCEPTED,
+    'SENT': NotificationStatus.SENT,
+    'DELIVERED': NotificationStatus.DELIVERED,
+    'READ': NotificationStatus.DELIVERED,
+    'UNDELIVERED': NotificationStatus.FAILED,
+    'FAILED': NotificationStatus.ERROR,
+}
+
+META_STATUS_MAP = {
+    'SENT': NotificationStatus.SENT,
+    'DELIVERED': NotificationStatus.DELIVERED,
+    'READ': NotificationStatus.DELIVERED,
+    'FAILED': NotificationStatus.FAILED,
+    'ERROR': NotificationStatus.FAILED,
+}
+
+UPDATE_FIELDS = ['notification_status', 'notification_sent', 'notification_error']
+ATTEMPT_RECEIPT_FIELDS = ['status', 'delivered_at', 'error_message']
+
+
+def batch_size():
+    return getattr(settings, 'DELIVERY_RECEIPT_BATCH_SIZE', 200)
+
+
+def _receipt(provider, message_id, status, error=''):
+    return {'provider': provider, 'message_id': message_id, 'status': status, 'error': error or ''}
+
+
+def parse_twilio(data):
+    """
+    Return the receipts in a Twilio status callback.
+    Raises ValueError if it has no MessageSid or MessageStatus.
+    """
+    message_sid = data.get('MessageSid')
+    message_status = (data.get('MessageStatus') or '').upper()
+    if not message_sid or not message_status:
+        raise ValueError("Twilio callback without MessageSid or MessageStatus")
+
+    status = TWILIO_STATUS_MAP.get(message_status)
+    if status is None:
+        logger.warning(f"Ignoring Twilio status {message_status} for {message_sid}")
+        return []
+
+    error = ''
+    if data.get('ErrorCode') or data.get('ErrorMessage'):
+        error = f"Code: {data.get('ErrorCode')}, Message: {data.get('ErrorMessage')}"
+    return [_receipt(PROVIDER_TWILIO, message_sid, status, error)]
+
+
+def parse_meta(payload):
+    """
+    Return the receipts in a WhatsApp Business webhook payload: every entry of
+    every change's statuses array (and status-carrying messages).
+    Raises ValueError if the payload is not a WhatsApp Business event.
+    """
+    if not isinstance(payload, dict) or payload.get('object') != 'whatsapp_business_account':
+        raise ValueError("Not a WhatsApp Business webhook payload")
+
+    receipts = []
+    for entry in payload.get('entry') or []:
+        for change in entry.get('changes') or []:
+            value = change.get('value') or {}
+            for item in (value.get('statuses') or []) + (value.get('messages') or []):
+                message_id = item.get('id')
+                status = META_STATUS_MAP.get((item.get('status') or '').upper())
+                if not message_id or status is None:
+                    continue
+                errors = item.get('errors') or ([item['error']] if item.get('error') else [])
+                error = '; '.join(e.get('message') or e.get('title') or 'Unknown error' for e in errors)
+                receipts.append(_receipt(PROVIDER_META, message_id, status, error))
+    return receipts
+
+
+def enqueue_receipts(receipts):
+    """Append receipts to the stream, applying them directly if Redis is unavailable."""
+    if not receipts:
+        return
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for receipt in receipts:
+            pipe.xadd(STREAM_KEY, receipt, maxlen=getattr(settings, 'DELIVERY_RECEIPT_STREAM_MAXLEN', 100000))
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Receipt stream unavailable, applying {len(receipts)} receipts directly: {str(e)}")
+        apply_receipts(receipts)
+
+
+def _set_status(alarm, status, error=''):
+    """Apply a receipt's status to an alarm in memory. Returns False if the state machine forbids it."""
+    if not can_transition(alarm.notification_status, status):
+        return False
+    alarm.notification_status = status
+    if status in (NotificationStatus.SENT, NotificationStatus.DELIVERED):
+        alarm.notification_sent = True
+    elif status in (NotificationStatus.FAILED, NotificationStatus.ERROR):
+        alarm.notification_sent = False
+    if error:
+        alarm.notification_error = error
+    return True
+
+
+def _combined_status(statuses):
+    """
+    The alarm status implied by the statuses of its fan-out attempts: the best
+    outcome any route reached, failed only once no route is left in flight.
+    """
+    for status in (NotificationStatus.DELIVERED, NotificationStatus.SENT):
+        if status in statuses:
+            return status
+    if statuses & {NotificationStatus.PENDING, NotificationStatus.PROCESSING, NotificationStatus.ACCEPTED}:
+        return None
+    return NotificationStatus.FAILED
+
+
+def _apply_attempt_receipts(receipts):
+    """
+    Apply the receipts for fan-out NotificationAttempts.
+    Returns ({alarm id: status the attempts imply}, the receipts for no attempt).
+    """
+    attempts = {
+        attempt.message_id: attempt
+        for attempt in NotificationAttempt.objects.filter(message_id__in={r['message_id'] for r in receipts})
+    }
+    if not attempts:
+        return {}, receipts
+
+    rest = []
+    changed = {}
+    now = timezone.now()
+    for receipt in receipts:
+        attempt = attempts.get(receipt['message_id'])
+        if attempt is None:
+            rest.append(receipt)
+            continue
+        if not can_transition(attempt.status, receipt['status']):
+            continue
+        attempt.status = receipt['status']
+        if attempt.status == NotificationStatus.DELIVERED:
+            attempt.delivered_at = now
+        if receipt['error']:
+            attempt.error_message = receipt['error']
+        changed[attempt.id] = attempt
+    NotificationAttempt.objects.bulk_update(changed.values(), ATTEMPT_RECEIPT_FIELDS)
+
+    # Only the latest fan-out round (retry_count) speaks for the alarm
+    rounds = {}
+    statuses = defaultdict(set)
+    for alarm_id, retry_count, status in NotificationAttempt.objects.filter(
+        alarm_id__in={attempt.alarm_id for attempt in changed.values()}
+    ).values_list('alarm_id', 'retry_count', 'status').order_by('alarm_id', 'retry_count'):
+        if rounds.get(alarm_id) != retry_count:
+            rounds[alarm_id] = retry_count
+            statuses[alarm_id] = set()
+        statuses[alarm_id].add(status)
+    targets = {alarm_id: _combined_status(alarm_statuses) for alarm_id, alarm_statuses in statuses.items()}
+    return {alarm_id: status for alarm_id, status in targets.items() if status}, rest
+
+
+def apply_receipts(receipts, unmatched=None):
+    """
+    Apply a batch of receipts in stream order. Returns the number of alarms
+    updated. Receipts that match no attempt or alarm are appended to the
+    unmatched list if one is given, and only logged otherwise.
+    """
+    count = len(receipts)
+    targets, receipts = _apply_attempt_receipts(receipts)
+
+    ids = {provider: set() for provider in MESSAGE_ID_FIELDS}
+    for receipt in receipts:
+        ids[receipt['provider']].add(receipt['message_id'])
+
+    query = Q(id__in=targets)
+    for provider, message_ids in ids.items():
+        if message_ids:
+            query |= Q(**{f"{MESSAGE_ID_FIELDS[provider]}__in": message_ids})
+    if not targets and not any(ids.values()):
+        return 0
+
+    alarms = Alarm.objects.select_related('subject').filter(query)
+    by_id = {}
+    by_message_id = {}
+    observed = {}
+    for alarm in alarms:
+        by_id[alarm.id] = alarm
+        observed[alarm.id] = alarm.notification_status
+        for provider, field in MESSAGE_ID_FIELDS.items():
+            if getattr(alarm, field):
+                by_message_id[(provider, getattr(alarm, field))] = alarm
+
+    changed = {}
+    for alarm_id, status in targets.items():
+        alarm = by_id.get(alarm_id)
+        if alarm is not None and _set_status(alarm, status):
+            changed[alarm.id] = alarm
+    for receipt in receipts:
+        alarm = by_message_id.get((receipt['provider'], receipt['message_id']))
+        if alarm is None:
+            if unmatched is None:
+                logger.error(f"No alarm found for {receipt['provider']} message {receipt['message_id']}")
+            else:
+                unmatched.append(receipt)
+            continue
+        if _set_status(alarm, receipt['status'], receipt['error']):
+            changed[alarm.id] = alarm
+
+    # One conditional bulk UPDATE per status the alarms were read in
+    groups = defaultdict(list)
+    for alarm in changed.values():
+        groups[observed[alarm.id]].append(alarm)
+    won = 0
+    for status, group in groups.items():
+        updated = transition_many(group, status, UPDATE_FIELDS)
+        won += len(updated)
+        # The first delivery stops routes still waiting out their fan-out head start
+        mark_delivered([alarm.id for alarm in updated if alarm.notification_status == NotificationStatus.DELIVERED])
+        # Messages the provider could not deliver are retried at their next backoff step
+        schedule_followups([
+            alarm for alarm in updated
+            if alarm.notification_status in (NotificationStatus.FAILED, NotificationStatus.ERROR)
+        ])
+
+    if won:
+        logger.info(f"Applied {count} delivery receipts to {won} alarms")
+    return won
+
+
+def _ensure_group(client):
+    try:
+        client.xgroup_create(STREAM_KEY, GROUP, id='0', mkstream=True)
+    except ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+def _decode(fields):
+    return {key.decode(): value.decode() for key, value in fields.items()}
+
+
+def consume(consumer, count=None, block=None):
+    """
+    Read and apply one batch of receipts as a consumer of the group, first
+    reclaiming entries left unacknowledged by a consumer that died.
+    Returns the number of receipts handled.
+    """
+    client = get_redis()
+    _ensure_group(client)
+    count = count or batch_size()
+
+    _, entries, *_ = client.xautoclaim(
+        STREAM_KEY, GROUP, consumer,
+        min_idle_time=getattr(settings, 'DELIVERY_RECEIPT_CLAIM_IDLE_MS', 60000),
+        count=count
+    )
+    if not entries:
+        response = client.xreadgroup(GROUP, consumer, {STREAM_KEY: '>'}, count=count, block=block)
+        entries = response[0][1] if response else []
+    if not entries:
+        return 0
+
+    # Reclaimed entries trimmed from the stream come back without fields
+    decoded = [(entry_id, _decode(fields)) for entry_id, fields in entries if fields]
+    receipts = [receipt for _, receipt in decoded]
+    unmatched = []
+    apply_receipts(receipts, unmatched)
+
+    # Unmatched receipts stay pending until they are reclaimed, unless they are too old to wait for
+    keep = set()
+    oldest = (time.time() - getattr(settings, 'DELIVERY_RECEIPT_MAX_AGE', 600)) * 1000
+    waiting = {id(receipt) for receipt in unmatched}
+    for entry_id, receipt in decoded:
+        if id(receipt) not in waiting:
+            continue
+        # Stream entry ids start with the millisecond they were added
+        if int(entry_id.split(b'-')[0]) >= oldest:
+            keep.add(entry_id)
+        else:
+            logger.error(f"No alarm found for {receipt['provider']} message {receipt['message_id']}, dropping it")
+    if keep:
+        logger.warning(f"Keeping {len(keep)} receipts for unknown messages pending for a later retry")
+
+    entry_ids = [entry_id for entry_id, _ in entries if entry_id not in keep]
+    if entry_ids:
+        client.pipeline().xack(STREAM_KEY, GROUP, *entry_ids).xdel(STREAM_KEY, *entry_ids).execute()
+    return len(receipts)
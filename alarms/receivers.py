@@ -0,0 +1,60 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from subjects.models import Subject
+from .models import Alarm, NotificationAttempt
+from .rollups import RollupDeltas, current_state, move_subject_rollups
+import logging
+
+logger = logging.getLogger(__name__)
+
+@receiver(post_save, sender=Alarm)
+def update_alarm_rollups(sender, instance, created, update_fields=None, **kwargs):
+    """Move the alarm between statistics rollup buckets when it is created or its bucket changes"""
+    if update_fields is not None and not set(update_fields) & {'subject', 'subject_id', 'situation_type', 'notification_status'}:
+        return
+
+    old_state = None if created else getattr(instance, '_rollup_state', None)
+    if not created and old_state is None:
+        # Loaded without its bucket fields; left for reconciliation
+        return
+
+    try:
+        deltas = RollupDeltas()
+        deltas.change(instance, old_state, current_state(instance))
+        deltas.apply()
+    except Exception as e:
+        logger.error(f"Error updating statistics rollups for alarm {instance.id}: {str(e)}")
+    instance.snapshot_rollup_state()
+
+@receiver(post_delete, sender=Alarm)
+def remove_alarm_from_rollups(sender, instance, **kwargs):
+    """Uncount a deleted alarm from its statistics rollup buckets"""
+    try:
+        deltas = RollupDeltas()
+        deltas.change(instance, getattr(instance, '_rollup_state', None) or current_state(instance), None)
+        deltas.apply()
+    except Exception as e:
+        logger.error(f"Error updating statistics rollups for deleted alarm {instance.id}: {str(e)}")
+
+@receiver(post_save, sender=Subject)
+def update_alarm_custodian(sender, instance, created, update_fields=None, **kwargs):
+    """Keep the denormalized custodian of a subject's alarms and rollups in step when the subject changes owner"""
+    if created or (update_fields is not None and not set(update_fields) & {'custodian', 'custodian_id'}):
+        return
+    stored_custodian_id = getattr(instance, '_stored_custodian_id', None)
+    if stored_custodian_id is not None and stored_custodian_id == instance.custodian_id:
+        return
+
+    moved = Alarm.objects.filter(subject=instance).exclude(custodian_id=instance.custodian_id).update(
+        custodian_id=instance.custodian_id, updated_at=timezone.now()
+    )
+    if moved:
+        NotificationAttempt.objects.filter(alarm__subject=instance).exclude(
+            custodian_id=instance.custodian_id
+        ).update(custodian_id=instance.custodian_id)
+        try:
+            move_subject_rollups(instance.id, instance.custodian_id)
+        except Exception as e:
+            logger.error(f"Error moving statistics rollups of subject {instance.id}: {str(e)}")
+        logger.info(f"Moved {moved} alarms of subject {instance.id} to custodian {instance.custodian_id}")
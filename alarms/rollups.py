@@ -0,0 +1,200 @@
+"""
+Incrementally maintained alarm statistics rollups.
+
+Every alarm is counted in one AlarmDailyRollup and one AlarmHourlyRollup row
+keyed by custodian, subject, situation type and notification status. Creating,
+deleting or changing an alarm's bucket adjusts the counters in place (see
+alarms.receivers), and reconcile_alarm_rollups periodically rebuilds recent
+buckets from the Alarm table to correct any drift from bulk updates.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, F, Max, Value, When
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+
+from subjects.models import Subject
+from .models import Alarm, AlarmDailyRollup, AlarmHourlyRollup
+
+logger = logging.getLogger(__name__)
+
+
+def _day(timestamp):
+    return timezone.localdate(timestamp)
+
+
+def _hour(timestamp):
+    return timezone.localtime(timestamp).replace(minute=0, second=0, microsecond=0)
+
+
+def _custodian_id(alarm, subject_id, cache):
+    """Return the custodian of a subject, without a query when the alarm has it loaded."""
+    if alarm.custodian_id is not None and alarm.subject_id == subject_id:
+        return alarm.custodian_id
+    if subject_id not in cache:
+        subject = Alarm._meta.get_field('subject').get_cached_value(alarm, default=None)
+        if subject is not None and subject.id == subject_id:
+            cache[subject_id] = subject.custodian_id
+        else:
+            cache[subject_id] = Subject.objects.values_list('custodian_id', flat=True).get(id=subject_id)
+    return cache[subject_id]
+
+
+class RollupDeltas:
+    """Counter changes for daily and hourly buckets, applied in one go."""
+
+    def __init__(self):
+        self.daily = defaultdict(int)
+        self.hourly = defaultdict(int)
+        self.last_alarm = {}
+        self._custodians = {}
+
+    def add(self, alarm, state, delta):
+        """Count an alarm in (delta=1) or out of (delta=-1) the buckets for a rollup state."""
+        subject_id, situation_type, notification_status, timestamp = state
+        key = (
+            _custodian_id(alarm, subject_id, self._custodians),
+            subject_id,
+            situation_type or '',
+            notification_status,
+        )
+        daily_key = (_day(timestamp),) + key
+        self.daily[daily_key] += delta
+        self.hourly[(_hour(timestamp),) + key] += delta
+        if delta > 0 and (daily_key not in self.last_alarm or self.last_alarm[daily_key] < timestamp):
+            self.last_alarm[daily_key] = timestamp
+
+    def change(self, alarm, old_state, new_state):
+        """Move an alarm between buckets if its rollup state changed."""
+        if old_state == new_state:
+            return
+        if old_state is not None:
+            self.add(alarm, old_state, -1)
+        if new_state is not None:
+            self.add(alarm, new_state, 1)
+
+    def apply(self):
+        """Write all non-zero counter changes."""
+        with transaction.atomic():
+            for (day, *key), delta in self.daily.items():
+                if delta:
+                    _bump(AlarmDailyRollup, 'day', day, key, delta, self.last_alarm.get((day, *key)))
+            for (hour, *key), delta in self.hourly.items():
+                if delta:
+                    _bump(AlarmHourlyRollup, 'hour', hour, key, delta)
+
+
+def _bump(model, period_field, period, key, delta, last_alarm=None):
+    """Add delta to one rollup row, creating it on first use."""
+    custodian_id, subject_id, situation_type, notification_status = key
+    lookup = {
+        period_field: period,
+        'custodian_id': custodian_id,
+        'subject_id': subject_id,
+        'situation_type': situation_type,
+        'notification_status': notification_status,
+    }
+    changes = {'count': F('count') + delta}
+    if last_alarm is not None:
+        latest = Value(last_alarm, output_field=models.DateTimeField())
+        changes['last_alarm'] = Case(
+            When(last_alarm__isnull=True, then=latest),
+            When(last_alarm__lt=last_alarm, then=latest),
+            default=F('last_alarm'),
+        )
+
+    if model.objects.filter(**lookup).update(**changes) or delta < 0:
+        # Missing buckets on decrement are left for reconciliation
+        return
+
+    defaults = {'last_alarm': last_alarm} if last_alarm is not None else {}
+    try:
+        with transaction.atomic():
+            model.objects.create(count=delta, **lookup, **defaults)
+    except IntegrityError:
+        # Created concurrently by another writer
+        model.objects.filter(**lookup).update(**changes)
+
+
+def move_subject_rollups(subject_id, custodian_id):
+    """
+    Move a subject's rollup rows to its new custodian.
+    A subject's rows always move together, so none exist under the new owner yet.
+    """
+    with transaction.atomic():
+        for model in (AlarmDailyRollup, AlarmHourlyRollup):
+            model.objects.filter(subject_id=subject_id).exclude(custodian_id=custodian_id).update(
+                custodian_id=custodian_id
+            )
+
+
+def current_state(alarm):
+    """Return the rollup state of an alarm as it is now."""
+    return tuple(getattr(alarm, field) for field in Alarm.ROLLUP_FIELDS)
+
+
+def record_changes(alarms):
+    """
+    Apply rollup changes for alarms saved without signals (bulk_update).
+    Each alarm is compared with the state it was loaded with.
+    """
+    deltas = RollupDeltas()
+    for alarm in alarms:
+        state = current_state(alarm)
+        deltas.change(alarm, getattr(alarm, '_rollup_state', None), state)
+        alarm._rollup_state = state
+    deltas.apply()
+
+
+def rebuild_rollups(since=None):
+    """
+    Recompute rollups from the Alarm table, for every day from ``since`` (a
+    date) or for all history. Returns the number of alarms counted.
+    """
+    alarms = Alarm.objects.all()
+    daily = AlarmDailyRollup.objects.all()
+    hourly = AlarmHourlyRollup.objects.all()
+    if since is not None:
+        start = timezone.make_aware(datetime.combine(since, time.min))
+        alarms = alarms.filter(timestamp__gte=start)
+        daily = daily.filter(day__gte=since)
+        hourly = hourly.filter(hour__gte=start)
+
+    key_fields = ('custodian_id', 'subject_id', 'situation_type', 'notification_status')
+
+    def build(model, period_field, trunc, extra=None):
+        rows = alarms.annotate(period=trunc('timestamp')).values('period', *key_fields).annotate(
+            total=Count('id'), **(extra or {})
+        ).order_by()
+        objects = [
+            model(**{
+                period_field: row['period'],
+                'custodian_id': row['custodian_id'],
+                'subject_id': row['subject_id'],
+                'situation_type': row['situation_type'] or '',
+                'notification_status': row['notification_status'],
+                'count': row['total'],
+                **({'last_alarm': row['latest']} if extra else {}),
+            })
+            for row in rows.iterator()
+        ]
+        model.objects.bulk_create(objects, batch_size=1000)
+        return sum(obj.count for obj in objects)
+
+    with transaction.atomic():
+        daily.delete()
+        hourly.delete()
+        total = build(AlarmDailyRollup, 'day', TruncDate, {'latest': Max('timestamp')})
+        build(AlarmHourlyRollup, 'hour', TruncHour)
+
+    logger.info(f"Rebuilt alarm rollups since {since or 'the beginning'}: {total} alarms")
+    return total
+
+
+def reconcile_recent(days):
+    """Rebuild the rollups for the last ``days`` local days, including today."""
+    return rebuild_rollups(since=timezone.localdate() - timedelta(days=days))
@@ -0,0 +1,177 @@
+"""
+Delayed jobs for alarm notifications.
+
+Each alarm's next action is a member of one Redis sorted set scored by the
+epoch second it is due: a retry of a failed notification, or an escalation
+check for a message the provider accepted but never confirmed delivered. The
+dispatcher (``manage.py run_alarm_scheduler``, with the
+``dispatch_due_alarm_jobs`` beat task as a fallback) blocks until the earliest
+job is due or a new one is scheduled, pops the due jobs atomically and
+publishes them to Celery, so retries run at their exact due time and nothing
+scans the alarms table to find them.
+"""
+
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from core.celery import app
+from core.redis_client import get_redis
+from .models import Alarm, NotificationStatus
+from .queues import notification_queue
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_KEY = 'alarms:schedule'
+WAKEUP_KEY = 'alarms:schedule:wakeup'
+
+RETRY = 'retry'
+ESCALATE = 'escalate'
+
+JOB_TASKS = {
+    RETRY: 'alarms.tasks.send_whatsapp_notification',
+    ESCALATE: 'alarms.tasks.escalate_undelivered_alarm',
+}
+
+# Notification attempts an alarm gets before it is left failed
+MAX_NOTIFICATION_ATTEMPTS = 3
+
+# Pops up to ARGV[2] members due by ARGV[1] in one step, so two dispatchers never publish the same job
+POP_DUE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'WITHSCORES', 'LIMIT', 0, tonumber(ARGV[2]))
+for i = 1, #due, 2 do
+    redis.call('ZREM', KEYS[1], due[i])
+end
+return due
+"""
+
+_pop_due = None
+
+
+def retry_delay(attempt_count):
+    """Seconds to wait before the attempt after attempt_count failed ones."""
+    backoff = getattr(settings, 'ALARM_RETRY_BACKOFF_SECONDS', (10, 60))
+    return backoff[min(max(attempt_count, 1), len(backoff)) - 1]
+
+
+def _member(job, alarm_id):
+    return f"{job}:{alarm_id}"
+
+
+def _parse_member(member):
+    job, alarm_id = member.decode().split(':')
+    return job, int(alarm_id)
+
+
+def _followup(alarm, now):
+    """Return the (job, due time) that follows the alarm's current status, if any."""
+    status = alarm.notification_status
+    if status in (NotificationStatus.FAILED, NotificationStatus.ERROR):
+        if alarm.notification_attempt_count >= MAX_NOTIFICATION_ATTEMPTS:
+            return None
+        return RETRY, now + retry_delay(alarm.notification_attempt_count)
+    if status in (NotificationStatus.ACCEPTED, NotificationStatus.SENT):
+        escalate_after = getattr(settings, 'ALARM_ESCALATION_SECONDS', 900)
+        if escalate_after:
+            return ESCALATE, now + escalate_after
+    return None
+
+
+def _add(jobs):
+    """ZADD {member: due} and wake the dispatcher."""
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.zadd(SCHEDULE_KEY, jobs)
+        pipe.rpush(WAKEUP_KEY, 1)
+        pipe.execute()
+    except Exception as e:
+        # The recovery sweep (retry_failed_notifications) picks these alarms up again
+        logger.error(f"Could not schedule alarm jobs {sorted(jobs)}: {str(e)}")
+
+
+def schedule(job, alarm_id, delay=0):
+    """Schedule job for an alarm delay seconds from when the current transaction commits."""
+    transaction.on_commit(lambda: _add({_member(job, alarm_id): time.time() + delay}))
+
+
+def schedule_followups(alarms):
+    """Schedule the retry or escalation that follows each alarm's status, after the commit."""
+    now = time.time()
+    jobs = {}
+    for alarm in alarms:
+        followup = _followup(alarm, now)
+        if followup:
+            job, due = followup
+            jobs[_member(job, alarm.id)] = due
+    if jobs:
+        transaction.on_commit(lambda: _add(jobs))
+    return len(jobs)
+
+
+def next_due():
+    """Return the epoch time of the earliest scheduled job, or None."""
+    head = get_redis().zrange(SCHEDULE_KEY, 0, 0, withscores=True)
+    return head[0][1] if head else None
+
+
+def wait_for_due(timeout):
+    """Block until the earliest job is due, a job is scheduled, or the timeout expires."""
+    try:
+        client = get_redis()
+        due = next_due()
+        if due is not None:
+            timeout = min(timeout, max(due - time.time(), 0))
+        if timeout <= 0:
+            return
+        if client.blpop([WAKEUP_KEY], timeout=timeout):
+            # Collapse a burst of wakeups into one pass
+            client.delete(WAKEUP_KEY)
+    except Exception as e:
+        logger.warning(f"Alarm scheduler wakeup unavailable, polling instead: {str(e)}")
+        time.sleep(timeout)
+
+
+def dispatch_due(batch_size=None, now=None):
+    """Publish the jobs due by now to Celery and return how many were published."""
+    global _pop_due
+    batch_size = batch_size or getattr(settings, 'ALARM_SCHEDULER_BATCH_SIZE', 100)
+    client = get_redis()
+    if _pop_due is None:
+        _pop_due = client.register_script(POP_DUE_SCRIPT)
+
+    due = _pop_due(keys=[SCHEDULE_KEY], args=[now or time.time(), batch_size])
+    jobs = [(_parse_member(member), member, score) for member, score in zip(due[::2], due[1::2])]
+    # Retries of test alarms queue behind everything else; one query per batch finds them
+    test_ids = set(
+        Alarm.objects.filter(id__in=[alarm_id for (_, alarm_id), _, _ in jobs], is_test=True)
+        .values_list('id', flat=True)
+    ) if jobs else set()
+    published = 0
+    failed = {}
+    for (job, alarm_id), member, score in jobs:
+        try:
+            app.send_task(
+                JOB_TASKS[job], kwargs={'alarm_id': alarm_id},
+                queue=notification_queue(alarm_id in test_ids, retry=True)
+            )
+            published += 1
+        except Exception as e:
+            failed[member] = float(score)
+            logger.error(f"Failed to publish {job} for alarm {alarm_id}: {str(e)}")
+    if failed:
+        # Put jobs back at their original due time so the next pass retries them first
+        client.zadd(SCHEDULE_KEY, failed)
+    return published
+
+
+def dispatch_pending(batch_size=None):
+    """Publish every job that is due, batch by batch. Returns the number published."""
+    batch_size = batch_size or getattr(settings, 'ALARM_SCHEDULER_BATCH_SIZE', 100)
+    total = 0
+    while True:
+        count = dispatch_due(batch_size)
+        total += count
+        if count < batch_size:
+            return total
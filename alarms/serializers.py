@@ -1,8 +1,9 @@
 from rest_framework import serializers
 from .models import Alarm, NotificationAttempt
 from subjects.models import Subject, SubjectQR
+from core.api import SparseFieldsetMixin
 
-class AlarmSerializer(serializers.ModelSerializer):
+class AlarmSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for the Alarm model."""
     class Meta:
         model = Alarm
@@ -59,9 +60,9 @@ class NotificationAttemptSerializer(serializers.ModelSerializer):
     class Meta:
         model = NotificationAttempt
         fields = [
-            'id', 'alarm', 'recipient', 'channel', 'status',
-            'sent_at', 'error_message', 'retry_count', 'created_at'
+            'id', 'alarm', 'recipient', 'channel', 'destination', 'priority', 'status',
+            'sent_at', 'delivered_at', 'latency_ms', 'error_message', 'retry_count', 'created_at'
         ]
         read_only_fields = [
-            'status', 'sent_at', 'error_message', 'retry_count', 'created_at'
+            'status', 'sent_at', 'delivered_at', 'latency_ms', 'error_message', 'retry_count', 'created_at'
         ] 
\ No newline at end of file
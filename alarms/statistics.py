@@ -0,0 +1,262 @@
+"""
+Alarm statistics read from the daily and hourly rollup tables.
+
+Every statistics endpoint is answered with four small grouped queries over the
+rollups instead of repeated COUNTs over the Alarm table, so response time
+depends on the number of buckets in range rather than on alarm history. Two
+more trim the first day of the range to its exact start: its whole hours come
+from the hourly rollups and only the partial hour from the Alarm table, so
+the windows are not rounded to days.
+The endpoints keep the counts they had before the rollups: api_statistics
+for the REST API, chart_statistics for the statistics page and
+custodian_statistics for the custodian statistics endpoint. Both
+notification_success_rate fields are the percentage of alarms SENT or
+DELIVERED.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import ExtractHour
+from django.utils import timezone
+
+from core.db_router import replica_reads
+from .models import Alarm, AlarmDailyRollup, AlarmHourlyRollup, NotificationStatus
+
+SENT_STATUSES = (NotificationStatus.ACCEPTED, NotificationStatus.SENT, NotificationStatus.DELIVERED)
+FAILED_STATUSES = (NotificationStatus.FAILED, NotificationStatus.ERROR)
+PENDING_STATUSES = (NotificationStatus.PENDING, NotificationStatus.PROCESSING)
+# Notifications that reached the provider's network or the recipient
+SUCCESS_STATUSES = (NotificationStatus.SENT, NotificationStatus.DELIVERED)
+
+
+def _scope(user, own=False):
+    """Return the rollup filter for the alarms a user may see, or only their own."""
+    if user.is_staff and not own:
+        return {}
+    return {'custodian__user': user}
+
+
+def _count(statuses, wanted):
+    return sum(statuses.get(status, 0) for status in wanted)
+
+
+def _success_rate(statuses, count):
+    """Percentage of alarms whose notification was sent or delivered."""
+    return _count(statuses, SUCCESS_STATUSES) * 100.0 / count
+
+
+def _before_start(scope, start):
+    """
+    Count the alarms of start's local day that came before start, by subject
+    and status. Returns (those counts, how many fell in start's own hour).
+    """
+    local_start = timezone.localtime(start)
+    hour_start = local_start.replace(minute=0, second=0, microsecond=0)
+    day_start = hour_start.replace(hour=0)
+
+    counts = defaultdict(int)
+    hour_rows = AlarmHourlyRollup.objects.filter(hour__gte=day_start, hour__lt=hour_start, **scope).values(
+        'subject_id', 'notification_status'
+    ).annotate(total=Sum('count')).order_by()
+    for row in hour_rows:
+        counts[(row['subject_id'], row['notification_status'])] += row['total'] or 0
+
+    in_hour = 0
+    alarm_rows = Alarm.objects.filter(timestamp__gte=hour_start, timestamp__lt=start, **scope).values(
+        'subject_id', 'notification_status'
+    ).annotate(total=Count('id')).order_by()
+    for row in alarm_rows:
+        counts[(row['subject_id'], row['notification_status'])] += row['total']
+        in_hour += row['total']
+    return counts, in_hour
+
+
+@replica_reads()
+def collect_statistics(user, days, own=False):
+    """
+    Return alarm counts for the last ``days`` days: totals, per-status,
+    per-subject, per-day and per-hour-of-day. Staff see every custodian's
+    alarms unless own is set.
+    """
+    end_date = timezone.now()
+    start_date = end_date - timedelta(days=days)
+    scope = _scope(user, own)
+
+    daily = AlarmDailyRollup.objects.filter(**scope)
+    recent = daily.filter(day__gte=timezone.localdate(start_date))
+
+    total_alarms = daily.aggregate(total=Sum('count'))['total'] or 0
+
+    statuses = defaultdict(int)
+    subjects = {}
+    subject_rows = recent.values('subject_id', 'subject__name', 'notification_status').annotate(
+        total=Sum('count'), latest=Max('last_alarm')
+    ).order_by()
+    for row in subject_rows:
+        if not row['total']:
+            continue
+        statuses[row['notification_status']] += row['total']
+        subject = subjects.setdefault(row['subject_id'], {
+            'id': row['subject_id'],
+            'name': row['subject__name'],
+            'count': 0,
+            'last_alarm': None,
+            'statuses': defaultdict(int),
+        })
+        subject['count'] += row['total']
+        subject['statuses'][row['notification_status']] += row['total']
+        if row['latest'] and (subject['last_alarm'] is None or row['latest'] > subject['last_alarm']):
+            subject['last_alarm'] = row['latest']
+
+    dates = {}
+    for row in recent.values('day', 'notification_status').annotate(total=Sum('count')).order_by('day'):
+        if not row['total']:
+            continue
+        date = dates.setdefault(row['day'], {'date': row['day'], 'count': 0, 'statuses': defaultdict(int)})
+        date['count'] += row['total']
+        date['statuses'][row['notification_status']] += row['total']
+
+    # The first day's buckets also hold the alarms before start_date
+    before, in_start_hour = _before_start(scope, start_date)
+    start_day = timezone.localdate(start_date)
+    for (subject_id, status), total in before.items():
+        statuses[status] -= total
+        if subject_id in subjects:
+            subjects[subject_id]['count'] -= total
+            subjects[subject_id]['statuses'][status] -= total
+        if start_day in dates:
+            dates[start_day]['count'] -= total
+            dates[start_day]['statuses'][status] -= total
+
+    start_hour = timezone.localtime(start_date).replace(minute=0, second=0, microsecond=0)
+    hour_rows = AlarmHourlyRollup.objects.filter(hour__gte=start_hour, **scope).annotate(
+        hour_of_day=ExtractHour('hour')
+    ).values('hour_of_day').annotate(total=Sum('count')).order_by('hour_of_day')
+    hours = {row['hour_of_day']: row['total'] or 0 for row in hour_rows}
+    if in_start_hour:
+        hours[start_hour.hour] -= in_start_hour
+
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'days': days,
+        'total_alarms': total_alarms,
+        'recent_alarms': sum(statuses.values()),
+        'statuses': dict(statuses),
+        'subjects': sorted(
+            (subject for subject in subjects.values() if subject['count'] > 0), key=lambda subject: -subject['count']
+        ),
+        'dates': [date for date in dates.values() if date['count'] > 0],
+        'hours': [{'hour': hour, 'count': count} for hour, count in sorted(hours.items()) if count > 0],
+    }
+
+
+def chart_statistics(user, days):
+    """Return statistics in the shape used by the statistics page and its AJAX endpoint."""
+    stats = collect_statistics(user, days)
+    return {
+        'total_alarms': stats['total_alarms'],
+        'recent_alarms': stats['recent_alarms'],
+        'subject_labels': [subject['name'] for subject in stats['subjects']],
+        'subject_data': [subject['count'] for subject in stats['subjects']],
+        'date_labels': [date['date'].strftime('%Y-%m-%d') for date in stats['dates']],
+        'date_data': [date['count'] for date in stats['dates']],
+        'notifications': {
+            'sent': _count(stats['statuses'], SENT_STATUSES),
+            'failed': _count(stats['statuses'], FAILED_STATUSES),
+            'pending': _count(stats['statuses'], PENDING_STATUSES),
+        }
+    }
+
+
+def api_statistics(user, days):
+    """Return statistics in the shape used by the REST API."""
+    stats = collect_statistics(user, days)
+    return {
+        'total_alarms': stats['total_alarms'],
+        'recent_alarms': stats['recent_alarms'],
+        'subject_stats': [
+            {
+                'subject__name': subject['name'],
+                'subject__id': subject['id'],
+                'count': subject['count'],
+                'last_alarm': subject['last_alarm'],
+                'notification_success_rate': _success_rate(subject['statuses'], subject['count']),
+            }
+            for subject in stats['subjects']
+        ],
+        'date_stats': [
+            {
+                'timestamp__date': date['date'],
+                'count': date['count'],
+                'notifications_sent': date['statuses'][NotificationStatus.SENT],
+                'notifications_failed': _count(date['statuses'], FAILED_STATUSES),
+            }
+            for date in stats['dates']
+        ],
+        'hour_stats': stats['hours'],
+        'notifications': {
+            'sent': stats['statuses'].get(NotificationStatus.SENT, 0),
+            'delivered': stats['statuses'].get(NotificationStatus.DELIVERED, 0),
+            'failed': _count(stats['statuses'], FAILED_STATUSES),
+            'pending': _count(stats['statuses'], PENDING_STATUSES),
+        },
+        'time_range': {
+            'start_date': stats['start_date'].isoformat(),
+            'end_date': stats['end_date'].isoformat(),
+            'days': days
+        }
+    }
+
+
+def custodian_statistics(user, days):
+    """
+    Return statistics in the shape used by the custodian statistics endpoint:
+    only the user's own alarms (staff included), totals over the requested
+    range and recent_alarms over its last 7 days.
+    """
+    stats = collect_statistics(user, days, own=True)
+    week_start = stats['end_date'] - timedelta(days=7)
+    if week_start <= stats['start_date']:
+        recent_alarms = stats['recent_alarms']
+    else:
+        before, _ = _before_start(_scope(user, own=True), week_start)
+        week_day = timezone.localdate(week_start)
+        recent_alarms = sum(date['count'] for date in stats['dates'] if date['date'] >= week_day) - sum(before.values())
+    return {
+        'total_alarms': stats['recent_alarms'],
+        'recent_alarms': recent_alarms,
+        'subject_stats': [
+            {
+                'subject__name': subject['name'],
+                'subject__id': subject['id'],
+                'count': subject['count'],
+                'last_alarm': subject['last_alarm'],
+                'notification_success_rate': _success_rate(subject['statuses'], subject['count']),
+            }
+            for subject in stats['subjects']
+        ],
+        'date_stats': [
+            {
+                'timestamp__date': date['date'],
+                'count': date['count'],
+                'notifications_sent': date['statuses'][NotificationStatus.SENT],
+                'notifications_failed': date['statuses'][NotificationStatus.FAILED],
+            }
+            for date in stats['dates']
+        ],
+        'hour_stats': [{'timestamp__hour': hour['hour'], 'count': hour['count']} for hour in stats['hours']],
+        'notifications': {
+            'sent': stats['statuses'].get(NotificationStatus.SENT, 0),
+            'delivered': stats['statuses'].get(NotificationStatus.DELIVERED, 0),
+            'failed': stats['statuses'].get(NotificationStatus.FAILED, 0),
+            'pending': stats['statuses'].get(NotificationStatus.PENDING, 0),
+        },
+        'time_range': {
+            'start_date': stats['start_date'],
+            'end_date': stats['end_date'],
+            'days': days
+        }
+    }
@@ -3,142 +3,126 @@ from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
 import logging
+import tempfile
 from django.db.models import Q
 from core.messaging import MessageService
 import requests
 from notifications.providers import get_notification_service
 from core.celery import app
-from django.db import transaction
+from .fanout import format_phone, notify
 from .models import Alarm, NotificationStatus
+from .outbox import notify_dedup_key
+from .scheduler import MAX_NOTIFICATION_ATTEMPTS, RETRY, retry_delay, schedule, schedule_followups
+from .transitions import claim, transition, transition_many
 
 logger = logging.getLogger(__name__)
 
-@app.task(bind=True, max_retries=3, name='alarms.tasks.send_whatsapp_notification')
-def send_whatsapp_notification(self, alarm_id, is_test=False):
+@app.task(name='alarms.tasks.send_whatsapp_notification')
+def send_whatsapp_notification(alarm_id, is_test=None, situation_type=None):
     """
-    Send a WhatsApp notification for an alarm.
-    Uses select_for_update to prevent race conditions.
+    Notify the custodian of an alarm on every configured contact and channel.
+    situation_type is only read by the router that picks the task's queue.
+    The alarm is claimed with a compare-and-swap to PROCESSING, so concurrent
+    senders skip it instead of waiting on a row lock, and the outbox's first
+    send, which may be published twice, only runs while the alarm is still
+    PENDING. A failed send schedules
+    its retry, and an accepted one its escalation check, in alarms.scheduler.
     """
     try:
-        with transaction.atomic():
-            # Get alarm with lock
-            alarm = Alarm.objects.select_for_update(nowait=True).get(id=alarm_id)
-            
-            # Check if notification is already sent or in progress
-            if alarm.notification_status == NotificationStatus.SENT:
-                logger.info(f"Notification for alarm {alarm_id} already sent")
-                return True
-            elif alarm.notification_status == NotificationStatus.PROCESSING:
-                logger.info(f"Notification for alarm {alarm_id} is already in progress")
-                return True
-            
-            # Check if enough time has passed since last attempt (minimum 2 minutes)
-            if alarm.last_attempt and (timezone.now() - alarm.last_attempt).total_seconds() < 120:
-                logger.info(f"Not enough time has passed since last attempt for alarm {alarm_id}")
+        alarm = Alarm.objects.select_related('subject__custodian__user').get(id=alarm_id)
+        if is_test is None:
+            is_test = alarm.is_test
+
+        # A first send published again by the outbox relay is a no-op
+        if (send_whatsapp_notification.request.id == notify_dedup_key(alarm_id)
+                and alarm.notification_status != NotificationStatus.PENDING):
+            logger.info(f"First notification for alarm {alarm_id} already ran, it is {alarm.notification_status}")
+            return True
+
+        # A retry that arrives before its backoff has passed goes back on the schedule
+        if alarm.last_attempt and alarm.notification_status in (NotificationStatus.FAILED, NotificationStatus.ERROR):
+            wait = retry_delay(alarm.notification_attempt_count) - (timezone.now() - alarm.last_attempt).total_seconds()
+            if wait > 0:
+                logger.info(f"Retry for alarm {alarm_id} is early, rescheduling it in {wait:.1f}s")
+                schedule(RETRY, alarm_id, wait)
                 return True
-            
-            # Mark as in progress
-            alarm.notification_status = NotificationStatus.PROCESSING
-            alarm.save(update_fields=['notification_status'])
-            
-            # Get notification service
-            service = MessageService()
-            
-            try:
-                # Prepare message with timestamp
-                if is_test:
-                    message = (
-                        f"This is a Keryu TEST alarm of {alarm.subject.name}, "
-                        f"triggered on {alarm.timestamp.strftime('%B %d, %Y, %I:%M %p')}, "
-                        f"from {alarm.location}."
-                    )
-                else:
-                    # Convert situation type to a more natural phrase
-                    situation_phrase = {
-                        'INJURED': 'is injured',
-                        'LOST': 'is lost',
-                        'CONTACT': 'needs to be contacted'
-                    }.get(alarm.situation_type, alarm.get_situation_type_display())
-
-                    message = (
-                        f"{alarm.subject.name} {situation_phrase}, "
-                        f"with following details: {alarm.description}. "
-                        f"This alarm was created on {alarm.timestamp.strftime('%B %d, %Y, %I:%M %p')} "
-                        f"from {alarm.location}."
-                    )
-                
-                if alarm.location:
-                    message += f"\nLocation: {alarm.location}"
-                
-                # Convert phone number to string format
-                phone_str = str(alarm.subject.custodian.phone_number)
-                if not phone_str.startswith('+'):
-                    phone_str = f"+{phone_str}"
-                
-                # Attempt to send notification
-                result = service.send_message(
-                    to_number=phone_str,
-                    message=message,
-                    alarm=alarm  # Pass the alarm object
+
+        # Mark as in progress; fails if already sent or being sent by someone else
+        if not transition(alarm, NotificationStatus.PROCESSING):
+            logger.info(f"Notification for alarm {alarm_id} is already {alarm.notification_status}")
+            return True
+
+        # Get notification service
+        service = MessageService()
+
+        try:
+            # Prepare message with timestamp
+            if is_test:
+                message = (
+                    f"This is a Keryu TEST alarm of {alarm.subject.name}, "
+                    f"triggered on {alarm.timestamp.strftime('%B %d, %Y, %I:%M %p')}, "
+                    f"from {alarm.location}."
                 )
-                
-                # Update alarm status based on response
-                if result.get('status') == 'success' or (isinstance(result.get('meta_result'), dict) and result['meta_result'].get('success')):
-                    # First mark as accepted by the service
-                    alarm.notification_status = NotificationStatus.ACCEPTED
-                    alarm.notification_sent = True
-                    alarm.last_attempt = timezone.now()
-                    alarm.notification_attempt_count += 1
-                    alarm.notification_error = None
-                    
-                    # Store message ID based on channel
-                    if result.get('message_id'):
-                        alarm.message_sid = result['message_id']
-                    elif isinstance(result.get('meta_result'), dict) and result['meta_result'].get('message_id'):
-                        alarm.whatsapp_message_id = result['meta_result']['message_id']
-                    
-                    alarm.save(update_fields=[
-                        'notification_status',
-                        'notification_sent',
-                        'last_attempt',
-                        'notification_attempt_count',
-                        'notification_error',
-                        'message_sid',
-                        'whatsapp_message_id'
-                    ])
-                    
-                    logger.info(f"Successfully queued notification for alarm {alarm_id}")
-                    return True
-                else:
-                    error_msg = result.get('error') or (result.get('meta_result', {}) or {}).get('error', 'Unknown error')
-                    raise Exception(f"Failed to send message: {error_msg}")
-                
-            except Exception as e:
-                # Handle notification failure
-                alarm.notification_status = NotificationStatus.FAILED
-                alarm.notification_attempt_count += 1
-                alarm.notification_error = str(e)
-                alarm.save(update_fields=[
-                    'notification_status',
-                    'notification_attempt_count',
-                    'notification_error'
-                ])
-                
-                logger.error(f"Failed to send notification for alarm {alarm_id}: {str(e)}")
-                
-                # Retry with exponential backoff if under max retries
-                if alarm.notification_attempt_count < 3:
-                    # Calculate retry delay: minimum 2 minutes, maximum 10 minutes
-                    retry_delay = min(max(120, 2 ** self.request.retries * 60), 600)
-                    raise self.retry(exc=e, countdown=retry_delay)
-                else:
-                    logger.error(f"Max retries reached for alarm {alarm_id}")
-                return False
-                
+            else:
+                # Convert situation type to a more natural phrase
+                situation_phrase = {
+                    'INJURED': 'is injured',
+                    'LOST': 'is lost',
+                    'CONTACT': 'needs to be contacted'
+                }.get(alarm.situation_type, alarm.get_situation_type_display())
+
+                message = (
+                    f"{alarm.subject.name} {situation_phrase}, "
+                    f"with following details: {alarm.description}. "
+                    f"This alarm was created on {alarm.timestamp.strftime('%B %d, %Y, %I:%M %p')} "
+                    f"from {alarm.location}."
+                )
+
+            if alarm.location:
+                message += f"\nLocation: {alarm.location}"
+
+            # Send to every contact and channel at once; each route's outcome is its own attempt
+            result = notify(service, alarm, message)
+
+            # Update alarm status based on response
+            if result.get('status') == 'success' or (isinstance(result.get('meta_result'), dict) and result['meta_result'].get('success')):
+                fields = {
+                    'notification_sent': True,
+                    'last_attempt': timezone.now(),
+                    'notification_error': None,
+                }
+                # Store message ID based on channel
+                if result.get('message_id') or result.get('message_sid'):
+                    fields['message_sid'] = result.get('message_id') or result.get('message_sid')
+                elif isinstance(result.get('meta_result'), dict) and result['meta_result'].get('message_id'):
+                    fields['whatsapp_message_id'] = result['meta_result']['message_id']
+
+                # Marked as accepted by the service
+                if transition(alarm, NotificationStatus.ACCEPTED, count_attempt=True, **fields):
+                    schedule_followups([alarm])
+                logger.info(f"Successfully queued notification for alarm {alarm_id}")
+                return True
+            else:
+                error_msg = result.get('error') or (result.get('meta_result', {}) or {}).get('error', 'Unknown error')
+                raise Exception(f"Failed to send message: {error_msg}")
+
+        except Exception as e:
+            # Handle notification failure
+            failed = transition(
+                alarm, NotificationStatus.FAILED, count_attempt=True,
+                last_attempt=timezone.now(), notification_error=str(e)
+            )
+            logger.error(f"Failed to send notification for alarm {alarm_id}: {str(e)}")
+
+            # Retry at the next backoff step if under max attempts
+            if failed and not schedule_followups([alarm]):
+                logger.error(f"Max retries reached for alarm {alarm_id}")
+            return False
+
     except Alarm.DoesNotExist:
         logger.error(f"Alarm {alarm_id} not found")
         return False
-        
+
     except Exception as e:
         logger.error(f"Unexpected error processing alarm {alarm_id}: {str(e)}")
         raise
@@ -146,135 +130,301 @@ def send_whatsapp_notification(self, alarm_id, is_test=False):
 @shared_task
 def retry_failed_notifications():
     """
-    Retry sending notifications for alarms where notification failed.
+    Put the retries of failed notifications back on the schedule.
+    Recovery for a lost schedule (e.g. a Redis flush); retries are normally
+    scheduled by the send that failed.
     """
-    # Get alarms where notification wasn't sent or failed
     failed_alarms = Alarm.objects.filter(
-        Q(notification_sent=False) | Q(notification_status__in=[NotificationStatus.ERROR, NotificationStatus.FAILED]),
-        notification_attempt_count__lt=3,  # Limit retries to 3 attempts
+        notification_status__in=[NotificationStatus.ERROR, NotificationStatus.FAILED],
+        notification_attempt_count__lt=MAX_NOTIFICATION_ATTEMPTS,
         timestamp__gte=timezone.now() - timezone.timedelta(days=1)  # Only last 24 hours
     )
-    
-    for alarm in failed_alarms:
-        send_whatsapp_notification.delay(alarm.id)
-        logger.info(f"Retrying notification for alarm {alarm.id} (Attempt {alarm.notification_attempt_count + 1})")
+    count = schedule_followups(failed_alarms)
+    logger.info(f"Rescheduled retries for {count} failed alarms")
+    return count
+
+@shared_task
+def escalate_undelivered_alarm(alarm_id):
+    """
+    Escalate a notification the provider accepted but never confirmed delivered:
+    mark it failed and schedule another attempt while attempts remain.
+    """
+    try:
+        alarm = Alarm.objects.get(id=alarm_id)
+    except Alarm.DoesNotExist:
+        logger.error(f"Alarm {alarm_id} not found")
+        return False
+
+    if alarm.notification_status not in (NotificationStatus.ACCEPTED, NotificationStatus.SENT):
+        # Delivered, or already failed and retried, since the escalation was scheduled
+        return False
+    if alarm.notification_attempt_count >= MAX_NOTIFICATION_ATTEMPTS:
+        logger.error(f"Alarm {alarm_id} was never confirmed delivered and has no attempts left")
+        return False
+
+    error = f"Not confirmed delivered within {getattr(settings, 'ALARM_ESCALATION_SECONDS', 900)} seconds"
+    if not transition(alarm, NotificationStatus.FAILED, notification_sent=False, notification_error=error):
+        return False
+    logger.warning(f"Escalating alarm {alarm_id}: {error}")
+    schedule_followups([alarm])
+    return True
+
+def _pending_sweep_queryset(cutoff):
+    """Return the queryset of alarms eligible for the pending sweep."""
+    return Alarm.objects.filter(
+        Q(last_attempt__isnull=True) | Q(last_attempt__lte=cutoff),
+        notification_status=NotificationStatus.PENDING,
+        notification_attempt_count__lt=MAX_NOTIFICATION_ATTEMPTS,
+    )
+
+def _claim_pending_batch(cutoff, after, batch_size):
+    """
+    Claim the next batch of pending alarms after the (timestamp, id) keyset.
+    Candidates are flipped to PROCESSING with compare-and-swap UPDATEs, so
+    concurrent sweeps and senders never wait on each other or claim the same alarm.
+    Returns (claimed alarms, keyset position of the last candidate).
+    """
+    queryset = _pending_sweep_queryset(cutoff)
+    if after is not None:
+        last_timestamp, last_id = after
+        queryset = queryset.filter(
+            Q(timestamp__gt=last_timestamp) | Q(timestamp=last_timestamp, id__gt=last_id)
+        )
+
+    candidates = list(queryset.order_by('timestamp', 'id').values_list('timestamp', 'id')[:batch_size])
+    if not candidates:
+        return [], None
+    batch = claim([alarm_id for _, alarm_id in candidates], select_related=('subject__custodian',))
+    return batch, candidates[-1]
+
+def _apply_send_result(alarm, result, now):
+    """Copy a MessageService result onto the alarm without saving it."""
+    alarm.notification_attempt_count += 1
+    alarm.last_attempt = now
+    alarm.updated_at = now
+    meta_result = result.get('meta_result') if isinstance(result.get('meta_result'), dict) else {}
+
+    if result.get('status') == 'success' or meta_result.get('success'):
+        alarm.notification_status = NotificationStatus.SENT
+        alarm.notification_sent = True
+        alarm.notification_error = None
+        if result.get('message_id'):
+            alarm.message_sid = result['message_id']
+        elif result.get('message_sid'):
+            alarm.message_sid = result['message_sid']
+        elif meta_result.get('message_id'):
+            alarm.whatsapp_message_id = meta_result['message_id']
+        return True
+
+    alarm.notification_status = NotificationStatus.ERROR
+    alarm.notification_error = result.get('error') or meta_result.get('error', 'Unknown error')
+    return False
+
+def _dispatch_batch(message_service, alarms):
+    """
+    Send notifications for a claimed batch and return one result per alarm.
+    Alarms without a custodian phone number get an error result instead of a send.
+    """
+    results = [None] * len(alarms)
+    messages = []
+    positions = []
+    for position, alarm in enumerate(alarms):
+        phone_number = alarm.subject.custodian.phone_number
+        if not phone_number:
+            results[position] = {
+                'status': 'error',
+                'error': f"No phone number found for custodian of subject {alarm.subject.name}"
+            }
+            continue
+
+        positions.append(position)
+        messages.append({
+            'to_number': format_phone(phone_number),
+            'message': f"Alert: {alarm.subject.name} has been located at {alarm.timestamp.strftime('%Y-%m-%d %H:%M:%S')}",
+        })
+
+    try:
+        sent = message_service.send_many(messages)
+    except Exception as e:
+        sent = [{'status': 'error', 'error': str(e)}] * len(messages)
+
+    for position, result in zip(positions, sent):
+        results[position] = result
+    return results
+
+SWEEP_UPDATE_FIELDS = [
+    'notification_status',
+    'notification_sent',
+    'notification_error',
+    'notification_attempt_count',
+    'last_attempt',
+    'message_sid',
+    'whatsapp_message_id',
+    'updated_at',
+]
 
 @shared_task(bind=True, max_retries=3)
 def process_pending_alarms(self):
     """
-    Process all pending alarms and send notifications
+    Process pending alarms in bounded, keyset-paginated batches.
+    Each batch is claimed with compare-and-swap UPDATEs in one transaction,
+    dispatched in one call and written back with conditional updates that
+    leave alarms a receipt moved on meanwhile untouched.
     """
     logger.info("Starting to process pending alarms...")
-    
-    # Get all pending alarms that haven't been attempted in the last 2 minutes
-    two_minutes_ago = timezone.now() - timezone.timedelta(minutes=2)
-    pending_alarms = Alarm.objects.filter(
-        notification_status=NotificationStatus.PENDING,
-        notification_attempt_count__lt=3
-    ).exclude(
-        last_attempt__gt=two_minutes_ago
-    )
-    
-    logger.info(f"Found {pending_alarms.count()} pending alarms to process")
-    
-    if not pending_alarms.exists():
-        logger.info("No pending alarms to process")
-        return
-    
-    message_service = MessageService()
+
+    batch_size = getattr(settings, 'ALARM_SWEEP_BATCH_SIZE', 200)
+    cutoff = timezone.now() - timezone.timedelta(minutes=2)
+    message_service = None
     processed_count = 0
     error_count = 0
-    
-    for alarm in pending_alarms:
-        try:
-            with transaction.atomic():
-                # Get alarm with lock to prevent race conditions
-                alarm = Alarm.objects.select_for_update(nowait=True).get(id=alarm.id)
-                
-                logger.info(f"Processing alarm {alarm.id} for subject {alarm.subject.name}")
-                
-                # Skip if already sent or in progress
-                if alarm.notification_status == NotificationStatus.SENT:
-                    logger.info(f"Notification for alarm {alarm.id} already sent")
-                    continue
-                elif alarm.notification_status == NotificationStatus.PROCESSING:
-                    logger.info(f"Notification for alarm {alarm.id} is already in progress")
-                    continue
-                
-                # Check if enough time has passed since last attempt
-                if alarm.last_attempt and (timezone.now() - alarm.last_attempt).total_seconds() < 120:
-                    logger.info(f"Not enough time has passed since last attempt for alarm {alarm.id}")
-                    continue
-                
-                # Mark as in progress
-                alarm.notification_status = NotificationStatus.PROCESSING
-                alarm.save(update_fields=['notification_status'])
-                
-                # Get the custodian's phone number
-                phone_number = alarm.subject.custodian.phone_number
-                if not phone_number:
-                    raise ValueError(f"No phone number found for custodian of subject {alarm.subject.name}")
-                
-                # Convert phone number to string format
-                phone_str = str(phone_number)
-                if not phone_str.startswith('+'):
-                    phone_str = f"+{phone_str}"
-                
-                # Prepare the message
-                message = f"Alert: {alarm.subject.name} has been located at {alarm.timestamp.strftime('%Y-%m-%d %H:%M:%S')}"
-                
-                logger.info(f"Sending notification to {phone_str} for alarm {alarm.id}")
-                
-                # Send notification using configured channel
-                result = message_service.send_message(
-                    to_number=phone_str,
-                    message=message,
-                    alarm=alarm  # Pass the alarm object
-                )
-                
-                # Update alarm status based on response
-                if result.get('status') == 'success' or (isinstance(result.get('meta_result'), dict) and result['meta_result'].get('success')):
-                    alarm.notification_status = NotificationStatus.SENT
-                    alarm.notification_sent = True
-                    alarm.last_attempt = timezone.now()
-                    alarm.notification_attempt_count += 1
-                    alarm.notification_error = None
-                    
-                    # Store message ID based on channel
-                    if result.get('message_id'):
-                        alarm.message_sid = result['message_id']
-                    elif isinstance(result.get('meta_result'), dict) and result['meta_result'].get('message_id'):
-                        alarm.whatsapp_message_id = result['meta_result']['message_id']
-                    
-                    alarm.save(update_fields=[
-                        'notification_status',
-                        'notification_sent',
-                        'last_attempt',
-                        'notification_attempt_count',
-                        'notification_error',
-                        'message_sid',
-                        'whatsapp_message_id'
-                    ])
-                    processed_count += 1
-                    logger.info(f"Successfully sent notification for alarm {alarm.id}")
-                else:
-                    error_msg = result.get('error') or (result.get('meta_result', {}) or {}).get('error', 'Unknown error')
-                    raise Exception(f"Failed to send message: {error_msg}")
-                
-        except Exception as e:
-            error_count += 1
-            logger.error(f"Error processing alarm {alarm.id}: {str(e)}")
-            try:
-                alarm.notification_status = NotificationStatus.ERROR
-                alarm.notification_error = str(e)
-                alarm.notification_attempt_count += 1
-                alarm.save(update_fields=['notification_status', 'notification_error', 'notification_attempt_count'])
-            except Exception as save_error:
-                logger.error(f"Error saving alarm status: {str(save_error)}")
-    
+    after = None
+
+    while True:
+        batch, after = _claim_pending_batch(cutoff, after, batch_size)
+        if after is None:
+            break
+        if not batch:
+            # Every candidate was claimed by another sender
+            continue
+
+        if message_service is None:
+            message_service = MessageService()
+
+        logger.info(f"Dispatching batch of {len(batch)} pending alarms")
+        results = _dispatch_batch(message_service, batch)
+
+        now = timezone.now()
+        for alarm, result in zip(batch, results):
+            if _apply_send_result(alarm, result, now):
+                processed_count += 1
+            else:
+                error_count += 1
+                logger.error(f"Error processing alarm {alarm.id}: {alarm.notification_error}")
+
+        # Alarms a webhook moved on meanwhile keep their newer status
+        schedule_followups(transition_many(batch, NotificationStatus.PROCESSING, SWEEP_UPDATE_FIELDS))
+
+    if processed_count == 0 and error_count == 0:
+        logger.info("No pending alarms to process")
+        return
+
     logger.info(f"Finished processing alarms. Processed: {processed_count}, Errors: {error_count}")
     return {'processed': processed_count, 'errors': error_count}
 
+@shared_task
+def relay_notification_outbox():
+    """
+    Publish undispatched notification outbox entries.
+    Fallback for deployments where the relay_outbox command isn't running.
+    """
+    from .outbox import relay_pending
+
+    count = relay_pending()
+    if count:
+        logger.info(f"Relayed {count} notification outbox entries")
+    return count
+
+@shared_task
+def dispatch_due_alarm_jobs():
+    """
+    Publish due alarm retries and escalations.
+    Fallback for deployments where the run_alarm_scheduler command isn't running.
+    """
+    from .scheduler import dispatch_pending
+
+    count = dispatch_pending()
+    if count:
+        logger.info(f"Dispatched {count} scheduled alarm jobs")
+    return count
+
+@shared_task
+def apply_delivery_receipts():
+    """
+    Apply queued delivery receipts.
+    Fallback for deployments where the consume_delivery_receipts command isn't running.
+    """
+    from .receipts import consume
+
+    total = 0
+    while count := consume('beat'):
+        total += count
+    if total:
+        logger.info(f"Applied {total} delivery receipts")
+    return total
+
+@shared_task
+def build_alarm_export(export_id):
+    """
+    Build a large alarm export in the background and store it for download
+    """
+    from django.core.files import File
+    from .exports import export_queryset, write_pdf, write_xlsx
+    from .models import AlarmExport
+
+    writers = {
+        AlarmExport.FORMAT_PDF: write_pdf,
+        AlarmExport.FORMAT_XLSX: write_xlsx,
+    }
+
+    try:
+        export = AlarmExport.objects.select_related('requested_by').get(id=export_id)
+    except AlarmExport.DoesNotExist:
+        logger.error(f"Alarm export {export_id} not found")
+        return
+
+    export.status = AlarmExport.STATUS_RUNNING
+    export.save(update_fields=['status'])
+
+    try:
+        with tempfile.TemporaryFile() as output:
+            row_count = writers[export.export_format](export_queryset(export.requested_by), output)
+            output.seek(0)
+            filename = f"alarms_{export.id}_{timezone.now():%Y%m%d%H%M%S}.{export.export_format}"
+            export.file.save(filename, File(output), save=False)
+        export.row_count = row_count
+        export.status = AlarmExport.STATUS_READY
+        export.completed_at = timezone.now()
+        export.save(update_fields=['file', 'row_count', 'status', 'completed_at'])
+        logger.info(f"Built alarm export {export.id} with {row_count} rows")
+    except Exception as e:
+        logger.error(f"Error building alarm export {export.id}: {str(e)}")
+        export.status = AlarmExport.STATUS_FAILED
+        export.error = str(e)
+        export.completed_at = timezone.now()
+        export.save(update_fields=['status', 'error', 'completed_at'])
+        raise
+
+@shared_task
+def cleanup_old_alarm_exports():
+    """
+    Delete stored alarm export files older than ALARM_EXPORT_RETENTION_HOURS
+    """
+    from .models import AlarmExport
+
+    cutoff = timezone.now() - timezone.timedelta(hours=getattr(settings, 'ALARM_EXPORT_RETENTION_HOURS', 24))
+    count = 0
+    for export in AlarmExport.objects.filter(created_at__lt=cutoff).iterator():
+        if export.file:
+            export.file.delete(save=False)
+        export.delete()
+        count += 1
+
+    logger.info(f"Cleaned up {count} old alarm exports")
+    return count
+
+@shared_task
+def reconcile_alarm_rollups(days=None):
+    """
+    Rebuild recent statistics rollups from the alarm table.
+    Corrects counters for alarms changed by bulk or raw updates.
+    """
+    from .rollups import reconcile_recent
+
+    if days is None:
+        days = getattr(settings, 'ALARM_ROLLUP_RECONCILE_DAYS', 2)
+    return reconcile_recent(days)
+
 @shared_task
 def cleanup_old_alarms():
     """
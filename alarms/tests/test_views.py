@@ -70,8 +70,8 @@ class AlarmAPITests(TestCase):
         response = self.client.get(url)
         
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['id'], self.alarm.id)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['id'], self.alarm.id)
 
     def test_retrieve_alarm(self):
         """Test retrieving a single alarm via API"""
@@ -0,0 +1,182 @@
+"""
+Notification state machine for alarms.
+
+Every change to an alarm's notification_status is a compare-and-swap: the
+new status and its companion fields are written with one UPDATE that only
+matches while the row still has the status the caller observed, and only if
+that status is an allowed predecessor of the new one. Batch writes are one
+conditional UPDATE per batch whose winners come back from UPDATE ... RETURNING
+(or, without it, from locking the matching rows first). Senders, the pending
+sweep and the receipt consumer therefore never wait on row locks, and a late
+writer loses instead of overwriting a newer state (a DELIVERED alarm is never
+downgraded to ACCEPTED). Rollups are moved for the transitions that won.
+"""
+
+import logging
+
+from django.db import connections, router, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.sql import UpdateQuery
+from django.utils import timezone
+
+from core.conditional import record_change
+from .models import Alarm, NotificationStatus
+from .rollups import RollupDeltas, current_state, record_changes as record_rollup_changes
+
+logger = logging.getLogger(__name__)
+
+_IN_FLIGHT = {NotificationStatus.PENDING, NotificationStatus.PROCESSING, NotificationStatus.ACCEPTED}
+
+ALLOWED_PREDECESSORS = {
+    # Provider took the message but only confirms through a status callback (Twilio SMS)
+    NotificationStatus.PENDING: {NotificationStatus.PROCESSING},
+    # A sender claims the alarm; failed alarms can be claimed again for a retry
+    NotificationStatus.PROCESSING: {NotificationStatus.PENDING, NotificationStatus.FAILED, NotificationStatus.ERROR},
+    NotificationStatus.ACCEPTED: {NotificationStatus.PENDING, NotificationStatus.PROCESSING},
+    NotificationStatus.SENT: _IN_FLIGHT,
+    NotificationStatus.DELIVERED: _IN_FLIGHT | {NotificationStatus.SENT},
+    NotificationStatus.FAILED: _IN_FLIGHT | {NotificationStatus.SENT},
+    NotificationStatus.ERROR: _IN_FLIGHT | {NotificationStatus.SENT},
+}
+
+# Compare-and-swap rounds before giving up on a contended alarm
+MAX_ATTEMPTS = 3
+
+
+def can_transition(current, status):
+    """Return whether an alarm in status current may move to status."""
+    return current in ALLOWED_PREDECESSORS.get(status, ())
+
+
+def transition(alarm, status, count_attempt=False, **fields):
+    """
+    Move an alarm to status, setting fields in the same conditional UPDATE and
+    incrementing notification_attempt_count if count_attempt. Returns True if
+    this call made the change; the instance is updated to match either way.
+    """
+    for _ in range(MAX_ATTEMPTS):
+        observed = alarm.notification_status
+        if not can_transition(observed, status):
+            logger.info(f"Alarm {alarm.id} is {observed}, not moving it to {status}")
+            return False
+
+        now = timezone.now()
+        changes = dict(fields, notification_status=status, updated_at=now)
+        if count_attempt:
+            changes['notification_attempt_count'] = F('notification_attempt_count') + 1
+
+        old_state = current_state(alarm)
+        if Alarm.objects.filter(id=alarm.id, notification_status=observed).update(**changes):
+            for field, value in fields.items():
+                setattr(alarm, field, value)
+            alarm.notification_status = status
+            alarm.updated_at = now
+            if count_attempt:
+                alarm.notification_attempt_count += 1
+            _move_rollups(alarm, old_state)
+            record_change(alarm.custodian_id)
+            return True
+
+        # Lost the race: re-read the status that won and try again if it still allows the move
+        alarm.notification_status = Alarm.objects.values_list('notification_status', flat=True).get(id=alarm.id)
+
+    logger.warning(f"Gave up moving alarm {alarm.id} to {status} after {MAX_ATTEMPTS} contended attempts")
+    return False
+
+
+def _move_rollups(alarm, old_state):
+    try:
+        deltas = RollupDeltas()
+        deltas.change(alarm, old_state, current_state(alarm))
+        deltas.apply()
+    except Exception as e:
+        logger.error(f"Error updating statistics rollups for alarm {alarm.id}: {str(e)}")
+    alarm.snapshot_rollup_state()
+
+
+def _supports_update_returning(connection):
+    # MariaDB returns columns from INSERT but not from UPDATE
+    return connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert
+
+
+def _update_won(ids, expected, changes):
+    """
+    Apply changes with one UPDATE to the alarms in ids that are still in
+    status expected, and return the ids it changed. Must run in a transaction.
+    """
+    db = router.db_for_write(Alarm)
+    connection = connections[db]
+    queryset = Alarm.objects.using(db).filter(id__in=ids, notification_status=expected)
+    if _supports_update_returning(connection):
+        query = queryset.query.chain(UpdateQuery)
+        query.add_update_values(changes)
+        sql, params = query.get_compiler(db).as_sql()
+        with connection.cursor() as cursor:
+            cursor.execute(f"{sql} RETURNING {connection.ops.quote_name('id')}", params)
+            return {row[0] for row in cursor.fetchall()}
+
+    # Otherwise lock the rows still in expected first; concurrent writers skip them instead of sharing them
+    won = set(queryset.select_for_update(skip_locked=True).values_list('id', flat=True))
+    if won:
+        Alarm.objects.using(db).filter(id__in=won).update(**changes)
+    return won
+
+
+def claim(alarm_ids, select_related=()):
+    """
+    Move PENDING alarms to PROCESSING and return the alarms this call claimed,
+    in (timestamp, id) order. One conditional UPDATE claims the whole batch and
+    reports the rows it changed, so an alarm claimed by a concurrent sender in
+    between is skipped rather than sent twice.
+    """
+    if not alarm_ids:
+        return []
+    now = timezone.now()
+    with transaction.atomic():
+        won = _update_won(
+            alarm_ids, NotificationStatus.PENDING,
+            {'notification_status': NotificationStatus.PROCESSING, 'updated_at': now}
+        )
+        claimed = list(
+            Alarm.objects.select_related(*select_related).filter(id__in=won).order_by('timestamp', 'id')
+        ) if won else []
+        deltas = RollupDeltas()
+        for alarm in claimed:
+            state = current_state(alarm)
+            deltas.change(alarm, state[:2] + (NotificationStatus.PENDING,) + state[3:], state)
+        deltas.apply()
+        record_change(*{alarm.custodian_id for alarm in claimed})
+    return claimed
+
+
+def transition_many(alarms, expected, fields):
+    """
+    Write already applied transitions for alarms that were all observed in
+    status expected, with one conditional UPDATE (a CASE per field, as
+    bulk_update builds) that only matches rows still in that status.
+    Returns the alarms whose transition won.
+    """
+    if not alarms:
+        return []
+    now = timezone.now()
+    for alarm in alarms:
+        alarm.updated_at = now
+    fields = list(fields) + (['updated_at'] if 'updated_at' not in fields else [])
+
+    changes = {}
+    for name in fields:
+        field = Alarm._meta.get_field(name)
+        changes[name] = Case(
+            *(When(id=alarm.id, then=Value(getattr(alarm, field.attname), output_field=field)) for alarm in alarms),
+            output_field=field
+        )
+
+    with transaction.atomic():
+        # Judged by the rows the UPDATE reports, not by re-reading a status a concurrent writer may share
+        won_ids = _update_won([alarm.id for alarm in alarms], expected, changes)
+        won = [alarm for alarm in alarms if alarm.id in won_ids]
+        if len(won) < len(alarms):
+            logger.info(f"{len(alarms) - len(won)} alarms changed status concurrently and were not overwritten")
+        record_rollup_changes(won)
+        record_change(*{alarm.custodian_id for alarm in won})
+    return won
@@ -24,6 +24,7 @@ urlpatterns = [
     path('export/csv/', views.export_csv, name='export_csv'),
     path('export/excel/', views.export_alarms_excel, name='export_excel'),
     path('export/pdf/', views.export_alarms_pdf, name='export_pdf'),
+    path('export/<int:pk>/status/', views.export_status, name='export_status'),
+    path('export/<int:pk>/download/', views.export_download, name='export_download'),
     path('webhook/notification/', views.notification_webhook, name='notification_webhook'),
-    path('webhook/twilio/status/', views.twilio_status_callback, name='twilio_status_callback'),
 ] 
\ No newline at end of file
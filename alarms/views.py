@@ -1,5 +1,5 @@
 from django.shortcuts import render, get_object_or_404
-from django.http import HttpResponse, JsonResponse, FileResponse
+from django.http import HttpResponse, JsonResponse, FileResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
 from django.core.paginator import Paginator
@@ -7,18 +7,19 @@ from django.db.models import Count, Q
 from django.utils import timezone
 from django.views.decorators.http import require_POST, require_http_methods
 from datetime import timedelta
-import csv
-import xlsxwriter
-import io
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
+import tempfile
 from subjects.models import Subject, SubjectQR
-from .tasks import send_whatsapp_notification
+from .tasks import send_whatsapp_notification, build_alarm_export
+from .queues import notification_queue
 import json
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from .models import Alarm, NotificationAttempt
+from .models import Alarm, NotificationAttempt, AlarmExport
+from . import exports
+from .statistics import chart_statistics, custodian_statistics
+from .receipts import enqueue_receipts, parse_meta
+from core.api import DeltaSyncMixin, KeysetPagination
+from core.conditional import ConditionalGetMixin, conditional_on_changes
+from core.db_router import replica_reads
+from core.metrics import dashboard_metrics
 from django.conf import settings
 from django.contrib import messages
 from django.urls import reverse
@@ -31,14 +32,20 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from .serializers import AlarmSerializer, NotificationAttemptSerializer
 import logging
-from django.db import models
+from django.db import models, transaction
 
 logger = logging.getLogger(__name__)
 
+@transaction.non_atomic_requests
 @login_required
+@conditional_on_changes
+@replica_reads()
 def alarm_list(request):
     """View for listing alarms with filtering options"""
     alarms = Alarm.objects.select_related('subject', 'qr_code')
+    # Custodians only see (and only get change versions for) their own alarms
+    if not request.user.is_staff:
+        alarms = alarms.filter(custodian__user=request.user)
     
     # Filter by date range
     date_from = request.GET.get('date_from')
@@ -88,6 +95,7 @@ def alarm_list(request):
 def alarm_create(request):
     return HttpResponse("Alarm create view - Coming soon!")
 
+@transaction.non_atomic_requests
 @login_required
 def alarm_detail(request, pk):
     """View for showing alarm details"""
@@ -103,51 +111,28 @@ def alarm_delete(request, pk):
 def notifications(request):
     return HttpResponse("Notifications view - Coming soon!")
 
+@transaction.non_atomic_requests
 @login_required
+@conditional_on_changes(windowed=True)
+@replica_reads()
 def alarm_statistics(request):
     """View for showing alarm statistics"""
     # Get time range
     days = int(request.GET.get('days', 30))
-    end_date = timezone.now()
-    start_date = end_date - timedelta(days=days)
     
-    # Get alarms based on user role
-    if request.user.is_staff:
-        alarms = Alarm.objects.all()
-    else:
-        alarms = Alarm.objects.filter(subject__custodian__user=request.user)
-    
-    # Get filtered alarms for the time range
-    filtered_alarms = alarms.filter(timestamp__range=[start_date, end_date])
-    
-    # Calculate statistics
+    # Counts come from the precomputed statistics rollups
+    data = chart_statistics(request.user, days)
     stats = {
-        'total_alarms': alarms.count(),
-        'recent_alarms': filtered_alarms.count(),
-        'notifications': {
-            'sent': filtered_alarms.filter(notification_sent=True).count(),
-            'failed': filtered_alarms.filter(notification_sent=False, notification_error__isnull=False).count(),
-            'pending': filtered_alarms.filter(notification_sent=False, notification_error__isnull=True).count(),
-        }
+        'total_alarms': data['total_alarms'],
+        'recent_alarms': data['recent_alarms'],
+        'notifications': data['notifications']
     }
-    
-    # Get subject data
-    subject_stats = filtered_alarms.values('subject__name').annotate(
-        count=Count('id')
-    ).order_by('-count')
-    
-    # Get daily data
-    daily_stats = filtered_alarms.values('timestamp__date').annotate(
-        count=Count('id')
-    ).order_by('timestamp__date')
-    
-    # Prepare chart data
     chart_data = {
-        'subject_labels': [item['subject__name'] for item in subject_stats],
-        'subject_data': [item['count'] for item in subject_stats],
-        'date_labels': [item['timestamp__date'].strftime('%Y-%m-%d') for item in daily_stats],
-        'date_data': [item['count'] for item in daily_stats],
-        'notifications': stats['notifications']
+        'subject_labels': data['subject_labels'],
+        'subject_data': data['subject_data'],
+        'date_labels': data['date_labels'],
+        'date_data': data['date_data'],
+        'notifications': data['notifications']
     }
     
     return render(request, 'alarms/alarm_statistics.html', {
@@ -159,170 +144,119 @@ def alarm_statistics(request):
         'total_subjects': Subject.objects.count() if request.user.is_staff else Subject.objects.filter(custodian__user=request.user).count()
     })
 
+@transaction.non_atomic_requests
 @login_required
+@conditional_on_changes(windowed=True)
 def statistics_data(request):
     """AJAX endpoint for statistics data"""
     days = int(request.GET.get('days', 30))
-    end_date = timezone.now()
-    start_date = end_date - timedelta(days=days)
-    
-    if request.user.is_staff:
-        alarms = Alarm.objects.all()
-    else:
-        alarms = Alarm.objects.filter(subject__custodian__user=request.user)
-    
-    # Get filtered data
-    filtered_alarms = alarms.filter(timestamp__range=[start_date, end_date])
-    
-    # Prepare statistics
-    data = {
-        'total_alarms': alarms.count(),
-        'recent_alarms': filtered_alarms.count(),
-        'subject_labels': [],
-        'subject_data': [],
-        'date_labels': [],
-        'date_data': [],
-        'notifications': {
-            'sent': filtered_alarms.filter(notification_sent=True).count(),
-            'failed': filtered_alarms.filter(notification_sent=False, notification_error__isnull=False).count(),
-            'pending': filtered_alarms.filter(notification_sent=False, notification_error__isnull=True).count(),
-        }
-    }
-    
-    # Get subject data
-    subject_stats = filtered_alarms.values('subject__name').annotate(
-        count=Count('id')
-    ).order_by('-count')
-    data['subject_labels'] = [item['subject__name'] for item in subject_stats]
-    data['subject_data'] = [item['count'] for item in subject_stats]
-    
-    # Get daily data
-    daily_stats = filtered_alarms.values('timestamp__date').annotate(
-        count=Count('id')
-    ).order_by('timestamp__date')
-    data['date_labels'] = [item['timestamp__date'].strftime('%Y-%m-%d') for item in daily_stats]
-    data['date_data'] = [item['count'] for item in daily_stats]
-    
+    data = chart_statistics(request.user, days)
     return JsonResponse(data)
 
 @login_required
 def export_csv(request):
     """Export alarm data as CSV"""
-    if request.user.is_staff:
-        alarms = Alarm.objects.all()
-    else:
-        alarms = Alarm.objects.filter(subject__custodian__user=request.user)
-    
-    # Create the HttpResponse object with CSV header
-    response = HttpResponse(content_type='text/csv')
+    response = StreamingHttpResponse(
+        exports.stream_csv(exports.export_queryset(request.user)),
+        content_type='text/csv'
+    )
     response['Content-Disposition'] = 'attachment; filename="alarms_export.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow(['Timestamp', 'Subject', 'Custodian', 'Location', 'Notification Status'])
-    
-    for alarm in alarms:
-        writer.writerow([
-            alarm.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-            alarm.subject.name,
-            alarm.subject.custodian.user.get_full_name(),
-            alarm.location or 'N/A',
-            'Sent' if alarm.notification_sent else 'Pending'
-        ])
-    
     return response
 
 @login_required
 def export_alarms_excel(request):
     """Export alarms to Excel file"""
-    # Create output
-    output = io.BytesIO()
-    workbook = xlsxwriter.Workbook(output)
-    worksheet = workbook.add_worksheet()
-    
-    # Add headers
-    headers = ['Date', 'Time', 'Subject', 'Location', 'Notification Status']
-    for col, header in enumerate(headers):
-        worksheet.write(0, col, header)
-    
-    # Add data
-    alarms = Alarm.objects.select_related('subject').order_by('-timestamp')
-    for row, alarm in enumerate(alarms, start=1):
-        worksheet.write(row, 0, alarm.timestamp.strftime('%Y-%m-%d'))
-        worksheet.write(row, 1, alarm.timestamp.strftime('%H:%M:%S'))
-        worksheet.write(row, 2, alarm.subject.name)
-        worksheet.write(row, 3, alarm.location or 'N/A')
-        worksheet.write(row, 4, 'Sent' if alarm.notification_sent else 'Failed')
-    
-    workbook.close()
+    # Spooled to a temporary file in constant-memory mode, then streamed back
+    output = tempfile.TemporaryFile()
+    exports.write_xlsx(exports.export_queryset(request.user), output)
     output.seek(0)
-    
-    response = HttpResponse(
-        output.read(),
+
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename='alarms.xlsx',
         content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
     )
-    response['Content-Disposition'] = 'attachment; filename=alarms.xlsx'
-    return response
 
 @login_required
 def export_alarms_pdf(request):
     """Export alarms to PDF file"""
-    # Create response
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = 'attachment; filename=alarms.pdf'
-    
-    # Create PDF document
-    doc = SimpleDocTemplate(response, pagesize=letter)
-    elements = []
-    
-    # Add title
-    styles = getSampleStyleSheet()
-    elements.append(Paragraph('Alarm Report', styles['Title']))
-    
-    # Create table data
-    data = [['Date', 'Time', 'Subject', 'Location', 'Notification Status']]
-    alarms = Alarm.objects.select_related('subject').order_by('-timestamp')
-    
-    for alarm in alarms:
-        data.append([
-            alarm.timestamp.strftime('%Y-%m-%d'),
-            alarm.timestamp.strftime('%H:%M:%S'),
-            alarm.subject.name,
-            alarm.location or 'N/A',
-            'Sent' if alarm.notification_sent else 'Failed'
-        ])
-    
-    # Create table
-    table = Table(data)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 14),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 12),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    elements.append(table)
-    doc.build(elements)
+    alarms = exports.export_queryset(request.user)
+
+    # Large reports are built by a background job and downloaded when ready
+    if alarms.count() > getattr(settings, 'ALARM_EXPORT_PDF_SYNC_LIMIT', 5000):
+        export = AlarmExport.objects.create(
+            requested_by=request.user,
+            export_format=AlarmExport.FORMAT_PDF
+        )
+        transaction.on_commit(lambda: build_alarm_export.delay(export.id))
+        logger.info(f"Queued background PDF export {export.id} for {request.user}")
+
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            return JsonResponse({
+                'id': export.id,
+                'status': export.status,
+                'status_url': reverse('alarms:export_status', args=[export.id]),
+                'download_url': reverse('alarms:export_download', args=[export.id]),
+            }, status=202)
+        return redirect('alarms:export_download', pk=export.id)
+
+    output = tempfile.TemporaryFile()
+    exports.write_pdf(alarms, output)
+    output.seek(0)
+    return FileResponse(output, as_attachment=True, filename='alarms.pdf', content_type='application/pdf')
+
+@login_required
+def export_status(request, pk):
+    """Return the status of a background alarm export"""
+    export = get_object_or_404(AlarmExport, pk=pk, requested_by=request.user)
+    return JsonResponse({
+        'id': export.id,
+        'format': export.export_format,
+        'status': export.status,
+        'row_count': export.row_count,
+        'error': export.error,
+        'download_url': reverse('alarms:export_download', args=[export.id]) if export.is_ready else None,
+    })
+
+@login_required
+def export_download(request, pk):
+    """Download a background alarm export, or report that it is still being built"""
+    export = get_object_or_404(AlarmExport, pk=pk, requested_by=request.user)
+
+    if export.is_ready:
+        return FileResponse(
+            export.file.open('rb'),
+            as_attachment=True,
+            filename=f"alarms.{export.export_format}"
+        )
+
+    if export.status == AlarmExport.STATUS_FAILED:
+        return HttpResponse(f"Export failed: {export.error}", status=500, content_type='text/plain')
+
+    # Browsers reload the page until the file is ready
+    response = HttpResponse(
+        "Your export is being prepared. This page will refresh automatically.",
+        status=202,
+        content_type='text/plain'
+    )
+    response['Refresh'] = '5'
     return response
 
+@transaction.non_atomic_requests
 @staff_member_required
+@replica_reads()
 def admin_alarm_dashboard(request):
     """Admin view for system-wide alarm monitoring"""
-    alarms = Alarm.objects.all()
-    recent_alarms = alarms.filter(timestamp__gte=timezone.now() - timedelta(days=7))
+    metrics = dashboard_metrics()
+    recent_alarms = Alarm.objects.filter(timestamp__gte=timezone.now() - timedelta(days=7))
     
     # Get statistics
     stats = {
-        'total_alarms': alarms.count(),
-        'recent_alarms': recent_alarms.count(),
-        'notifications_sent': alarms.filter(notification_sent=True).count(),
-        'notifications_failed': alarms.filter(notification_sent=False).count(),
+        'total_alarms': metrics['total_alarms'],
+        'recent_alarms': metrics['alarms_last_7d'],
+        'notifications_sent': metrics['notifications_sent'],
+        'notifications_failed': metrics['notifications_failed'],
     }
     
     # Get recent alarms for display
@@ -348,8 +282,10 @@ def retry_notification(request, alarm_id):
         })
     
     try:
-        # Queue the notification task
-        send_whatsapp_notification.delay(alarm.id)
+        # Queue the notification task; manual retries don't jump ahead of new alarms
+        send_whatsapp_notification.apply_async(
+            (alarm.id,), queue=notification_queue(alarm.is_test, retry=True)
+        )
         
         return JsonResponse({
             'success': True,
@@ -361,14 +297,22 @@ def retry_notification(request, alarm_id):
             'error': str(e)
         })
 
-class AlarmViewSet(viewsets.ModelViewSet):
+class AlarmViewSet(ConditionalGetMixin, DeltaSyncMixin, viewsets.ModelViewSet):
     """ViewSet for viewing and editing alarms."""
     serializer_class = AlarmSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
         """Return alarms for the current user."""
-        return Alarm.objects.filter(subject__custodian__user=self.request.user)
+        return Alarm.objects.filter(custodian__user=self.request.user).select_related('subject').prefetch_related(
+            'notification_attempts'
+        )
+
+    def list(self, request, *args, **kwargs):
+        """List alarms from the replica; the serialized page is built inside the block."""
+        with replica_reads():
+            return super().list(request, *args, **kwargs)
     
     @action(detail=True, methods=['post'])
     def resolve(self, request, pk=None):
@@ -386,7 +330,7 @@ class NotificationAttemptViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Return notification attempts for the current user."""
-        return NotificationAttempt.objects.filter(alarm__subject__custodian__user=self.request.user)
+        return NotificationAttempt.objects.filter(custodian__user=self.request.user)
     
     @action(detail=True, methods=['post'])
     def mark_sent(self, request, pk=None):
@@ -406,168 +350,35 @@ class NotificationAttemptViewSet(viewsets.ModelViewSet):
 @csrf_exempt
 @require_POST
 def notification_webhook(request):
-    """Handle notification status updates from messaging services."""
+    """Validate WhatsApp status updates and queue them for the receipt consumer."""
     try:
         data = json.loads(request.body)
         logger.info(f"Received notification webhook: {data}")
-        
-        # Handle WhatsApp webhook
-        if 'entry' in data and data.get('object') == 'whatsapp_business_account':
-            for entry in data['entry']:
-                for change in entry.get('changes', []):
-                    if change.get('value', {}).get('messages'):
-                        message = change['value']['messages'][0]
-                        message_id = message.get('id')
-                        status = message.get('status', '').upper()
-                        
-                        # Find alarm by message ID
-                        try:
-                            alarm = Alarm.objects.get(whatsapp_message_id=message_id)
-                            
-                            # Update status based on webhook
-                            if status == 'SENT':
-                                alarm.notification_status = NotificationStatus.SENT
-                            elif status == 'DELIVERED':
-                                alarm.notification_status = NotificationStatus.DELIVERED
-                            elif status in ['FAILED', 'ERROR']:
-                                alarm.notification_status = NotificationStatus.FAILED
-                                alarm.notification_error = message.get('error', {}).get('message', 'Unknown error')
-                            
-                            alarm.save(update_fields=['notification_status', 'notification_error'])
-                            logger.info(f"Updated alarm {alarm.id} status to {status}")
-                            
-                        except Alarm.DoesNotExist:
-                            logger.error(f"No alarm found for message ID: {message_id}")
-        
-        # Handle Twilio webhook - This is now handled by twilio_status_callback
-        # We'll keep this as a fallback but log that it's being handled elsewhere
-        elif 'MessageSid' in data:
-            message_sid = data['MessageSid']
-            logger.info(f"Twilio webhook received in notification_webhook, but this is handled by twilio_status_callback. MessageSid: {message_sid}")
-            # No need to process this here as it's handled by twilio_status_callback
-        
+
+        # Twilio callbacks are handled by core.webhooks.twilio_status_callback
+        if isinstance(data, dict) and 'MessageSid' in data:
+            logger.info(f"Twilio webhook received in notification_webhook, but this is handled by twilio_status_callback. MessageSid: {data['MessageSid']}")
+            return JsonResponse({'status': 'success'})
+
+        enqueue_receipts(parse_meta(data))
         return JsonResponse({'status': 'success'})
-        
+
     except json.JSONDecodeError:
         logger.error("Invalid JSON in webhook request")
         return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    except ValueError as e:
+        logger.error(f"Invalid notification webhook: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         logger.error(f"Error processing webhook: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
 
-@csrf_exempt
-@require_POST
-def twilio_status_callback(request):
-    """Handle Twilio status callbacks for SMS/WhatsApp messages."""
-    try:
-        data = request.POST
-        logger.info(f"Received Twilio status callback: {data}")
-        
-        message_sid = data.get('MessageSid')
-        message_status = data.get('MessageStatus', '').upper()
-        to_number = data.get('To')
-        from_number = data.get('From')
-        error_code = data.get('ErrorCode')
-        error_message = data.get('ErrorMessage')
-        
-        # Find alarm by message SID
-        try:
-            alarm = Alarm.objects.get(message_sid=message_sid)
-            
-            # Update status based on callback
-            if message_status == 'SENT':
-                alarm.notification_status = NotificationStatus.SENT
-            elif message_status == 'DELIVERED':
-                alarm.notification_status = NotificationStatus.DELIVERED
-            elif message_status in ['FAILED', 'ERROR']:
-                alarm.notification_status = NotificationStatus.FAILED
-                alarm.notification_error = f"Error {error_code}: {error_message}"
-            
-            alarm.save(update_fields=['notification_status', 'notification_error'])
-            logger.info(f"Updated alarm {alarm.id} status to {message_status}")
-            
-        except Alarm.DoesNotExist:
-            logger.error(f"No alarm found for message SID: {message_sid}")
-        
-        return JsonResponse({'status': 'success'})
-        
-    except Exception as e:
-        logger.error(f"Error processing Twilio callback: {str(e)}")
-        return JsonResponse({'error': str(e)}, status=500)
-
+@transaction.non_atomic_requests
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional_on_changes(windowed=True)
 def alarm_statistics_api(request):
     """API endpoint for alarm statistics."""
     # Get time range from query parameters or default to last 30 days
     days = int(request.query_params.get('days', 30))
-    end_date = timezone.now()
-    start_date = end_date - timedelta(days=days)
-    
-    # Get all alarms for the user
-    alarms = Alarm.objects.filter(
-        subject__custodian__user=request.user,
-        timestamp__gte=start_date,
-        timestamp__lte=end_date
-    )
-    
-    # Calculate statistics
-    total_alarms = alarms.count()
-    recent_alarms = alarms.filter(timestamp__gte=end_date - timedelta(days=7)).count()
-    
-    # Subject statistics
-    subject_stats = alarms.values(
-        'subject__name', 
-        'subject__id'
-    ).annotate(
-        count=Count('id'),
-        last_alarm=models.Max('timestamp'),
-        notification_success_rate=models.Avg(
-            models.Case(
-                models.When(notification_status=NotificationStatus.DELIVERED, then=1),
-                default=0,
-                output_field=models.FloatField(),
-            )
-        )
-    )
-    
-    # Date statistics
-    date_stats = alarms.values(
-        'timestamp__date'
-    ).annotate(
-        count=Count('id'),
-        notifications_sent=Count('id', filter=models.Q(notification_status=NotificationStatus.SENT)),
-        notifications_failed=Count('id', filter=models.Q(notification_status=NotificationStatus.FAILED))
-    ).order_by('timestamp__date')
-    
-    # Hour statistics
-    hour_stats = alarms.values(
-        'timestamp__hour'
-    ).annotate(
-        count=Count('id')
-    ).order_by('timestamp__hour')
-    
-    # Notification statistics
-    notifications = {
-        'sent': alarms.filter(notification_status=NotificationStatus.SENT).count(),
-        'delivered': alarms.filter(notification_status=NotificationStatus.DELIVERED).count(),
-        'failed': alarms.filter(notification_status=NotificationStatus.FAILED).count(),
-        'pending': alarms.filter(notification_status=NotificationStatus.PENDING).count()
-    }
-    
-    # Time range
-    time_range = {
-        'start_date': start_date,
-        'end_date': end_date,
-        'days': days
-    }
-    
-    return Response({
-        'total_alarms': total_alarms,
-        'recent_alarms': recent_alarms,
-        'subject_stats': list(subject_stats),
-        'date_stats': list(date_stats),
-        'hour_stats': list(hour_stats),
-        'notifications': notifications,
-        'time_range': time_range
-    })
+    return Response(custodian_statistics(request.user, days))
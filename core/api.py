@@ -0,0 +1,151 @@
+"""
+Shared REST API building blocks.
+
+KeysetPagination pages a list by a (field, id) cursor instead of an offset, so
+every page is one indexed range scan no matter how deep the client is.
+DeltaPagination uses the same cursors over updated_at to hand mobile clients
+only the rows changed since their last sync. SparseFieldsetMixin lets clients
+ask for a subset of a serializer's fields with ?fields=.
+
+Deleted rows leave no tombstone, so a delta sync never reports them; clients
+drop them with an occasional full sync (see docs/api.md).
+"""
+
+import base64
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(value, pk):
+    raw = json.dumps([value.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the (datetime, id) in a cursor. Raises NotFound if it is not one."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, pk = json.loads(raw)
+        value = parse_datetime(value)
+        if value is None:
+            raise ValueError(cursor)
+        return value, int(pk)
+    except (ValueError, TypeError):
+        raise NotFound('Invalid cursor')
+
+
+class KeysetPagination(BasePagination):
+    """Newest-first pages ordered by (cursor_fields[0], id), continued with ?cursor=."""
+    cursor_fields = ('timestamp', 'id')
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    descending = True
+
+    def get_page_size(self, request):
+        default = getattr(settings, 'API_PAGE_SIZE', 50)
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, default))
+        except ValueError:
+            size = default
+        return max(1, min(size, getattr(settings, 'API_MAX_PAGE_SIZE', 200)))
+
+    def filter_queryset(self, queryset, request):
+        return queryset
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        field, pk_field = self.cursor_fields
+        op = 'lt' if self.descending else 'gt'
+        sign = '-' if self.descending else ''
+
+        queryset = self.filter_queryset(queryset, request).order_by(f'{sign}{field}', f'{sign}{pk_field}')
+        self.cursor = request.query_params.get(self.cursor_query_param) or None
+        if self.cursor:
+            value, pk = decode_cursor(self.cursor)
+            queryset = queryset.filter(
+                Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'{pk_field}__{op}': pk})
+            )
+
+        page_size = self.get_page_size(request)
+        page = list(queryset[:page_size + 1])
+        self.has_more = len(page) > page_size
+        page = page[:page_size]
+        self.next_cursor = encode_cursor(getattr(page[-1], field), getattr(page[-1], pk_field)) if page else None
+        return page
+
+    def get_next_link(self):
+        if not self.has_more:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+
+class DeltaPagination(KeysetPagination):
+    """
+    Rows changed after the ?since= cursor, oldest change first. Every response
+    carries the cursor to send next time; an empty ?since= starts from the
+    beginning. Rows changed in the last API_DELTA_SETTLE_SECONDS are held
+    back so a transaction that commits late cannot slip behind a cursor.
+    Deletions are not reported.
+    """
+    cursor_fields = ('updated_at', 'id')
+    cursor_query_param = 'since'
+    descending = False
+
+    def filter_queryset(self, queryset, request):
+        settle = timedelta(seconds=getattr(settings, 'API_DELTA_SETTLE_SECONDS', 5))
+        return queryset.filter(updated_at__lt=timezone.now() - settle)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'since': self.next_cursor or self.cursor or '',
+            'has_more': self.has_more,
+            'results': data,
+        })
+
+
+class SparseFieldsetMixin:
+    """Serialize only the comma-separated ?fields= of a GET request (id is always kept)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+        params = getattr(request, 'query_params', request.GET)
+        requested = {name.strip() for name in params.get('fields', '').split(',') if name.strip()}
+        if requested:
+            for name in set(self.fields) - requested - {'id'}:
+                self.fields.pop(name)
+
+
+class DeltaSyncMixin:
+    """Viewset mixin: list requests with ?since= are answered with DeltaPagination."""
+    delta_pagination_class = DeltaPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            delta = self.action == 'list' and 'since' in self.request.query_params
+            pagination_class = self.delta_pagination_class if delta else self.pagination_class
+            self._paginator = pagination_class() if pagination_class else None
+        return self._paginator
+
+
+def paginate(request, queryset, serializer_class, pagination_class=KeysetPagination):
+    """Paginated (or, with ?since=, delta) response for function-based list views."""
+    paginator = DeltaPagination() if 'since' in request.query_params else pagination_class()
+    page = paginator.paginate_queryset(queryset, request)
+    serializer = serializer_class(page, many=True, context={'request': request})
+    return paginator.get_paginated_response(serializer.data)
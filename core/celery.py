@@ -16,28 +16,60 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
 
-# Define queues
+# Define queues, most urgent first: a worker started without --queues consumes them
+# in this order. Alarm work is split by priority (see alarms.queues)
 app.conf.task_queues = (
-    Queue('default', Exchange('default'), routing_key='default'),
+    Queue('alarms_urgent', Exchange('alarms_urgent'), routing_key='alarms_urgent'),
     Queue('alarms', Exchange('alarms'), routing_key='alarms'),
+    Queue('alarms_retry', Exchange('alarms_retry'), routing_key='alarms_retry'),
+    Queue('alarms_test', Exchange('alarms_test'), routing_key='alarms_test'),
+    Queue('default', Exchange('default'), routing_key='default'),
     Queue('subjects', Exchange('subjects'), routing_key='subjects'),
+    Queue('maintenance', Exchange('maintenance'), routing_key='maintenance'),
 )
 
-# Configure task routing
-app.conf.task_routes = {
-    'alarms.tasks.*': {'queue': 'alarms'},
-    'subjects.tasks.*': {'queue': 'subjects'},
-}
+# Configure task routing: the alarm router first, then the per-app defaults
+app.conf.task_routes = (
+    'alarms.queues.route_task',
+    {
+        'alarms.tasks.*': {'queue': 'alarms'},
+        'subjects.tasks.*': {'queue': 'subjects'},
+    },
+)
 
 # Configure periodic tasks
 app.conf.beat_schedule = {
     'process-pending-alarms': {
         'task': 'alarms.tasks.process_pending_alarms',
-        'schedule': 60.0,  # Run every 60 seconds
+        'schedule': crontab(minute='*/15'),  # Safety net; retries run from the alarm scheduler
+    },
+    'dispatch-due-alarm-jobs': {
+        'task': 'alarms.tasks.dispatch_due_alarm_jobs',
+        'schedule': 10.0,  # Fallback for the run_alarm_scheduler process
+    },
+    'relay-notification-outbox': {
+        'task': 'alarms.tasks.relay_notification_outbox',
+        'schedule': 10.0,  # Fallback for the relay_outbox process
+    },
+    'apply-delivery-receipts': {
+        'task': 'alarms.tasks.apply_delivery_receipts',
+        'schedule': 10.0,  # Fallback for the consume_delivery_receipts process
+    },
+    'flush-qr-last-used': {
+        'task': 'subjects.tasks.flush_qr_last_used',
+        'schedule': 30.0,  # Write buffered scan timestamps every 30 seconds
+    },
+    'reconcile-alarm-rollups': {
+        'task': 'alarms.tasks.reconcile_alarm_rollups',
+        'schedule': crontab(minute='*/15'),  # Run every 15 minutes
     },
     'cleanup-old-alarms': {
         'task': 'alarms.tasks.cleanup_old_alarms',
         'schedule': crontab(hour=0, minute=0),  # Run daily at midnight
+    },
+    'cleanup-old-alarm-exports': {
+        'task': 'alarms.tasks.cleanup_old_alarm_exports',
+        'schedule': crontab(minute=30),  # Run hourly
     }
 }
 
@@ -54,9 +86,11 @@ app.conf.update(
     # Prevent duplicate task execution
     task_acks_late=True,  # Acknowledge tasks only after completion
     task_track_started=True,  # Track when tasks are started
-    task_default_rate_limit='30/m',  # Limit task execution rate
-    worker_prefetch_multiplier=1,  # Process one task at a time
-    worker_concurrency=1,  # Run only one worker process
+    worker_prefetch_multiplier=1,  # Reserve one task per pool slot
+    # Concurrency and pool are set per worker in supervisor/celery.conf
+
+    # Workers poll their queues in the order given instead of round robin
+    broker_transport_options={'queue_order_strategy': 'priority'},
 )
 
 @app.task(bind=True, ignore_result=True)
@@ -0,0 +1,142 @@
+"""
+Conditional GETs from per-custodian change versions.
+
+Alarm, subject and QR code writes bump a version for the owning custodian and
+for the system-wide staff scope (see core.receivers and alarms.transitions),
+after the write commits. Views wrapped with conditional_on_changes derive
+their ETag and Last-Modified from that version, the user and the URL, so an
+unchanged poll is answered with 304 Not Modified from one cache read, before
+the view builds or evaluates any queryset.
+
+Views over a rolling time window ("last 24 hours") change as time passes
+without any write, so they are decorated with conditional_on_changes(windowed=True)
+and their validators also roll over every CONDITIONAL_WINDOW_SECONDS.
+"""
+
+import hashlib
+import logging
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+logger = logging.getLogger(__name__)
+
+STAFF_SCOPE = 'staff'
+VERSION_KEY = 'change_version:{scope}'
+
+
+def custodian_scope(custodian_id):
+    return f"custodian:{custodian_id}"
+
+
+def _bump(custodian_ids):
+    version = time.time_ns() // 1000
+    scopes = {STAFF_SCOPE} | {custodian_scope(c) for c in custodian_ids if c is not None}
+    try:
+        cache.set_many({VERSION_KEY.format(scope=scope): version for scope in scopes}, timeout=None)
+    except Exception as e:
+        logger.warning(f"Could not bump change versions for {scopes}: {str(e)}")
+
+
+def record_change(*custodian_ids):
+    """Bump the change versions of custodians (and the staff scope) once the current transaction commits."""
+    ids = set(custodian_ids)
+    # Bumping before the commit could hand a concurrent reader the new version with the old data
+    transaction.on_commit(lambda: _bump(ids))
+
+
+def current_version(scope):
+    """Return the change version of a scope, starting one if it has none."""
+    key = VERSION_KEY.format(scope=scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns() // 1000, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _request_scope(request):
+    user = request.user
+    if user.is_staff:
+        return STAFF_SCOPE
+    try:
+        return custodian_scope(user.custodian.id)
+    except ObjectDoesNotExist:
+        return None
+
+
+def _window_start():
+    seconds = getattr(settings, 'CONDITIONAL_WINDOW_SECONDS', 60)
+    return int(time.time() // seconds * seconds)
+
+
+def conditional_response(request, render, windowed=False):
+    """
+    Return 304 if the client's copy is current, else render() with validators attached.
+    windowed views also expire the client's copy at each CONDITIONAL_WINDOW_SECONDS boundary.
+    """
+    if request.method not in ('GET', 'HEAD') or not request.user.is_authenticated:
+        return render()
+    try:
+        scope = _request_scope(request)
+        version = current_version(scope) if scope else None
+    except Exception as e:
+        logger.warning(f"Change versions unavailable, serving {request.path} unconditionally: {str(e)}")
+        version = None
+    if version is None:
+        return render()
+    settle = getattr(settings, 'API_DELTA_SETTLE_SECONDS', 5) * 1000000
+    if 'since' in request.GET and time.time_ns() // 1000 - version < settle:
+        # Delta syncs hold back unsettled changes, so the same version can still gain rows
+        return render()
+
+    validator = f"{request.user.pk}:{version}:{request.get_full_path()}:{request.META.get('HTTP_ACCEPT', '')}"
+    last_modified = version // 1000000
+    if windowed:
+        window = _window_start()
+        validator = f"{validator}:{window}"
+        last_modified = max(last_modified, window)
+    etag = quote_etag(hashlib.md5(validator.encode()).hexdigest())
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = render()
+        if response.status_code != 200:
+            return response
+    response.headers.setdefault('ETag', etag)
+    response.headers.setdefault('Last-Modified', http_date(last_modified))
+    # Clients keep the copy but revalidate it on every use
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Cookie', 'Authorization', 'Accept'))
+    return response
+
+
+def conditional_on_changes(view=None, windowed=False):
+    """
+    Decorate a view (or, with method_decorator, a viewset method) for conditional GETs.
+    Use conditional_on_changes(windowed=True) for views that count over a rolling time window.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            return conditional_response(request, lambda: view(request, *args, **kwargs), windowed)
+        return wrapper
+    return decorator(view) if view is not None else decorator
+
+
+class ConditionalGetMixin:
+    """Viewset mixin: list and retrieve answer unchanged polls with 304."""
+
+    def list(self, request, *args, **kwargs):
+        return conditional_response(request, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return conditional_response(
+            request, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs)
+        )
@@ -0,0 +1,114 @@
+"""
+Read-replica routing.
+
+Code that only reads aggregates or long lists (statistics, dashboard
+counters, exports, list endpoints) runs inside ``replica_reads()`` and its
+queries go to settings.REPLICA_DATABASE when that alias is configured. All
+other reads and every write stay on the primary, so alarm creation and
+notification state never see replication lag.
+
+Read-your-writes: once a request writes, the rest of it reads from the
+primary, and ReplicaStickinessMiddleware pins the user to the primary for
+REPLICA_STICKY_SECONDS so the next pages show what they just changed.
+"""
+
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+logger = logging.getLogger(__name__)
+
+_replica_reads = ContextVar('replica_reads', default=False)
+_request_state = ContextVar('replica_request_state', default=None)
+
+
+def replica_alias():
+    alias = getattr(settings, 'REPLICA_DATABASE', 'replica')
+    return alias if alias in settings.DATABASES else None
+
+
+def _pin_key(user_id):
+    return f"db_pin:user:{user_id}"
+
+
+def _is_pinned(state):
+    if state is None:
+        return False
+    if state['wrote']:
+        return True
+    if state['pinned'] is None:
+        user = getattr(state['request'], 'user', None)
+        try:
+            state['pinned'] = bool(user is not None and user.is_authenticated and cache.get(_pin_key(user.pk)))
+        except Exception as e:
+            # Without the pin we cannot promise read-your-writes, so stay on the primary
+            logger.warning(f"Could not check replica pin: {str(e)}")
+            state['pinned'] = True
+    return state['pinned']
+
+
+def read_database():
+    """Return the alias replica-eligible reads should use right now."""
+    alias = replica_alias()
+    if alias is None or _is_pinned(_request_state.get()):
+        return DEFAULT_DB_ALIAS
+    return alias
+
+
+@contextmanager
+def replica_reads():
+    """Send the reads in a block (or a view, used as @replica_reads()) to the replica."""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    """Routes reads inside replica_reads() to the replica and everything else to the primary."""
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get():
+            return read_database()
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != replica_alias()
+
+
+class ReplicaStickinessMiddleware:
+    """Tracks writes per request and pins users who wrote to the primary for a while."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = {'request': request, 'wrote': False, 'pinned': None}
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+
+        user = getattr(request, 'user', None)
+        if state['wrote'] and user is not None and user.is_authenticated and replica_alias():
+            try:
+                cache.set(_pin_key(user.pk), 1, getattr(settings, 'REPLICA_STICKY_SECONDS', 10))
+            except Exception as e:
+                logger.warning(f"Could not pin user {user.pk} to the primary database: {str(e)}")
+        return response
@@ -0,0 +1,188 @@
+"""
+Asynchronous message delivery engine.
+
+Provider calls run on a single background asyncio loop per process, using one
+keep-alive connection pool per provider and a per-provider concurrency limit.
+Synchronous callers (views, Celery tasks) submit coroutines and block on the
+results, so a worker can keep hundreds of sends in flight at once. Blocking
+calls made on the way (Redis rate limits and provider health, the console
+provider) run on the engine's own thread pool, sized by
+MESSAGE_DELIVERY_BLOCKING_THREADS, rather than on the loop's small default
+executor, so they don't cap the number of sends in flight.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import aiohttp
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+META_WHATSAPP = 'meta_whatsapp'
+TWILIO = 'twilio'
+
+DEFAULT_CONCURRENCY = {
+    META_WHATSAPP: 50,
+    TWILIO: 50,
+}
+
+
+class DeliveryEngine:
+    """Shared asyncio loop with pooled HTTP clients for every messaging provider."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._loop = None
+        self._thread = None
+        self._executor = None
+        self._sessions = {}
+        self._semaphores = {}
+        self._twilio_client = None
+
+    def _ensure_started(self):
+        """Start the loop thread, restarting it in forked children (Celery prefork)."""
+        with self._lock:
+            if self._loop is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._sessions = {}
+            self._semaphores = {}
+            self._twilio_client = None
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.blocking_threads(), thread_name_prefix='message-delivery-blocking'
+            )
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(
+                target=self._loop.run_forever,
+                name='message-delivery',
+                daemon=True
+            )
+            self._thread.start()
+            logger.info(f"Started message delivery loop in process {self._pid}")
+
+    def run(self, coro):
+        """Run a coroutine on the delivery loop and wait for its result."""
+        self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        return future.result()
+
+    def run_many(self, coros):
+        """Run several coroutines concurrently and return their results in order."""
+        coros = list(coros)
+        if not coros:
+            return []
+        return self.run(self._gather(coros))
+
+    async def _gather(self, coros):
+        return await asyncio.gather(*coros)
+
+    def run_each(self, coros):
+        """
+        Run several coroutines concurrently, yielding (index, result) on the
+        calling thread as each one finishes.
+        """
+        self._ensure_started()
+        futures = {asyncio.run_coroutine_threadsafe(coro, self._loop): index for index, coro in enumerate(coros)}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+    def concurrency(self, provider):
+        """Return the configured concurrency limit for a provider."""
+        limits = getattr(settings, 'MESSAGE_DELIVERY_CONCURRENCY', {})
+        return limits.get(provider, DEFAULT_CONCURRENCY.get(provider, 10))
+
+    def blocking_threads(self):
+        """Return the size of the pool for blocking calls: by default one thread per send in flight."""
+        default = sum(self.concurrency(provider) for provider in DEFAULT_CONCURRENCY)
+        return getattr(settings, 'MESSAGE_DELIVERY_BLOCKING_THREADS', None) or default
+
+    def limit(self, provider):
+        """Return the semaphore bounding in-flight requests for a provider."""
+        if provider not in self._semaphores:
+            self._semaphores[provider] = asyncio.Semaphore(self.concurrency(provider))
+        return self._semaphores[provider]
+
+    def session(self, provider):
+        """
+        Return the keep-alive HTTP session for a provider.
+        Must be called from a coroutine running on the delivery loop.
+        """
+        session = self._sessions.get(provider)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.concurrency(provider),
+                keepalive_timeout=getattr(settings, 'MESSAGE_DELIVERY_KEEPALIVE', 60),
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=getattr(settings, 'MESSAGE_DELIVERY_TIMEOUT', 15)),
+            )
+            self._sessions[provider] = session
+        return session
+
+    def twilio_client(self):
+        """
+        Return the shared async Twilio REST client, or None without credentials.
+        Must be called from a coroutine running on the delivery loop.
+        """
+        if not settings.TWILIO_ACCOUNT_SID or not settings.TWILIO_AUTH_TOKEN:
+            return None
+        if self._twilio_client is None:
+            from twilio.rest import Client
+            from twilio.http.async_http_client import AsyncTwilioHttpClient
+
+            timeout = getattr(settings, 'MESSAGE_DELIVERY_TIMEOUT', 15)
+            http_client = AsyncTwilioHttpClient(pool_connections=False, timeout=timeout)
+            http_client.session = self.session(TWILIO)
+            # The client passes timeout=None on every request, which would lift the session's timeout
+            request = http_client.request
+
+            async def request_with_timeout(*args, timeout=None, **kwargs):
+                return await request(*args, timeout=timeout or http_client.timeout, **kwargs)
+
+            http_client.request = request_with_timeout
+            self._twilio_client = Client(
+                settings.TWILIO_ACCOUNT_SID,
+                settings.TWILIO_AUTH_TOKEN,
+                http_client=http_client
+            )
+        return self._twilio_client
+
+    async def call_sync(self, func, *args):
+        """Run a blocking call (Redis, the console provider) on the engine's thread pool, off the loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def _close(self):
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions = {}
+        self._twilio_client = None
+
+    def close(self):
+        """Close all pooled sessions and stop the delivery loop."""
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                return
+            loop = self._loop
+            asyncio.run_coroutine_threadsafe(self._close(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            self._thread.join()
+            loop.close()
+            self._executor.shutdown(wait=False)
+            self._loop = None
+            self._thread = None
+            self._executor = None
+
+
+_engine = DeliveryEngine()
+
+
+def get_delivery_engine():
+    """Return the process-wide delivery engine."""
+    return _engine
@@ -0,0 +1,134 @@
+from django.core.management.base import BaseCommand
+from core.sqlite import apply_pragmas, sqlite_pragmas
+import sqlite3
+import tempfile
+import threading
+import time
+import os
+
+
+class Command(BaseCommand):
+    help = 'Compares alarm write and dashboard read throughput with the old and the tuned SQLite profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds each profile runs')
+        parser.add_argument('--readers', type=int, default=4, help='Concurrent dashboard readers')
+        parser.add_argument('--writers', type=int, default=2, help='Concurrent alarm writers')
+        parser.add_argument('--rows', type=int, default=20000, help='Alarms seeded before the run')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'profile':<10}{'reads/s':>10}{'writes/s':>10}{'p99 write ms':>14}{'lock errors':>13}")
+        for profile in ('baseline', 'tuned'):
+            with tempfile.TemporaryDirectory() as directory:
+                result = self._run(os.path.join(directory, 'bench.sqlite3'), profile == 'tuned', options)
+            self.stdout.write(
+                f"{profile:<10}{result['reads']:>10.0f}{result['writes']:>10.0f}"
+                f"{result['p99_write_ms']:>14.1f}{result['errors']:>13}"
+            )
+
+    def _connect(self, path, tuned):
+        connection = sqlite3.connect(path, timeout=20, isolation_level=None, check_same_thread=False)
+        if tuned:
+            apply_pragmas(connection.cursor(), sqlite_pragmas())
+        return connection
+
+    def _seed(self, path, tuned, rows):
+        connection = self._connect(path, tuned)
+        connection.execute(
+            "CREATE TABLE alarm (id INTEGER PRIMARY KEY, subject_id INTEGER, status TEXT, timestamp REAL)"
+        )
+        connection.execute("CREATE INDEX alarm_timestamp ON alarm (timestamp)")
+        now = time.time()
+        connection.execute("BEGIN")
+        connection.executemany(
+            "INSERT INTO alarm (subject_id, status, timestamp) VALUES (?, ?, ?)",
+            ((i % 500, 'DELIVERED', now - i) for i in range(rows))
+        )
+        connection.execute("COMMIT")
+        connection.close()
+
+    def _run(self, path, tuned, options):
+        """
+        Baseline: a new connection per request and, as with ATOMIC_REQUESTS,
+        a transaction around every read. Tuned: persistent connections with
+        the SQLite pragma profile and autocommit reads.
+        """
+        self._seed(path, tuned, options['rows'])
+        deadline = time.monotonic() + options['duration']
+        lock = threading.Lock()
+        stats = {'reads': 0, 'writes': 0, 'errors': 0, 'latencies': []}
+
+        def reader():
+            persistent = self._connect(path, tuned) if tuned else None
+            reads = errors = 0
+            while time.monotonic() < deadline:
+                connection = persistent or self._connect(path, tuned)
+                try:
+                    if not tuned:
+                        connection.execute("BEGIN")
+                    connection.execute(
+                        "SELECT status, COUNT(*) FROM alarm WHERE timestamp > ? GROUP BY status",
+                        (time.time() - 86400,)
+                    ).fetchall()
+                    connection.execute("SELECT * FROM alarm ORDER BY timestamp DESC LIMIT 10").fetchall()
+                    if not tuned:
+                        connection.execute("COMMIT")
+                    reads += 1
+                except sqlite3.OperationalError:
+                    errors += 1
+                finally:
+                    if persistent is None:
+                        connection.close()
+            if persistent is not None:
+                persistent.close()
+            with lock:
+                stats['reads'] += reads
+                stats['errors'] += errors
+
+        def writer(worker):
+            persistent = self._connect(path, tuned) if tuned else None
+            writes = errors = 0
+            latencies = []
+            while time.monotonic() < deadline:
+                connection = persistent or self._connect(path, tuned)
+                started = time.perf_counter()
+                try:
+                    connection.execute("BEGIN IMMEDIATE")
+                    connection.execute(
+                        "INSERT INTO alarm (subject_id, status, timestamp) VALUES (?, 'PENDING', ?)",
+                        (worker, time.time())
+                    )
+                    connection.execute("COMMIT")
+                    latencies.append(time.perf_counter() - started)
+                    writes += 1
+                except sqlite3.OperationalError:
+                    errors += 1
+                    if connection.in_transaction:
+                        connection.execute("ROLLBACK")
+                finally:
+                    if persistent is None:
+                        connection.close()
+            if persistent is not None:
+                persistent.close()
+            with lock:
+                stats['writes'] += writes
+                stats['errors'] += errors
+                stats['latencies'].extend(latencies)
+
+        threads = [threading.Thread(target=reader) for _ in range(options['readers'])]
+        threads += [threading.Thread(target=writer, args=(i,)) for i in range(options['writers'])]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        latencies = sorted(stats['latencies'])
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000 if latencies else 0.0
+        return {
+            'reads': stats['reads'] / elapsed,
+            'writes': stats['writes'] / elapsed,
+            'p99_write_ms': p99,
+            'errors': stats['errors'],
+        }
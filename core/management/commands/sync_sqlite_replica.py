@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+import logging
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Copies the primary SQLite database into the replica file, as a local stand-in for replication'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Seconds between copies; copy once and exit when 0')
+
+    def handle(self, *args, **options):
+        alias = getattr(settings, 'REPLICA_DATABASE', 'replica')
+        replica = settings.DATABASES.get(alias)
+        primary = settings.DATABASES['default']
+        if replica is None:
+            raise CommandError(f'No "{alias}" database configured; set DATABASE_REPLICA_URL')
+        if 'sqlite3' not in primary['ENGINE'] or 'sqlite3' not in replica['ENGINE']:
+            raise CommandError('Both databases must be SQLite files')
+
+        while True:
+            started = time.monotonic()
+            source = sqlite3.connect(str(primary['NAME']))
+            target = sqlite3.connect(str(replica['NAME']))
+            try:
+                # The online backup API copies a consistent snapshot while writers continue
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+            logger.info(f"Copied primary database to replica in {time.monotonic() - started:.2f}s")
+            if not options['interval']:
+                self.stdout.write(self.style.SUCCESS(f'Replica {replica["NAME"]} is up to date'))
+                return
+            time.sleep(options['interval'])
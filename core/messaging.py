@@ -1,14 +1,16 @@
-import os
+import asyncio
+import time
 from enum import Enum
-from twilio.rest import Client
 from django.conf import settings
-from .models import SystemParameter
-from notifications.providers import get_notification_service
+from django.core.mail import send_mail
+from .parameters import system_parameters
+from . import delivery, provider_health, rate_limit
+from .delivery import get_delivery_engine
+from notifications.providers import get_whatsapp_provider
 import logging
-from twilio.base.exceptions import TwilioRestException
-from alarms.models import Alarm, NotificationStatus
+from alarms.models import Alarm, NotificationChannel, NotificationStatus
+from alarms.transitions import transition
 from django.utils import timezone
-from django.db import transaction
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +19,17 @@ class MessageChannel(Enum):
     TWILIO_WHATSAPP = "2"  # Twilio WhatsApp
     TWILIO_SMS = "3"  # Twilio SMS
 
+    @property
+    def provider(self):
+        """Name the channel's health and circuit breaker are kept under."""
+        return self.name.lower()
+
+WHATSAPP_CHANNELS = (MessageChannel.META_WHATSAPP, MessageChannel.TWILIO_WHATSAPP)
+
+# Provider error codes that mean "slow down": for the whole account, or for one recipient
+ACCOUNT_THROTTLE_CODES = {'4', '80007', '130429', '20429', '63018'}
+RECIPIENT_THROTTLE_CODES = {'131056'}
+
 def format_phone_number(phone_number: str, channel: MessageChannel) -> str:
     """
     Format phone number according to the channel requirements.
@@ -35,44 +48,32 @@ def format_message(message: str) -> str:
     return formatted_message
 
 class MessageService:
+    """
+    Send messages over the configured channel.
+
+    Provider calls go through the process-wide delivery engine, which keeps one
+    pooled keep-alive client per provider. Alarm bookkeeping happens on the
+    calling thread once the sends have completed.
+    """
+
     def __init__(self):
-        self.twilio_client = None
-        self.whatsapp_provider = get_notification_service()
-        self._initialize_twilio()
-    
-    def _initialize_twilio(self):
-        """Initialize Twilio client if credentials are available"""
-        account_sid = settings.TWILIO_ACCOUNT_SID
-        auth_token = settings.TWILIO_AUTH_TOKEN
-        
-        if not account_sid or not auth_token:
-            logger.error("Twilio credentials not configured")
-            return
-            
-        try:
-            # Initialize client using standard method
-            self.twilio_client = Client(account_sid, auth_token)
-            logger.info("Twilio client initialized")
-        except Exception as e:
-            logger.error(f"Failed to initialize Twilio client: {str(e)}")
-            self.twilio_client = None
-    
-    def _send_twilio_whatsapp(self, to_number: str, message: str, alarm: Alarm = None) -> dict:
+        self.engine = get_delivery_engine()
+        # The Meta channel is also a failover candidate and fan-out route when another channel is configured
+        self.whatsapp_provider = get_whatsapp_provider()
+
+    def _get_channel(self):
+        """Return the configured MessageChannel, or None if it isn't set."""
+        channel = system_parameters.get('channel')
+        if channel is None:
+            logger.warning("No notification channel configured, defaulting to Twilio SMS")
+            return None
+        return MessageChannel(channel)
+
+    async def _send_twilio_whatsapp(self, to_number: str, message: str) -> dict:
         """Send WhatsApp message using Twilio"""
-        if not self.twilio_client:
-            error_msg = "Twilio client not initialized"
-            if alarm:
-                alarm.notification_status = NotificationStatus.ERROR
-                alarm.notification_error = error_msg
-                alarm.notification_attempt_count += 1
-                alarm.last_attempt = timezone.now()
-                alarm.save(update_fields=[
-                    'notification_status',
-                    'notification_error',
-                    'notification_attempt_count',
-                    'last_attempt'
-                ])
-            return {"status": "error", "error": error_msg, "channel": "twilio_whatsapp"}
+        client = self.engine.twilio_client()
+        if not client:
+            return {"status": "error", "error": "Twilio client not initialized", "channel": "twilio_whatsapp"}
         
         try:
             formatted_number = format_phone_number(to_number, MessageChannel.TWILIO_WHATSAPP)
@@ -82,139 +83,74 @@ class MessageService:
             # Format message to match Meta API style
             formatted_message = format_message(message)
             
-            message = self.twilio_client.messages.create(
-                body=formatted_message,
-                from_=wa_from,
-                to=wa_to,
-                status_callback=settings.TWILIO_STATUS_CALLBACK_URL
-            )
-            
-            # Update alarm status if provided
-            if alarm:
-                alarm.notification_status = NotificationStatus.PROCESSING
-                alarm.message_sid = message.sid
-                alarm.last_attempt = timezone.now()
-                alarm.notification_attempt_count += 1
-                alarm.notification_error = None
-                alarm.save(update_fields=[
-                    'notification_status',
-                    'message_sid',
-                    'last_attempt',
-                    'notification_attempt_count',
-                    'notification_error'
-                ])
+            async with self.engine.limit(delivery.TWILIO):
+                sent = await client.messages.create_async(
+                    body=formatted_message,
+                    from_=wa_from,
+                    to=wa_to,
+                    status_callback=settings.TWILIO_STATUS_CALLBACK_URL
+                )
             
             return {
                 "status": "success",
-                "message_sid": message.sid,
-                "to": message.to,
-                "from": message.from_,
-                "body": message.body,
+                "message_sid": sent.sid,
+                "to": sent.to,
+                "from": sent.from_,
+                "body": sent.body,
                 "channel": "twilio_whatsapp"
             }
         except Exception as e:
-            error_msg = str(e)
-            if alarm:
-                alarm.notification_status = NotificationStatus.ERROR
-                alarm.notification_error = error_msg
-                alarm.notification_attempt_count += 1
-                alarm.last_attempt = timezone.now()
-                alarm.save(update_fields=[
-                    'notification_status',
-                    'notification_error',
-                    'notification_attempt_count',
-                    'last_attempt'
-                ])
-            return {"status": "error", "error": error_msg, "channel": "twilio_whatsapp"}
+            return {
+                "status": "error",
+                "error": str(e),
+                "status_code": getattr(e, 'status', None),
+                "code": getattr(e, 'code', None),
+                "channel": "twilio_whatsapp"
+            }
     
-    def _send_twilio_sms(self, to_number: str, message: str, alarm: Alarm = None) -> dict:
+    async def _send_twilio_sms(self, to_number: str, message: str) -> dict:
         """
         Send SMS message using Twilio
         """
-        if not self.twilio_client:
+        client = self.engine.twilio_client()
+        if not client:
             error_msg = "Twilio client not initialized"
             logger.error(error_msg)
-            if alarm:
-                alarm.notification_status = NotificationStatus.ERROR
-                alarm.notification_error = error_msg
-                alarm.notification_attempt_count += 1
-                alarm.last_attempt = timezone.now()
-                alarm.save(update_fields=[
-                    'notification_status',
-                    'notification_error',
-                    'notification_attempt_count',
-                    'last_attempt'
-                ])
             return {"status": "error", "error": error_msg, "channel": "twilio_sms"}
             
         try:
             # Log the attempt
             logger.info(f"Attempting to send SMS to {to_number}")
             
-            # Send message using Twilio client
-            message = self.twilio_client.messages.create(
-                body=message,
-                from_=settings.TWILIO_PHONE_NUMBER,
-                to=to_number,
-                status_callback=settings.TWILIO_STATUS_CALLBACK_URL
-            )
+            async with self.engine.limit(delivery.TWILIO):
+                sent = await client.messages.create_async(
+                    body=message,
+                    from_=settings.TWILIO_PHONE_NUMBER,
+                    to=to_number,
+                    status_callback=settings.TWILIO_STATUS_CALLBACK_URL
+                )
             
             # Log success
-            logger.info(f"Successfully queued SMS. Message SID: {message.sid}")
-            
-            # Update alarm status if provided
-            if alarm:
-                # Use transaction to ensure atomic update
-                with transaction.atomic():
-                    # Get alarm with lock to prevent race conditions
-                    alarm = Alarm.objects.select_for_update().get(id=alarm.id)
-                    
-                    # Set initial status to PENDING (will be updated by webhook)
-                    alarm.notification_status = NotificationStatus.PENDING
-                    alarm.message_sid = message.sid
-                    alarm.last_attempt = timezone.now()
-                    alarm.notification_attempt_count += 1
-                    alarm.notification_error = None
-                    alarm.save(update_fields=[
-                        'notification_status',
-                        'message_sid',
-                        'last_attempt',
-                        'notification_attempt_count',
-                        'notification_error'
-                    ])
-                
-                logger.info(f"Updated alarm {alarm.id} with message_sid {message.sid} and status {NotificationStatus.PENDING}")
+            logger.info(f"Successfully queued SMS. Message SID: {sent.sid}")
             
             return {
                 "status": "success",
-                "message_id": message.sid,
+                "message_id": sent.sid,
                 "channel": "twilio_sms"
             }
             
-        except TwilioRestException as e:
+        except Exception as e:
             error_msg = f"Twilio SMS error: {str(e)}"
             logger.error(error_msg)
-            
-            # Update alarm status to error if provided
-            if alarm:
-                alarm.notification_status = NotificationStatus.ERROR
-                alarm.notification_error = error_msg
-                alarm.notification_attempt_count += 1
-                alarm.last_attempt = timezone.now()
-                alarm.save(update_fields=[
-                    'notification_status',
-                    'notification_error',
-                    'notification_attempt_count',
-                    'last_attempt'
-                ])
-                
             return {
                 "status": "error",
                 "error": error_msg,
+                "status_code": getattr(e, 'status', None),
+                "code": getattr(e, 'code', None),
                 "channel": "twilio_sms"
             }
     
-    def _send_meta_whatsapp(self, to_number: str, message: str, alarm: Alarm = None) -> dict:
+    async def _send_meta_whatsapp(self, to_number: str, message: str) -> dict:
         """
         Send WhatsApp message using Meta API.
         This method uses the WhatsAppAPIProvider implementation.
@@ -232,29 +168,18 @@ class MessageService:
                 'timestamp': 'now'  # You might want to pass this as a parameter
             }
             
-            # Update alarm status to processing before sending
-            if alarm:
-                alarm.notification_status = NotificationStatus.PROCESSING
-                alarm.last_attempt = timezone.now()
-                alarm.notification_attempt_count += 1
-                alarm.notification_error = None
-                alarm.save(update_fields=[
-                    'notification_status',
-                    'last_attempt',
-                    'notification_attempt_count',
-                    'notification_error'
-                ])
-            
-            result = self.whatsapp_provider.send_message(formatted_number, message_data)
-            
-            # Update alarm with message ID if successful
-            if alarm and result.get('success'):
-                alarm.whatsapp_message_id = result.get('message_id')
-                alarm.save(update_fields=['whatsapp_message_id'])
-            elif alarm:
-                alarm.notification_status = NotificationStatus.ERROR
-                alarm.notification_error = result.get('error', 'Unknown error')
-                alarm.save(update_fields=['notification_status', 'notification_error'])
+            async with self.engine.limit(delivery.META_WHATSAPP):
+                if hasattr(self.whatsapp_provider, 'send_message_async'):
+                    result = await self.whatsapp_provider.send_message_async(
+                        self.engine.session(delivery.META_WHATSAPP),
+                        formatted_number,
+                        message_data
+                    )
+                else:
+                    # Development providers (console) only implement the blocking API
+                    result = await self.engine.call_sync(
+                        self.whatsapp_provider.send_message, formatted_number, message_data
+                    )
             
             return {
                 "status": "success" if result.get('success') else "error",
@@ -264,46 +189,234 @@ class MessageService:
                 "meta_result": result
             }
         except Exception as e:
-            error_msg = str(e)
-            if alarm:
-                alarm.notification_status = NotificationStatus.ERROR
-                alarm.notification_error = error_msg
-                alarm.notification_attempt_count += 1
-                alarm.last_attempt = timezone.now()
-                alarm.save(update_fields=[
-                    'notification_status',
-                    'notification_error',
-                    'notification_attempt_count',
-                    'last_attempt'
-                ])
-            return {"status": "error", "error": error_msg, "channel": "meta_whatsapp"}
-    
-    def send_message(self, to_number: str, message: str, alarm: Alarm = None) -> dict:
+            return {"status": "error", "error": str(e), "channel": "meta_whatsapp"}
+
+    async def _send_email(self, to_email: str, subject: str, message: str) -> dict:
+        """Send an email through the configured Django email backend"""
+        try:
+            sent = await self.engine.call_sync(
+                lambda: send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [to_email])
+            )
+            if not sent:
+                return {"status": "error", "error": "Email backend did not send the message", "channel": "email"}
+            return {"status": "success", "to": to_email, "channel": "email"}
+        except Exception as e:
+            return {"status": "error", "error": str(e), "channel": "email"}
+
+    def _route_channel(self, channel, configured):
+        """Return the MessageChannel a NotificationChannel is sent over."""
+        if channel == NotificationChannel.SMS:
+            return MessageChannel.TWILIO_SMS
+        if configured == MessageChannel.TWILIO_WHATSAPP:
+            return configured
+        return MessageChannel.META_WHATSAPP
+
+    async def _send_route(self, route: dict, configured, should_send) -> dict:
+        """Send one fan-out route, after its head start unless should_send() says otherwise."""
+        if route.get('delay'):
+            await asyncio.sleep(route['delay'])
+            if should_send is not None and not await self.engine.call_sync(should_send):
+                return {"status": "cancelled", "channel": route['channel']}
+
+        started = time.monotonic()
+        if route['channel'] == NotificationChannel.EMAIL:
+            result = await self._send_email(route['to'], route.get('subject', ''), route['message'])
+        else:
+            channel = self._route_channel(route['channel'], configured)
+            # A route may fail over between WhatsApp providers, but not to SMS, which has its own route
+            fallbacks = WHATSAPP_CHANNELS if channel in WHATSAPP_CHANNELS else ()
+            result = await self._send_with_failover(
+                self._failover_candidates(channel, fallbacks), route['to'], route['message']
+            )
+        result['latency_ms'] = int((time.monotonic() - started) * 1000)
+        return result
+
+    def send_routes(self, routes, should_send=None, on_result=None) -> list:
         """
-        Send message using the configured channel from SystemParameter
+        Send one message over several routes concurrently.
+
+        ``routes`` is an iterable of dicts with ``channel`` (a NotificationChannel),
+        ``to``, ``message`` and optional ``subject`` (email) and ``delay`` (seconds).
+        Delayed routes are skipped with a ``cancelled`` result if ``should_send()``
+        returns False once their delay has passed. ``on_result(index, result)`` is
+        called on the calling thread as soon as each route finishes, while later
+        routes may still be waiting. Returns one result dict per route, in order,
+        each with the provider call's ``latency_ms``.
         """
+        routes = list(routes)
+        if not routes:
+            return []
+
         try:
-            # Get the configured channel from SystemParameter
-            channel_param = SystemParameter.objects.get(parameter='channel')
-            channel = MessageChannel(channel_param.value)
-            
-            # Format message
-            formatted_message = format_message(message)
-            
-            # Send message using the appropriate channel
-            if channel == MessageChannel.TWILIO_SMS:
-                return self._send_twilio_sms(to_number, formatted_message, alarm)
-            elif channel == MessageChannel.TWILIO_WHATSAPP:
-                return self._send_twilio_whatsapp(to_number, formatted_message, alarm)
-            elif channel == MessageChannel.META_WHATSAPP:
-                return self._send_meta_whatsapp(to_number, formatted_message, alarm)
-            else:
-                return {"status": "error", "error": f"Unsupported channel: {channel}"}
-                
-        except SystemParameter.DoesNotExist:
+            configured = self._get_channel()
+        except Exception as e:
+            logger.error(f"Error reading notification channel: {str(e)}")
+            configured = None
+
+        results = [None] * len(routes)
+        for index, result in self.engine.run_each(self._send_route(route, configured, should_send) for route in routes):
+            results[index] = result
+            if on_result is not None:
+                on_result(index, result)
+        return results
+
+    def _is_configured(self, channel) -> bool:
+        """Return whether the credentials a channel needs are set."""
+        if channel == MessageChannel.META_WHATSAPP:
+            return getattr(settings, 'NOTIFICATION_PROVIDER', None) == 'console' or bool(settings.WHATSAPP_ACCESS_TOKEN)
+        number = settings.TWILIO_WHATSAPP_NUMBER if channel == MessageChannel.TWILIO_WHATSAPP else settings.TWILIO_PHONE_NUMBER
+        return bool(settings.TWILIO_ACCOUNT_SID and settings.TWILIO_AUTH_TOKEN and number)
+
+    def _failover_candidates(self, preferred, fallbacks) -> list:
+        """Return preferred and the configured fallbacks, or just preferred if none is configured."""
+        candidates = []
+        for channel in (preferred, *fallbacks):
+            if channel not in candidates and self._is_configured(channel):
+                candidates.append(channel)
+        return candidates or [preferred]
+
+    async def _send_with_failover(self, candidates, to_number: str, message: str) -> dict:
+        """
+        Send over the healthiest of the candidate channels, failing over to the
+        next on error. Every call's outcome and latency feed the shared provider
+        health (core.provider_health) that ranks and trips them.
+        """
+        by_provider = {channel.provider: channel for channel in candidates}
+        ranked = await self.engine.call_sync(provider_health.rank, list(by_provider))
+
+        result = None
+        for position, provider in enumerate(ranked):
+            channel = by_provider[provider]
+            # The last candidate waits longer for its token; the others fail over quickly
+            if not await self._take_token(channel, to_number, last=position == len(ranked) - 1):
+                result = {"status": "error", "error": f"{provider} rate limit reached", "channel": provider}
+                continue
+
+            started = time.monotonic()
+            result = await self._send(channel, to_number, message)
+            scope = self._throttle_scope(result)
+            if scope:
+                # A 429 says nothing about the provider's health, only about our pace
+                await self.engine.call_sync(
+                    rate_limit.throttled, provider, self._account(channel),
+                    to_number if scope == 'recipient' else None
+                )
+                continue
+            ok = result.get('status') == 'success'
+            await self.engine.call_sync(provider_health.record, provider, ok, (time.monotonic() - started) * 1000)
+            if ok:
+                return result
+            logger.warning(f"Send to {to_number} over {provider} failed: {result.get('error')}")
+        return result
+
+    def _account(self, channel) -> str:
+        """Return the provider account a channel sends from, which its rate limits belong to."""
+        if channel == MessageChannel.META_WHATSAPP:
+            return settings.WHATSAPP_PHONE_NUMBER_ID or 'default'
+        return settings.TWILIO_ACCOUNT_SID or 'default'
+
+    async def _take_token(self, channel, to_number: str, last: bool) -> bool:
+        """
+        Take a rate-limit token for one send, waiting up to RATE_LIMIT_MAX_WAIT
+        seconds for it, or RATE_LIMIT_LAST_CANDIDATE_WAIT for the last provider
+        left. Returns False if no token came in time; the send then fails and
+        the alarm scheduler retries it.
+        """
+        if last:
+            max_wait = getattr(settings, 'RATE_LIMIT_LAST_CANDIDATE_WAIT', 30)
+        else:
+            max_wait = getattr(settings, 'RATE_LIMIT_MAX_WAIT', 5)
+        waited = 0
+        while True:
+            delay = await self.engine.call_sync(rate_limit.acquire, channel.provider, self._account(channel), to_number)
+            if delay <= 0:
+                return True
+            if waited + delay > max_wait:
+                return False
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def _throttle_scope(self, result: dict):
+        """Return 'account' or 'recipient' if a failed send was rate limited by the provider."""
+        if result.get('status') == 'success':
+            return None
+        meta_result = result.get('meta_result') if isinstance(result.get('meta_result'), dict) else {}
+        code = str(meta_result.get('code') or result.get('code') or '')
+        if code in RECIPIENT_THROTTLE_CODES:
+            return 'recipient'
+        if code in ACCOUNT_THROTTLE_CODES or 429 in (result.get('status_code'), meta_result.get('status_code')):
+            return 'account'
+        return None
+
+    def _send(self, channel, to_number: str, message: str):
+        """Return the send coroutine for a channel."""
+        if channel is None:
             # Default to Twilio SMS if no channel is configured
-            logger.warning("No notification channel configured, defaulting to Twilio SMS")
-            return self._send_twilio_sms(to_number, message, alarm)
+            return self._send_twilio_sms(to_number, message)
+        
+        # Format message
+        formatted_message = format_message(message)
+        
+        if channel == MessageChannel.TWILIO_SMS:
+            return self._send_twilio_sms(to_number, formatted_message)
+        elif channel == MessageChannel.TWILIO_WHATSAPP:
+            return self._send_twilio_whatsapp(to_number, formatted_message)
+        return self._send_meta_whatsapp(to_number, formatted_message)
+
+    def _record_attempt(self, alarm: Alarm, result: dict):
+        """Store the outcome of a send attempt on the alarm."""
+        fields = {'last_attempt': timezone.now()}
+        
+        if result.get('status') == 'success':
+            channel = result.get('channel')
+            # Twilio SMS stays PENDING until the status callback arrives
+            status = NotificationStatus.PENDING if channel == 'twilio_sms' else NotificationStatus.ACCEPTED
+            fields['notification_error'] = None
+            if channel == 'meta_whatsapp':
+                fields['whatsapp_message_id'] = result['meta_result'].get('message_id')
+            else:
+                fields['message_sid'] = result.get('message_sid') or result.get('message_id')
+        else:
+            status = NotificationStatus.ERROR
+            fields['notification_error'] = result.get('error') or (result.get('meta_result') or {}).get('error', 'Unknown error')
+        
+        transition(alarm, status, count_attempt=True, **fields)
+
+    def send_many(self, messages) -> list:
+        """
+        Send a batch of messages concurrently over the configured channel,
+        failing over to the other configured channels while it is unhealthy.
+
+        ``messages`` is an iterable of dicts with ``to_number``, ``message`` and an
+        optional ``alarm``. Returns one result dict per message, in order.
+        """
+        messages = list(messages)
+        if not messages:
+            return []
+        
+        try:
+            channel = self._get_channel()
         except Exception as e:
             logger.error(f"Error sending message: {str(e)}")
-            return {"status": "error", "error": str(e)} 
\ No newline at end of file
+            return [{"status": "error", "error": str(e)} for _ in messages]
+        
+        # Twilio SMS stays the default when no channel is configured
+        candidates = self._failover_candidates(channel or MessageChannel.TWILIO_SMS, list(MessageChannel))
+        results = self.engine.run_many(
+            self._send_with_failover(candidates, item['to_number'], item['message']) for item in messages
+        )
+        
+        for item, result in zip(messages, results):
+            alarm = item.get('alarm')
+            if alarm is not None:
+                try:
+                    self._record_attempt(alarm, result)
+                except Exception as e:
+                    logger.error(f"Error recording attempt for alarm {alarm.id}: {str(e)}")
+        return results
+
+    def send_message(self, to_number: str, message: str, alarm: Alarm = None) -> dict:
+        """
+        Send message using the configured channel from SystemParameter
+        """
+        return self.send_many([{'to_number': to_number, 'message': message, 'alarm': alarm}])[0]
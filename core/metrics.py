@@ -0,0 +1,95 @@
+"""
+Dashboard counters.
+
+Every counter for a scope (system-wide for staff, or one custodian) is computed
+with a single conditional aggregate() per table and cached under the scope for
+DASHBOARD_METRICS_TTL seconds. Saving or deleting a subject, QR code, alarm or
+custodian drops the affected scopes (see core.receivers).
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from alarms.models import Alarm
+from custodians.models import Custodian
+from subjects.models import Subject, SubjectQR
+from .conditional import STAFF_SCOPE, custodian_scope
+from .db_router import replica_reads
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = 'dashboard_metrics:{scope}'
+
+
+@replica_reads()
+def _compute(custodian_id=None):
+    """Run one aggregate per table for the scope."""
+    subjects = Subject.objects.all()
+    qrs = SubjectQR.objects.all()
+    alarms = Alarm.objects.all()
+    if custodian_id is not None:
+        subjects = subjects.filter(custodian_id=custodian_id)
+        qrs = qrs.filter(subject__custodian_id=custodian_id)
+        alarms = alarms.filter(custodian_id=custodian_id)
+
+    now = timezone.now()
+    metrics = {}
+    metrics.update(subjects.aggregate(
+        total_subjects=Count('id'),
+        active_subjects=Count('id', filter=Q(is_active=True)),
+    ))
+    metrics.update(qrs.aggregate(
+        total_qrs=Count('id'),
+        active_qrs=Count('id', filter=Q(is_active=True)),
+    ))
+    metrics.update(alarms.aggregate(
+        total_alarms=Count('id'),
+        alarms_last_24h=Count('id', filter=Q(timestamp__gte=now - timedelta(hours=24))),
+        alarms_last_7d=Count('id', filter=Q(timestamp__gte=now - timedelta(days=7))),
+        notifications_sent=Count('id', filter=Q(notification_sent=True)),
+    ))
+    metrics['notifications_failed'] = metrics['total_alarms'] - metrics['notifications_sent']
+
+    if custodian_id is None:
+        metrics['total_custodians'] = Custodian.objects.exclude(user__is_staff=True).count()
+    else:
+        metrics['total_custodians'] = 1
+    return metrics
+
+
+def dashboard_metrics(custodian_id=None):
+    """
+    Return the dashboard counters for one custodian, or system-wide when
+    custodian_id is None.
+    """
+    scope = STAFF_SCOPE if custodian_id is None else custodian_scope(custodian_id)
+    key = CACHE_KEY.format(scope=scope)
+    try:
+        metrics = cache.get(key)
+    except Exception as e:
+        logger.warning(f"Dashboard metrics cache unavailable: {str(e)}")
+        return _compute(custodian_id)
+
+    if metrics is None:
+        metrics = _compute(custodian_id)
+        try:
+            cache.set(key, metrics, getattr(settings, 'DASHBOARD_METRICS_TTL', 30))
+        except Exception as e:
+            logger.warning(f"Could not cache dashboard metrics: {str(e)}")
+    return metrics
+
+
+def invalidate_dashboard_metrics(custodian_id=None):
+    """Drop the cached counters for the system-wide scope and a custodian's scope."""
+    keys = [CACHE_KEY.format(scope=STAFF_SCOPE)]
+    if custodian_id is not None:
+        keys.append(CACHE_KEY.format(scope=custodian_scope(custodian_id)))
+    try:
+        cache.delete_many(keys)
+    except Exception as e:
+        logger.warning(f"Could not invalidate dashboard metrics: {str(e)}")
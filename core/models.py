@@ -27,8 +27,6 @@ class SystemParameter(models.Model):
 
     @classmethod
     def get_param(cls, param_name, default=None):
-        """Get parameter value by name"""
-        try:
-            return cls.objects.get(parameter=param_name).value
-        except cls.DoesNotExist:
-            return default 
\ No newline at end of file
+        """Get parameter value by name from the cached parameter store"""
+        from .parameters import system_parameters
+        return system_parameters.get(param_name, default) 
\ No newline at end of file
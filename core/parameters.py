@@ -0,0 +1,119 @@
+"""
+Cached access to SystemParameter values.
+
+All parameters are loaded with a single query and shared through the Redis
+cache under a version key. Each process keeps its own snapshot and only checks
+the version again after SYSTEM_PARAMETER_CHECK_INTERVAL seconds, so reads on
+the hot send path cost no queries. Saving or deleting a SystemParameter bumps
+the version (see core.receivers), which makes every process reload.
+"""
+
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import SystemParameter
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'system_parameters:version'
+VALUES_KEY = 'system_parameters:values:{version}'
+VALUES_TIMEOUT = 60 * 60 * 24  # Old versions expire on their own
+
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+
+
+class ParameterStore:
+    """Process-local, version-checked snapshot of all system parameters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._values = None
+        self._checked_at = 0.0
+
+    def _check_interval(self):
+        return getattr(settings, 'SYSTEM_PARAMETER_CHECK_INTERVAL', 5)
+
+    def _load_from_db(self):
+        return dict(SystemParameter.objects.values_list('parameter', 'value'))
+
+    def _refresh(self):
+        """Reload the snapshot if the shared version has moved on."""
+        try:
+            version = cache.get(VERSION_KEY)
+            if version is None:
+                version = uuid.uuid4().hex
+                if not cache.add(VERSION_KEY, version, None):
+                    version = cache.get(VERSION_KEY, version)
+
+            if version == self._version and self._values is not None:
+                return
+
+            values = cache.get(VALUES_KEY.format(version=version))
+            if values is None:
+                values = self._load_from_db()
+                cache.set(VALUES_KEY.format(version=version), values, VALUES_TIMEOUT)
+        except Exception as e:
+            # Redis unavailable: fall back to the database and retry the cache next time
+            logger.warning(f"System parameter cache unavailable, reading database: {str(e)}")
+            version = None
+            values = self._load_from_db()
+
+        self._version = version
+        self._values = values
+
+    def all(self):
+        """Return a dict of every parameter name to its raw string value."""
+        with self._lock:
+            now = time.monotonic()
+            if self._values is None or now - self._checked_at >= self._check_interval():
+                self._refresh()
+                self._checked_at = now
+            return self._values
+
+    def get(self, name, default=None):
+        """Return a parameter's raw string value."""
+        return self.all().get(name, default)
+
+    def get_int(self, name, default=None):
+        """Return a parameter as an int, or default if missing or invalid."""
+        value = self.get(name)
+        try:
+            return int(value) if value is not None else default
+        except ValueError:
+            logger.warning(f"System parameter {name}={value!r} is not an integer")
+            return default
+
+    def get_float(self, name, default=None):
+        """Return a parameter as a float, or default if missing or invalid."""
+        value = self.get(name)
+        try:
+            return float(value) if value is not None else default
+        except ValueError:
+            logger.warning(f"System parameter {name}={value!r} is not a number")
+            return default
+
+    def get_bool(self, name, default=False):
+        """Return a parameter as a bool ('1', 'true', 'yes' and 'on' are true)."""
+        value = self.get(name)
+        if value is None:
+            return default
+        return value.strip().lower() in TRUE_VALUES
+
+    def invalidate(self):
+        """Drop the local snapshot and publish a new version to other processes."""
+        with self._lock:
+            self._values = None
+            self._version = None
+        try:
+            cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+        except Exception as e:
+            logger.warning(f"Could not publish system parameter version: {str(e)}")
+
+
+system_parameters = ParameterStore()
@@ -0,0 +1,159 @@
+"""
+Shared health of messaging providers, with circuit breakers.
+
+Every send records its outcome and latency in a capped Redis list per
+provider, so all workers see the same rolling error rate and latency
+percentiles. A burst of failures (PROVIDER_BREAKER_FAILURES in a row, or an
+error rate of PROVIDER_BREAKER_ERROR_RATE over the window) opens the
+provider's circuit: it gets no traffic for PROVIDER_BREAKER_COOLDOWN seconds,
+after which a single send is let through as a probe. A successful probe closes
+the circuit, a failed one opens it again.
+
+rank() orders the providers that can carry a message: a provider due a probe
+first (the caller fails over if it fails), then closed circuits from the
+healthiest (lowest p90 latency, weighted by error rate) down, then open ones
+as a last resort.
+"""
+
+import logging
+
+from django.conf import settings
+
+from core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+SAMPLES_KEY = 'providers:{provider}:samples'
+FAILURES_KEY = 'providers:{provider}:failures'
+OPEN_KEY = 'providers:{provider}:open'
+TRIPPED_KEY = 'providers:{provider}:tripped'
+PROBE_KEY = 'providers:{provider}:probe'
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Samples left untouched this long are dropped, so stale history doesn't steer routing
+SAMPLES_TTL = 60 * 15
+
+
+def _window():
+    return getattr(settings, 'PROVIDER_HEALTH_WINDOW', 100)
+
+
+def _percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def _summarize(samples):
+    """Return (error rate, p50, p90, p99) of raw 'ok:latency' samples, or None without enough of them."""
+    if len(samples) < getattr(settings, 'PROVIDER_HEALTH_MIN_SAMPLES', 10):
+        return None
+    outcomes = [sample.decode().split(':') for sample in samples]
+    latencies = sorted(int(latency) for _, latency in outcomes)
+    error_rate = sum(1 for ok, _ in outcomes if ok == '0') / len(outcomes)
+    return error_rate, _percentile(latencies, 0.5), _percentile(latencies, 0.9), _percentile(latencies, 0.99)
+
+
+def stats(providers):
+    """Return {provider: {'state', 'samples', 'error_rate', 'p50', 'p90', 'p99'}} from one Redis round trip."""
+    pipe = get_redis().pipeline(transaction=False)
+    for provider in providers:
+        pipe.lrange(SAMPLES_KEY.format(provider=provider), 0, -1)
+        pipe.exists(OPEN_KEY.format(provider=provider))
+        pipe.exists(TRIPPED_KEY.format(provider=provider))
+    replies = pipe.execute()
+
+    result = {}
+    for position, provider in enumerate(providers):
+        samples, is_open, tripped = replies[position * 3:position * 3 + 3]
+        summary = _summarize(samples)
+        result[provider] = {
+            'state': OPEN if is_open else HALF_OPEN if tripped else CLOSED,
+            'samples': len(samples),
+            'error_rate': summary[0] if summary else None,
+            'p50': summary[1] if summary else None,
+            'p90': summary[2] if summary else None,
+            'p99': summary[3] if summary else None,
+        }
+    return result
+
+
+def _score(health):
+    """Lower is healthier; providers without enough samples score 0 so they get measured."""
+    if health['p90'] is None:
+        return 0
+    return health['p90'] / max(1 - health['error_rate'], 0.1)
+
+
+def rank(providers):
+    """
+    Order providers (given in preference order) for the next send. Open
+    circuits are only kept as a last resort, and a half-open provider is put
+    first only by the caller that wins its probe.
+    """
+    try:
+        health = stats(providers)
+        client = get_redis()
+        probing = []
+        closed = []
+        blocked = []
+        for provider in providers:
+            state = health[provider]['state']
+            if state == CLOSED:
+                closed.append(provider)
+            elif state == HALF_OPEN and client.set(
+                PROBE_KEY.format(provider=provider), 1, nx=True,
+                ex=getattr(settings, 'PROVIDER_BREAKER_COOLDOWN', 30)
+            ):
+                probing.append(provider)
+            else:
+                blocked.append(provider)
+        # sorted() is stable, so equally healthy providers keep their preference order
+        return probing + sorted(closed, key=lambda provider: _score(health[provider])) + blocked
+    except Exception as e:
+        logger.warning(f"Provider health unavailable, using preference order: {str(e)}")
+        return list(providers)
+
+
+def record(provider, ok, latency_ms):
+    """Record a send's outcome, opening or closing the provider's circuit as needed."""
+    try:
+        client = get_redis()
+        samples_key = SAMPLES_KEY.format(provider=provider)
+        pipe = client.pipeline(transaction=False)
+        pipe.lpush(samples_key, f"{int(bool(ok))}:{int(latency_ms)}")
+        pipe.ltrim(samples_key, 0, _window() - 1)
+        pipe.expire(samples_key, SAMPLES_TTL)
+        if ok:
+            # Any success, probe or not, closes the circuit
+            pipe.delete(FAILURES_KEY.format(provider=provider), TRIPPED_KEY.format(provider=provider),
+                        PROBE_KEY.format(provider=provider))
+            pipe.execute()
+            return
+
+        pipe.incr(FAILURES_KEY.format(provider=provider))
+        pipe.lrange(samples_key, 0, -1)
+        pipe.exists(TRIPPED_KEY.format(provider=provider))
+        *_, failures, samples, tripped = pipe.execute()
+
+        summary = _summarize(samples)
+        burst = failures >= getattr(settings, 'PROVIDER_BREAKER_FAILURES', 5)
+        erroring = summary is not None and summary[0] >= getattr(settings, 'PROVIDER_BREAKER_ERROR_RATE', 0.5)
+        if tripped or burst or erroring:
+            trip(provider)
+    except Exception as e:
+        logger.warning(f"Could not record health of provider {provider}: {str(e)}")
+
+
+def trip(provider):
+    """Open a provider's circuit for PROVIDER_BREAKER_COOLDOWN seconds."""
+    cooldown = getattr(settings, 'PROVIDER_BREAKER_COOLDOWN', 30)
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.set(OPEN_KEY.format(provider=provider), 1, ex=cooldown)
+    pipe.set(TRIPPED_KEY.format(provider=provider), 1)
+    # A recovered provider is judged on its sends after the probe, not on the burst that tripped it
+    pipe.delete(FAILURES_KEY.format(provider=provider), PROBE_KEY.format(provider=provider),
+                SAMPLES_KEY.format(provider=provider))
+    pipe.execute()
+    logger.warning(f"Opened circuit for provider {provider} for {cooldown}s")
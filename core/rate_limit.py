@@ -0,0 +1,148 @@
+"""
+Distributed token buckets for messaging providers.
+
+Every send takes a token from its provider account's bucket
+(PROVIDER_RATE_LIMITS) and from the bucket of the destination number on that
+account (RECIPIENT_RATE_LIMIT) in one Lua script, timed by the Redis clock,
+so any number of workers together stay within the provider's limits. When a
+provider still answers 429, throttled() halves the bucket's rate and blocks it
+for a backoff that doubles with each consecutive 429; the rate then recovers
+linearly over RATE_LIMIT_RECOVERY_SECONDS.
+"""
+
+import logging
+
+from django.conf import settings
+
+from core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+ACCOUNT_KEY = 'ratelimit:{provider}:{account}'
+RECIPIENT_KEY = 'ratelimit:{provider}:{account}:to:{destination}'
+
+# Buckets untouched this long are dropped; a full bucket and a missing one are the same
+BUCKET_TTL = 60 * 60
+
+# Shared prelude: the Redis clock and the rate factor a 429 left, recovered over time
+_NOW_AND_FACTOR = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local function factor_of(bucket, recovery)
+    local factor = tonumber(bucket.factor) or 1
+    if factor < 1 then
+        local since = now - (tonumber(bucket.penalized_at) or 0)
+        factor = math.min(1, factor + (1 - factor) * since / recovery)
+    end
+    return factor
+end
+
+local function load(key)
+    local values = redis.call('HMGET', key, 'tokens', 'ts', 'factor', 'penalized_at', 'blocked_until', 'strikes')
+    return {tokens = values[1], ts = values[2], factor = values[3], penalized_at = values[4],
+            blocked_until = values[5], strikes = values[6]}
+end
+"""
+
+# KEYS: buckets; ARGV: rate and capacity per bucket, then recovery seconds and TTL.
+# Takes one token from every bucket, or none; returns the seconds until all have one.
+ACQUIRE_SCRIPT = _NOW_AND_FACTOR + """
+local recovery = tonumber(ARGV[#ARGV - 1])
+local wait = 0
+local tokens = {}
+for i, key in ipairs(KEYS) do
+    local bucket = load(key)
+    local rate = tonumber(ARGV[2 * i - 1]) * factor_of(bucket, recovery)
+    local capacity = tonumber(ARGV[2 * i])
+    local available = tonumber(bucket.tokens) or capacity
+    available = math.min(capacity, available + (now - (tonumber(bucket.ts) or now)) * rate)
+    tokens[i] = available
+    if available < 1 then
+        wait = math.max(wait, (1 - available) / rate)
+    end
+    wait = math.max(wait, (tonumber(bucket.blocked_until) or 0) - now)
+end
+if wait <= 0 then
+    for i, key in ipairs(KEYS) do
+        redis.call('HSET', key, 'tokens', tokens[i] - 1, 'ts', now)
+        redis.call('EXPIRE', key, tonumber(ARGV[#ARGV]))
+    end
+end
+return tostring(wait)
+"""
+
+# KEYS[1]: bucket; ARGV: first backoff, longest backoff, recovery seconds, TTL.
+# Halves the bucket's rate, empties it and blocks it; returns the backoff in seconds.
+THROTTLED_SCRIPT = _NOW_AND_FACTOR + """
+local bucket = load(KEYS[1])
+local recovery = tonumber(ARGV[3])
+local strikes = tonumber(bucket.strikes) or 0
+if now - (tonumber(bucket.penalized_at) or 0) > recovery then
+    strikes = 0
+end
+strikes = strikes + 1
+local backoff = math.min(tonumber(ARGV[2]), tonumber(ARGV[1]) * 2 ^ (strikes - 1))
+redis.call('HSET', KEYS[1], 'factor', math.max(0.05, factor_of(bucket, recovery) / 2), 'penalized_at', now,
+           'strikes', strikes, 'blocked_until', now + backoff, 'tokens', 0, 'ts', now)
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[4]))
+return tostring(backoff)
+"""
+
+_scripts = {}
+
+
+def _script(source):
+    if source not in _scripts:
+        _scripts[source] = get_redis().register_script(source)
+    return _scripts[source]
+
+
+def _recovery():
+    return getattr(settings, 'RATE_LIMIT_RECOVERY_SECONDS', 60)
+
+
+def account_limit(provider):
+    """Return the (sends per second, burst) allowed on a provider account."""
+    return getattr(settings, 'PROVIDER_RATE_LIMITS', {}).get(provider, (10, 10))
+
+
+def acquire(provider, account, destination):
+    """
+    Take a token for one send to destination over a provider account.
+    Returns 0 if the send may go now, else the seconds to wait before trying again.
+    """
+    rate, capacity = account_limit(provider)
+    recipient_rate, recipient_capacity = getattr(settings, 'RECIPIENT_RATE_LIMIT', (0.2, 5))
+    keys = [
+        ACCOUNT_KEY.format(provider=provider, account=account),
+        RECIPIENT_KEY.format(provider=provider, account=account, destination=destination),
+    ]
+    try:
+        wait = _script(ACQUIRE_SCRIPT)(
+            keys=keys, args=[rate, capacity, recipient_rate, recipient_capacity, _recovery(), BUCKET_TTL]
+        )
+        return float(wait)
+    except Exception as e:
+        # An unreachable limiter must not hold back alarm notifications
+        logger.warning(f"Rate limiter unavailable for {provider}, sending unthrottled: {str(e)}")
+        return 0
+
+
+def throttled(provider, account, destination=None):
+    """
+    Back off after the provider answered 429: the account's bucket, or only
+    the destination's if the provider limited that recipient. Returns the backoff in seconds.
+    """
+    if destination is None:
+        key = ACCOUNT_KEY.format(provider=provider, account=account)
+    else:
+        key = RECIPIENT_KEY.format(provider=provider, account=account, destination=destination)
+    first, longest = getattr(settings, 'RATE_LIMIT_BACKOFF', (1, 60))
+    try:
+        backoff = float(_script(THROTTLED_SCRIPT)(keys=[key], args=[first, longest, _recovery(), BUCKET_TTL]))
+    except Exception as e:
+        logger.warning(f"Could not record 429 from {provider}: {str(e)}")
+        return first
+    logger.warning(f"{provider} rate limited {destination or 'the account'}, backing off {backoff:.1f}s")
+    return backoff
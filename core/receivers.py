@@ -0,0 +1,68 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from alarms.models import Alarm
+from custodians.models import Custodian
+from subjects.models import Subject, SubjectQR
+from .conditional import record_change
+from .metrics import invalidate_dashboard_metrics
+from .models import SystemParameter
+from .parameters import system_parameters
+from .sqlite import configure_connection
+
+
+@receiver(connection_created)
+def configure_database_connection(sender, connection, **kwargs):
+    """Apply the SQLite pragma profile to every new connection"""
+    configure_connection(connection)
+
+
+@receiver(post_save, sender=SystemParameter)
+@receiver(post_delete, sender=SystemParameter)
+def invalidate_system_parameters(sender, **kwargs):
+    """Invalidate cached parameters when one changes"""
+    system_parameters.invalidate()
+    # Invalidate again once committed, in case another process reloaded the old rows meanwhile
+    transaction.on_commit(system_parameters.invalidate)
+
+
+def _subject_custodian_id(subject_id):
+    return Subject.objects.filter(id=subject_id).values_list('custodian_id', flat=True).first()
+
+
+@receiver(post_save, sender=Custodian)
+@receiver(post_delete, sender=Custodian)
+def invalidate_custodian_metrics(sender, instance, **kwargs):
+    """Drop cached dashboard counters and bump the change version when a custodian changes"""
+    invalidate_dashboard_metrics(instance.id)
+    record_change(instance.id)
+
+
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+def invalidate_subject_metrics(sender, instance, **kwargs):
+    """Drop cached dashboard counters and bump the change version when a subject changes"""
+    invalidate_dashboard_metrics(instance.custodian_id)
+    record_change(instance.custodian_id)
+    # A subject that changed owner also leaves its old custodian's counters
+    stored_custodian_id = getattr(instance, '_stored_custodian_id', None)
+    if stored_custodian_id not in (None, instance.custodian_id):
+        invalidate_dashboard_metrics(stored_custodian_id)
+        record_change(stored_custodian_id)
+
+
+@receiver(post_save, sender=SubjectQR)
+@receiver(post_delete, sender=SubjectQR)
+@receiver(post_save, sender=Alarm)
+@receiver(post_delete, sender=Alarm)
+def invalidate_subject_child_metrics(sender, instance, **kwargs):
+    """Drop cached dashboard counters and bump the change version when a QR code or alarm changes"""
+    if sender is Alarm and instance.custodian_id is not None:
+        # Alarms carry their owner
+        custodian_id = instance.custodian_id
+    else:
+        subject = sender._meta.get_field('subject').get_cached_value(instance, default=None)
+        custodian_id = subject.custodian_id if subject is not None else _subject_custodian_id(instance.subject_id)
+    invalidate_dashboard_metrics(custodian_id)
+    record_change(custodian_id)
@@ -0,0 +1,23 @@
+"""
+Shared Redis connection for features that need atomic Redis commands
+(outbox wakeups, dedup gates, sorted-set schedulers) beyond the cache API.
+"""
+
+import redis
+from django.conf import settings
+
+_client = None
+
+
+def get_redis():
+    """Return the process-wide Redis client for settings.REDIS_URL."""
+    global _client
+    if _client is None:
+        # redis-py connection pools reset themselves after fork, so one client per process is safe
+        _client = redis.Redis.from_url(
+            settings.REDIS_URL,
+            socket_timeout=getattr(settings, 'REDIS_SOCKET_TIMEOUT', 2),
+            socket_connect_timeout=getattr(settings, 'REDIS_SOCKET_TIMEOUT', 2),
+            health_check_interval=30,
+        )
+    return _client
@@ -0,0 +1,54 @@
+"""
+SQLite connection profile.
+
+Every new SQLite connection gets the pragmas in settings.SQLITE_PRAGMAS
+(applied from the connection_created receiver in core.receivers). WAL lets
+readers run against a snapshot while a writer appends to the log, so the
+dashboards and scan pages no longer block alarm inserts; synchronous=NORMAL
+is durable across application crashes in WAL mode and only fsyncs on
+checkpoints; busy_timeout makes a writer wait for the lock instead of
+failing with "database is locked".
+"""
+
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'cache_size': -64000,
+    'mmap_size': 268435456,
+}
+
+
+def sqlite_pragmas():
+    return getattr(settings, 'SQLITE_PRAGMAS', DEFAULT_PRAGMAS)
+
+
+def apply_pragmas(cursor, pragmas=None, in_memory=False):
+    """Run the pragmas on a DB-API cursor of a new SQLite connection."""
+    pragmas = sqlite_pragmas() if pragmas is None else pragmas
+    for name, value in pragmas.items():
+        # In-memory databases cannot use a write-ahead log
+        if in_memory and name == 'journal_mode':
+            continue
+        cursor.execute(f"PRAGMA {name} = {value}")
+        if name == 'journal_mode':
+            mode = cursor.fetchone()[0]
+            if mode.upper() != str(value).upper():
+                logger.warning(f"SQLite journal_mode is {mode}, requested {value}")
+
+
+def configure_connection(connection):
+    """Apply the SQLite profile to a Django connection; other backends are left alone."""
+    if connection.vendor != 'sqlite':
+        return
+    cursor = connection.connection.cursor()
+    try:
+        apply_pragmas(cursor, in_memory=connection.is_in_memory_db())
+    finally:
+        cursor.close()
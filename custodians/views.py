@@ -25,6 +25,9 @@ from .tokens import email_verification_token
 from django.contrib.auth.models import User
 from core.email_backend import PopupEmailBackend
 from core.messaging import MessageService
+from core.conditional import conditional_on_changes
+from core.db_router import replica_reads
+from core.metrics import dashboard_metrics
 from django.views.decorators.csrf import csrf_protect
 from django.contrib.sessions.backends.db import SessionStore
 import re
@@ -224,53 +227,29 @@ def resend_verification(request):
     except User.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'Invalid registration session'})
 
+@transaction.non_atomic_requests
 @login_required
+@conditional_on_changes(windowed=True)
+@replica_reads()
 def dashboard(request):
     # Get subjects based on user role
     if request.user.is_staff:
         subjects = Subject.objects.all().select_related('custodian__user')
-        # Get total custodians excluding staff users
-        total_custodians = Custodian.objects.exclude(user__is_staff=True).count()
+        metrics = dashboard_metrics()
     else:
         subjects = Subject.objects.filter(custodian=request.user.custodian)
-        total_custodians = 1
+        metrics = dashboard_metrics(request.user.custodian.id)
     
-    # Calculate statistics
-    total_subjects = subjects.count()
-    active_subjects = subjects.filter(is_active=True).count()
-    
-    # Get QR code statistics
-    from subjects.models import SubjectQR
-    if request.user.is_staff:
-        total_qrs = SubjectQR.objects.count()
-        active_qrs = SubjectQR.objects.filter(is_active=True).count()
-    else:
-        total_qrs = SubjectQR.objects.filter(subject__custodian=request.user.custodian).count()
-        active_qrs = SubjectQR.objects.filter(subject__custodian=request.user.custodian, is_active=True).count()
-    
-    # Get recent alarms (last 24 hours)
-    last_24h = timezone.now() - timezone.timedelta(hours=24)
-    if request.user.is_staff:
-        recent_alarms = Alarm.objects.filter(timestamp__gte=last_24h).count()
-        total_alarms = Alarm.objects.count()
-        response_rate = (Alarm.objects.filter(notification_sent=True).count() / total_alarms * 100) if total_alarms > 0 else 100
-    else:
-        recent_alarms = Alarm.objects.filter(
-            subject__custodian=request.user.custodian,
-            timestamp__gte=last_24h
-        ).count()
-        total_alarms = Alarm.objects.filter(subject__custodian=request.user.custodian).count()
-        response_rate = (Alarm.objects.filter(
-            subject__custodian=request.user.custodian,
-            notification_sent=True
-        ).count() / total_alarms * 100) if total_alarms > 0 else 100
+    # Notification response rate
+    total_alarms = metrics['total_alarms']
+    response_rate = (metrics['notifications_sent'] / total_alarms * 100) if total_alarms > 0 else 100
     
     # Get recent activities
     if request.user.is_staff:
         recent_activities = Alarm.objects.select_related('subject', 'subject__custodian__user').order_by('-timestamp')[:10]
     else:
         recent_activities = Alarm.objects.filter(
-            subject__custodian=request.user.custodian
+            custodian=request.user.custodian
         ).select_related('subject').order_by('-timestamp')[:10]
     
     # Format activities for display
@@ -290,13 +269,13 @@ def dashboard(request):
     
     context = {
         'subjects': subjects,
-        'total_subjects': total_subjects,
-        'active_subjects': active_subjects,
-        'total_custodians': total_custodians,
-        'total_qrs': total_qrs,
-        'active_qrs': active_qrs,
+        'total_subjects': metrics['total_subjects'],
+        'active_subjects': metrics['active_subjects'],
+        'total_custodians': metrics['total_custodians'],
+        'total_qrs': metrics['total_qrs'],
+        'active_qrs': metrics['active_qrs'],
         'total_alarms': total_alarms,
-        'recent_alarms': recent_alarms,
+        'recent_alarms': metrics['alarms_last_24h'],
         'response_rate': round(response_rate, 1),
         'recent_activities': formatted_activities,
         'is_admin': request.user.is_staff,
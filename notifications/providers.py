@@ -1,9 +1,14 @@
 from django.conf import settings
 import requests
+import aiohttp
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Keep-alive session shared by synchronous WhatsApp API calls in this process
+http_session = requests.Session()
+http_session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=20))
+
 class WhatsAppAPIProvider:
     """WhatsApp Business API notification provider."""
     
@@ -34,8 +39,18 @@ class WhatsAppAPIProvider:
     def parse_response(self, response):
         """Parse WhatsApp API response and extract relevant information."""
         try:
-            data = response.json()
-            
+            return self.parse_payload(response.json())
+        except Exception as e:
+            logger.error(f"Error parsing WhatsApp response: {str(e)}")
+            return {
+                'success': False,
+                'error': f"Failed to parse response: {str(e)}",
+                'status': 'ERROR'
+            }
+    
+    def parse_payload(self, data):
+        """Extract message information from a decoded WhatsApp API response body."""
+        try:
             # Check for error response
             if 'error' in data:
                 return {
@@ -69,6 +84,45 @@ class WhatsAppAPIProvider:
                 'status': 'ERROR'
             }
     
+    def build_payload(self, to_number, message_data):
+        """Build the template message payload for the WhatsApp API."""
+        if not message_data.get('subject_name') or not message_data.get('timestamp'):
+            raise ValueError("Missing required message data: subject_name or timestamp")
+        
+        return {
+            'messaging_product': 'whatsapp',
+            'to': to_number,
+            'type': 'template',
+            'template': {
+                'name': 'qr_template_on_m',
+                'language': {
+                    'code': 'en_US'
+                },
+                'components': [
+                    {
+                        'type': 'body',
+                        'parameters': [
+                            {
+                                'type': 'text',
+                                'text': message_data['subject_name']
+                            },
+                            {
+                                'type': 'text',
+                                'text': message_data['timestamp']
+                            }
+                        ]
+                    }
+                ]
+            }
+        }
+    
+    def build_headers(self):
+        """Build the authenticated request headers."""
+        return {
+            'Authorization': f'Bearer {self.access_token}',
+            'Content-Type': 'application/json'
+        }
+    
     def send_message(self, to_number, message_data):
         """Send a WhatsApp message using the Meta WhatsApp Business API."""
         try:
@@ -77,60 +131,23 @@ class WhatsAppAPIProvider:
             logger.info(f'Preparing to send message to: {to_number}')
             logger.info(f'Message data: {message_data}')
             
-            if not message_data.get('subject_name') or not message_data.get('timestamp'):
-                raise ValueError("Missing required message data: subject_name or timestamp")
-            
             # Prepare the message payload using the template
-            payload = {
-                'messaging_product': 'whatsapp',
-                'to': to_number,
-                'type': 'template',
-                'template': {
-                    'name': 'qr_template_on_m',
-                    'language': {
-                        'code': 'en_US'
-                    },
-                    'components': [
-                        {
-                            'type': 'body',
-                            'parameters': [
-                                {
-                                    'type': 'text',
-                                    'text': message_data['subject_name']
-                                },
-                                {
-                                    'type': 'text',
-                                    'text': message_data['timestamp']
-                                }
-                            ]
-                        }
-                    ]
-                }
-            }
-            
-            # Set up headers with authentication
-            headers = {
-                'Authorization': f'Bearer {self.access_token}',
-                'Content-Type': 'application/json'
-            }
+            payload = self.build_payload(to_number, message_data)
             
-            # Log the request details
-            logger.info('Sending request to WhatsApp API:')
-            logger.info(f'URL: {self.base_url}/messages')
-            logger.info(f'Headers: {headers}')
-            logger.info(f'Payload: {payload}')
+            logger.info(f'Sending request to WhatsApp API: {self.base_url}/messages')
+            logger.debug(f'Payload: {payload}')
             
-            # Send the request to WhatsApp API
-            response = requests.post(
+            # Send the request over the shared keep-alive session
+            response = http_session.post(
                 f'{self.base_url}/messages',
                 json=payload,
-                headers=headers
+                headers=self.build_headers(),
+                timeout=getattr(settings, 'MESSAGE_DELIVERY_TIMEOUT', 15)
             )
             
             # Log the response
             logger.info(f'WhatsApp API Response Status: {response.status_code}')
-            logger.info(f'WhatsApp API Response Headers: {dict(response.headers)}')
-            logger.info(f'WhatsApp API Response Body: {response.text}')
+            logger.debug(f'WhatsApp API Response Body: {response.text}')
             
             # Parse and return the response
             result = self.parse_response(response)
@@ -161,6 +178,65 @@ class WhatsAppAPIProvider:
                 'status': 'ERROR',
                 'status_code': 500
             }
+    
+    async def send_message_async(self, session, to_number, message_data):
+        """Send a WhatsApp message over a pooled aiohttp session."""
+        try:
+            to_number = self.validate_phone_number(to_number)
+            payload = self.build_payload(to_number, message_data)
+            
+            async with session.post(
+                f'{self.base_url}/messages',
+                json=payload,
+                headers=self.build_headers()
+            ) as response:
+                try:
+                    data = await response.json(content_type=None)
+                    result = self.parse_payload(data)
+                except ValueError as e:
+                    result = {
+                        'success': False,
+                        'error': f"Failed to parse response: {str(e)}",
+                        'status': 'ERROR'
+                    }
+                result['status_code'] = response.status
+            
+            logger.info(f'WhatsApp API Response Status: {result["status_code"]} for {to_number}')
+            return result
+            
+        except ValueError as ve:
+            logger.error(f'Validation error: {str(ve)}')
+            return {
+                'success': False,
+                'error': str(ve),
+                'status': 'ERROR',
+                'status_code': 400
+            }
+        except (aiohttp.ClientError, TimeoutError) as e:
+            logger.error(f'Network error sending WhatsApp message: {str(e)}')
+            return {
+                'success': False,
+                'error': f'Network error: {str(e)}',
+                'status': 'ERROR',
+                'status_code': getattr(e, 'status', 500)
+            }
+        except Exception as e:
+            logger.error(f'Unexpected error sending WhatsApp message: {str(e)}')
+            return {
+                'success': False,
+                'error': f'Unexpected error: {str(e)}',
+                'status': 'ERROR',
+                'status_code': 500
+            }
+
+def get_whatsapp_provider():
+    """Get the provider for Meta WhatsApp sends, whatever channel is configured."""
+    from django.conf import settings
+
+    if getattr(settings, 'NOTIFICATION_PROVIDER', None) == 'console':
+        from .console_provider import get_console_notification_service
+        return get_console_notification_service()
+    return WhatsAppAPIProvider()
 
 def get_notification_service():
     """Get the configured notification service based on the channel setting."""
@@ -172,23 +248,21 @@ def get_notification_service():
         return get_console_notification_service()
     
     # Production providers
+    from core.parameters import system_parameters
+    from core.messaging import MessageChannel
+    
     try:
-        from core.models import SystemParameter
-        from core.messaging import MessageChannel
-        
-        channel_param = SystemParameter.objects.get(parameter='channel')
-        channel = MessageChannel(channel_param.value)
-        
-        if channel == MessageChannel.TWILIO_SMS:
-            from twilio.rest import Client
-            client = Client(
-                username=settings.TWILIO_ACCOUNT_SID,
-                password=settings.TWILIO_AUTH_TOKEN,
-                account_sid=settings.TWILIO_ACCOUNT_SID
-            )
-            return client
-        else:
-            return WhatsAppAPIProvider()
-    except (SystemParameter.DoesNotExist, ImportError):
+        channel = MessageChannel(system_parameters.get('channel'))
+    except ValueError:
         # Default to WhatsApp if no channel is configured
-        return WhatsAppAPIProvider() 
\ No newline at end of file
+        return WhatsAppAPIProvider()
+    
+    if channel == MessageChannel.TWILIO_SMS:
+        from twilio.rest import Client
+        client = Client(
+            username=settings.TWILIO_ACCOUNT_SID,
+            password=settings.TWILIO_AUTH_TOKEN,
+            account_sid=settings.TWILIO_ACCOUNT_SID
+        )
+        return client
+    return WhatsAppAPIProvider()
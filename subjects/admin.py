@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Subject, SubjectQR
+from .models import Subject, SubjectQR, QRRegenerationJob
 
 @admin.register(Subject)
 class SubjectAdmin(admin.ModelAdmin):
@@ -14,3 +14,9 @@ class SubjectQRAdmin(admin.ModelAdmin):
     list_filter = ('is_active',)
     search_fields = ('subject__name', 'uuid')
     date_hierarchy = 'created_at'
+
+@admin.register(QRRegenerationJob)
+class QRRegenerationJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'total', 'processed', 'failed', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = ('total', 'processed', 'failed', 'error', 'created_at', 'started_at', 'finished_at')
@@ -1,7 +1,8 @@
 from rest_framework import serializers
 from subjects.models import Subject
+from core.api import SparseFieldsetMixin
 
-class SubjectSerializer(serializers.ModelSerializer):
+class SubjectSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     custodian_name = serializers.CharField(source='custodian.user.get_full_name', read_only=True)
     
     class Meta:
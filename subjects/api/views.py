@@ -3,20 +3,24 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from subjects.models import Subject
+from core.api import KeysetPagination, paginate
+from core.conditional import conditional_on_changes
 from .serializers import SubjectSerializer
 
+
+class SubjectPagination(KeysetPagination):
+    cursor_fields = ('created_at', 'id')
+
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
+@conditional_on_changes
 def subject_list_api(request):
     if request.method == 'GET':
         # Filter subjects based on user's role
-        if request.user.is_staff:
-            subjects = Subject.objects.all()
-        else:
-            subjects = Subject.objects.filter(custodian__user=request.user)
-        
-        serializer = SubjectSerializer(subjects, many=True)
-        return Response(serializer.data)
+        subjects = Subject.objects.select_related('custodian__user')
+        if not request.user.is_staff:
+            subjects = subjects.filter(custodian__user=request.user)
+        return paginate(request, subjects, SubjectSerializer, SubjectPagination)
     
     elif request.method == 'POST':
         # Set the custodian to the current user's custodian
@@ -31,6 +35,7 @@ def subject_list_api(request):
 
 @api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([IsAuthenticated])
+@conditional_on_changes
 def subject_detail_api(request, pk):
     try:
         if request.user.is_staff:
@@ -0,0 +1,118 @@
+"""
+Atomic duplicate-scan gate for alarm creation.
+
+Before a scan creates an alarm it claims the QR code's cooldown key (and,
+with QR_SCAN_COOLDOWN_PER_IP, one for the client address) with SET NX PX.
+Only the first claim in a window goes on to lock the QR row and insert the
+alarm; duplicates get the remaining time straight from Redis and never reach
+the Alarm table. Once the alarm commits its id is written into the key so
+duplicate scans can show it. When Redis is down the gate falls back to
+looking for a recent alarm in the database.
+"""
+
+import logging
+import math
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from alarms.models import Alarm
+from core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+GATE_KEY = 'alarm_gate:qr:{qr_id}'
+IP_GATE_KEY = 'alarm_gate:ip:{ip}'
+PENDING = b'pending'  # Claimed, alarm not committed yet
+
+
+@dataclass(frozen=True)
+class Cooldown:
+    """State of a QR code's cooldown as seen by one scan."""
+    blocked: bool
+    remaining: float = 0.0  # Seconds until another alarm is allowed
+    alarm_id: int = None
+    from_database: bool = False
+
+    @property
+    def remaining_seconds(self):
+        return math.ceil(self.remaining)
+
+
+def cooldown_seconds():
+    return getattr(settings, 'QR_SCAN_COOLDOWN_SECONDS', 5)
+
+
+def _blocked(client, key):
+    ttl, value = client.pipeline().pttl(key).get(key).execute()
+    alarm_id = int(value) if value and value != PENDING else None
+    return Cooldown(True, max(ttl, 0) / 1000, alarm_id)
+
+
+def acquire(qr_id, ip=None, seconds=None):
+    """Claim the cooldown for a new alarm on a QR code, or report the one in force."""
+    seconds = seconds or cooldown_seconds()
+    try:
+        client = get_redis()
+        key = GATE_KEY.format(qr_id=qr_id)
+        if not client.set(key, PENDING, nx=True, px=int(seconds * 1000)):
+            return _blocked(client, key)
+        if ip and getattr(settings, 'QR_SCAN_COOLDOWN_PER_IP', False):
+            ip_key = IP_GATE_KEY.format(ip=ip)
+            if not client.set(ip_key, PENDING, nx=True, px=int(seconds * 1000)):
+                client.delete(key)
+                return _blocked(client, ip_key)
+        return Cooldown(False)
+    except Exception as e:
+        logger.warning(f"Alarm cooldown gate unavailable, checking database: {str(e)}")
+        return check_database(qr_id, seconds)
+
+
+def peek(qr_id):
+    """Report a QR code's cooldown without claiming it."""
+    try:
+        client = get_redis()
+        key = GATE_KEY.format(qr_id=qr_id)
+        cooldown = _blocked(client, key)
+        return cooldown if cooldown.remaining else Cooldown(False)
+    except Exception as e:
+        logger.warning(f"Alarm cooldown gate unavailable, checking database: {str(e)}")
+        return check_database(qr_id)
+
+
+def check_database(qr_id, seconds=None):
+    """Cooldown derived from the newest alarm on a QR code."""
+    seconds = seconds or cooldown_seconds()
+    now = timezone.now()
+    alarm = Alarm.objects.filter(
+        qr_code_id=qr_id,
+        timestamp__gte=now - timedelta(seconds=seconds)
+    ).only('id', 'timestamp').first()
+    if alarm is None:
+        return Cooldown(False, from_database=True)
+    remaining = max(0.0, seconds - (now - alarm.timestamp).total_seconds())
+    return Cooldown(True, remaining, alarm.id, from_database=True)
+
+
+def release(qr_id, ip=None):
+    """Give up a claim whose alarm was not created, so the scan can be retried."""
+    keys = [GATE_KEY.format(qr_id=qr_id)]
+    if ip and getattr(settings, 'QR_SCAN_COOLDOWN_PER_IP', False):
+        keys.append(IP_GATE_KEY.format(ip=ip))
+    try:
+        get_redis().delete(*keys)
+    except Exception as e:
+        logger.warning(f"Could not release alarm cooldown for QR {qr_id}: {str(e)}")
+
+
+def record_alarm(qr_id, alarm_id, seconds=None):
+    """Store a committed alarm in its QR code's cooldown, starting one if none was claimed."""
+    try:
+        client = get_redis()
+        key = GATE_KEY.format(qr_id=qr_id)
+        if not client.set(key, alarm_id, xx=True, keepttl=True):
+            client.set(key, alarm_id, nx=True, px=int((seconds or cooldown_seconds()) * 1000))
+    except Exception as e:
+        logger.warning(f"Could not record alarm {alarm_id} in cooldown for QR {qr_id}: {str(e)}")
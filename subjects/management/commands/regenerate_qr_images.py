@@ -0,0 +1,61 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import connections
+from subjects.models import QRRegenerationJob
+from subjects.qr_jobs import iter_id_chunks, regenerate_chunk, record_progress, start_job, chunk_size
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _close_connections():
+    """Give each pool process its own database connections."""
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Regenerates every QR code image, rendering chunks across a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Number of worker processes (default: 1, render in this process)')
+        parser.add_argument('--chunk-size', type=int, default=chunk_size(),
+                            help='QR codes per chunk')
+        parser.add_argument('--base-url', default=getattr(settings, 'QR_BASE_URL', 'https://keryu.mx'),
+                            help='Scheme and host encoded in the QR codes')
+
+    def handle(self, *args, **options):
+        job = start_job(QRRegenerationJob.objects.create(base_url=options['base_url']))
+        self.stdout.write(f"Regenerating {job.total} QR code images (job {job.id})")
+        chunks = iter_id_chunks(options['chunk_size'])
+
+        if options['workers'] <= 1:
+            for qr_ids in chunks:
+                regenerate_chunk(qr_ids, job.base_url, job.id)
+                self._report(job)
+        else:
+            # Forked workers must not share the parent's database connection
+            connections.close_all()
+            chunks = list(chunks)
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=_close_connections) as pool:
+                futures = {
+                    pool.submit(regenerate_chunk, qr_ids, job.base_url, job.id): qr_ids
+                    for qr_ids in chunks
+                }
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        logger.error(f"QR regeneration chunk failed: {str(e)}")
+                        record_progress(job.id, 0, len(futures[future]))
+                    self._report(job)
+
+        job.refresh_from_db()
+        self.stdout.write(self.style.SUCCESS(
+            f"Regenerated {job.processed} QR code images. Failed: {job.failed}"
+        ))
+
+    def _report(self, job):
+        job.refresh_from_db(fields=['processed', 'failed'])
+        self.stdout.write(f"  {job.processed + job.failed}/{job.total} ({job.failed} failed)")
@@ -31,6 +31,20 @@ class Subject(models.Model):
     def __str__(self):
         return f"{self.name} (Custodian: {self.custodian})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.snapshot_custodian()
+        return instance
+
+    def snapshot_custodian(self):
+        """Remember the custodian as stored, so saves can tell when the subject changes owner."""
+        self._stored_custodian_id = self.__dict__.get('custodian_id')
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.snapshot_custodian()
+
     class Meta:
         ordering = ['name']
 
@@ -52,10 +66,65 @@ class SubjectQR(models.Model):
     def __str__(self):
         return f"QR Code for {self.subject.name} ({self.uuid})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.snapshot_activation_state()
+        return instance
+
+    def snapshot_activation_state(self):
+        """Remember the subject and active flag as stored, so saves can tell when activation changes."""
+        if 'is_active' in self.__dict__ and 'subject_id' in self.__dict__:
+            self._activation_state = (self.subject_id, self.is_active)
+        else:
+            self._activation_state = None
+
     def save(self, *args, **kwargs):
+        self.deactivated_siblings = 0
         if self.is_active:
             if not self.activated_at:
                 self.activated_at = timezone.now()
-            # Deactivate other QR codes for this subject
-            SubjectQR.objects.filter(subject=self.subject).exclude(pk=self.pk).update(is_active=False)
+            # Deactivate other QR codes for this subject, only when this one becomes its active code
+            if getattr(self, '_activation_state', None) != (self.subject_id, True):
+                self.deactivated_siblings = SubjectQR.objects.filter(
+                    subject_id=self.subject_id, is_active=True
+                ).exclude(pk=self.pk).update(is_active=False)
         super().save(*args, **kwargs)
+        self.snapshot_activation_state()
+
+class QRRegenerationJob(models.Model):
+    """Background regeneration of every QR code image, with progress counters."""
+    STATUS_PENDING = 'PENDING'
+    STATUS_RUNNING = 'RUNNING'
+    STATUS_COMPLETED = 'COMPLETED'
+    STATUS_FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    requested_by = models.ForeignKey('auth.User', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    base_url = models.URLField(help_text='Scheme and host encoded in the regenerated QR codes')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    total = models.IntegerField(default=0)
+    processed = models.IntegerField(default=0)
+    failed = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"QR regeneration {self.id} ({self.status}: {self.processed + self.failed}/{self.total})"
+
+    @property
+    def progress(self):
+        """Percentage of QR codes handled so far."""
+        if not self.total:
+            return 100 if self.status == self.STATUS_COMPLETED else 0
+        return round((self.processed + self.failed) * 100 / self.total, 1)
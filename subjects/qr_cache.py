@@ -0,0 +1,192 @@
+"""
+Content-addressed cache for rendered QR code images.
+
+An image variant is identified by the encoded URL, box size, format and error
+correction level. The hash of those inputs is the cache key and the strong
+ETag, so conditional requests are answered without touching the image at all.
+Rendered bytes are kept in a small per-process LRU and in Redis; the default
+PNG variant is also stored on SubjectQR.image for downloads, under a file name
+carrying its key (stored_name), so a file rendered for another version or URL
+is never served under the current ETag. Rendering itself lives in
+subjects.qr_render.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+
+from . import qr_render
+from .models import SubjectQR
+from .qr_render import CONTENT_TYPES, ERROR_CORRECTION
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZE = 10
+DEFAULT_FORMAT = 'png'
+DEFAULT_ERROR_CORRECTION = 'M'
+MAX_SIZE = 40
+
+# Bump when rendering output changes so old cache entries and ETags are retired
+RENDER_VERSION = 2
+
+CACHE_KEY = 'qr_image:{key}'
+
+
+@dataclass(frozen=True)
+class QRVariant:
+    """One rendering of a QR code's data."""
+    data: str
+    size: int = DEFAULT_SIZE
+    format: str = DEFAULT_FORMAT
+    error_correction: str = DEFAULT_ERROR_CORRECTION
+
+    @property
+    def key(self):
+        raw = f"{RENDER_VERSION}|{self.data}|{self.size}|{self.format}|{self.error_correction}"
+        return hashlib.sha256(raw.encode()).hexdigest()[:40]
+
+    @property
+    def etag(self):
+        return f'"{self.key}"'
+
+    @property
+    def content_type(self):
+        return CONTENT_TYPES[self.format]
+
+    @property
+    def is_default(self):
+        return (self.size, self.format, self.error_correction) == (
+            DEFAULT_SIZE, DEFAULT_FORMAT, DEFAULT_ERROR_CORRECTION
+        )
+
+
+def stored_name(qr, variant):
+    """Return the file name the default variant of a QR code is stored under."""
+    return f'qr_{qr.uuid}_{variant.key[:12]}.png'
+
+
+def parse_variant(data, params):
+    """Build a variant from request query parameters, raising ValueError if invalid."""
+    size = int(params.get('size', DEFAULT_SIZE))
+    image_format = params.get('format', DEFAULT_FORMAT).lower()
+    error_correction = params.get('ec', DEFAULT_ERROR_CORRECTION).upper()
+    if not 1 <= size <= MAX_SIZE:
+        raise ValueError(f"size must be between 1 and {MAX_SIZE}")
+    if image_format not in CONTENT_TYPES:
+        raise ValueError(f"format must be one of {', '.join(CONTENT_TYPES)}")
+    if error_correction not in ERROR_CORRECTION:
+        raise ValueError(f"ec must be one of {', '.join(ERROR_CORRECTION)}")
+    return QRVariant(data, size, image_format, error_correction)
+
+
+def render(variant):
+    """Render a variant to image bytes."""
+    return qr_render.render(variant.data, variant.size, variant.format, variant.error_correction)
+
+
+def prewarm_variants(data):
+    """Return the variants rendered alongside the default image (see QR_IMAGE_PREWARM_VARIANTS)."""
+    return [
+        QRVariant(data, size, image_format)
+        for size, image_format in getattr(settings, 'QR_IMAGE_PREWARM_VARIANTS', [])
+    ]
+
+
+class QRImageCache:
+    """Two-tier (process LRU, then Redis) cache of rendered QR images."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = OrderedDict()
+        self._local_bytes = 0
+
+    def _local_limit(self):
+        return getattr(settings, 'QR_IMAGE_LOCAL_CACHE_BYTES', 8 * 1024 * 1024)
+
+    def _get_local(self, key):
+        with self._lock:
+            content = self._local.get(key)
+            if content is not None:
+                self._local.move_to_end(key)
+            return content
+
+    def _set_local(self, key, content):
+        with self._lock:
+            if key in self._local:
+                self._local_bytes -= len(self._local.pop(key))
+            self._local[key] = content
+            self._local_bytes += len(content)
+            while self._local_bytes > self._local_limit() and self._local:
+                _, evicted = self._local.popitem(last=False)
+                self._local_bytes -= len(evicted)
+
+    def _get_shared(self, key):
+        try:
+            return cache.get(CACHE_KEY.format(key=key))
+        except Exception as e:
+            logger.warning(f"QR image cache unavailable: {str(e)}")
+            return None
+
+    def _set_shared(self, key, content):
+        try:
+            cache.set(CACHE_KEY.format(key=key), content, getattr(settings, 'QR_IMAGE_CACHE_TIMEOUT', 60 * 60 * 24 * 7))
+        except Exception as e:
+            logger.warning(f"Could not cache QR image: {str(e)}")
+
+    def _read_stored(self, qr, variant):
+        """Return the stored default image, or None if it is missing, empty or of another variant."""
+        if not qr.image:
+            return None
+        # The storage may have added a suffix to the name
+        if not os.path.basename(qr.image.name).startswith(stored_name(qr, variant)[:-len('.png')]):
+            return None
+        try:
+            with qr.image.open('rb') as f:
+                return f.read() or None
+        except (ValueError, FileNotFoundError, OSError) as e:
+            logger.warning(f"Stored QR image for {qr.uuid} is unreadable: {str(e)}")
+            return None
+
+    def get(self, qr, variant, force=False):
+        """Return the image bytes for a QR code variant, rendering them if needed."""
+        key = variant.key
+        if not force:
+            content = self._get_local(key) or self._get_shared(key)
+            if content is None and variant.is_default:
+                content = self._read_stored(qr, variant)
+                if content is not None:
+                    self._set_shared(key, content)
+            if content is not None:
+                self._set_local(key, content)
+                return content
+
+        logger.debug(f"Rendering QR image for {qr.uuid} ({variant.format}, size {variant.size}, ec {variant.error_correction})")
+        content = render(variant)
+        if variant.is_default:
+            if qr.image:
+                qr.image.delete(save=False)
+            qr.image.save(stored_name(qr, variant), ContentFile(content), save=False)
+            # Only the file name changed: no SubjectQR.save() or its snapshot invalidation
+            SubjectQR.objects.filter(pk=qr.pk).update(image=qr.image.name)
+        self._set_shared(key, content)
+        self._set_local(key, content)
+        return content
+
+    def store(self, variant, content):
+        """Put already rendered bytes for a variant into the shared cache."""
+        self._set_shared(variant.key, content)
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+            self._local_bytes = 0
+
+
+qr_image_cache = QRImageCache()
@@ -0,0 +1,108 @@
+"""
+Bulk regeneration of QR code images.
+
+QR codes are split into chunks of ids. Each chunk renders its images (and the
+QR_IMAGE_PREWARM_VARIANTS into the image cache), writes the files and stores the new image names with one bulk_update, then adds its
+counts to the QRRegenerationJob. Chunks run as separate Celery tasks (spread
+over the worker pool) or, from the regenerate_qr_images command, in a local
+process pool.
+"""
+
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import QRRegenerationJob, SubjectQR
+from .qr_cache import QRVariant, prewarm_variants, qr_image_cache, stored_name
+from .qr_render import render_many
+
+logger = logging.getLogger(__name__)
+
+
+def chunk_size():
+    return getattr(settings, 'QR_REGENERATION_CHUNK_SIZE', 100)
+
+
+def scan_url(base_url, qr_uuid):
+    """Return the anonymous scan URL encoded in a QR code."""
+    return base_url.rstrip('/') + reverse('subjects:scan_qr_anonymous', args=[qr_uuid])
+
+
+def iter_id_chunks(size=None):
+    """Yield lists of SubjectQR ids in primary key order."""
+    size = size or chunk_size()
+    chunk = []
+    for qr_id in SubjectQR.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=size):
+        chunk.append(qr_id)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def regenerate_chunk(qr_ids, base_url, job_id=None):
+    """
+    Render and store images for a chunk of QR codes.
+    Returns (processed, failed) and adds them to the job's counters.
+    """
+    qrs = list(SubjectQR.objects.filter(id__in=qr_ids).only('id', 'uuid', 'image'))
+    storage = SubjectQR._meta.get_field('image').storage
+    updated = []
+    failed = len(qr_ids) - len(qrs)  # Deleted since the job started
+
+    for qr in qrs:
+        try:
+            default = QRVariant(scan_url(base_url, qr.uuid))
+            extra = prewarm_variants(default.data)
+            # Every size and format comes from one encoded matrix
+            rendered = render_many(
+                default.data,
+                [(variant.size, variant.format) for variant in [default] + extra],
+                default.error_correction
+            )
+            content = rendered[(default.size, default.format)]
+            for variant in [default] + extra:
+                qr_image_cache.store(variant, rendered[(variant.size, variant.format)])
+            if qr.image:
+                storage.delete(qr.image.name)
+            qr.image.save(stored_name(qr, default), ContentFile(content), save=False)
+            updated.append(qr)
+        except Exception as e:
+            logger.error(f"Failed to regenerate QR image for {qr.uuid}: {str(e)}")
+            failed += 1
+
+    SubjectQR.objects.bulk_update(updated, ['image'])
+
+    if job_id is not None:
+        record_progress(job_id, len(updated), failed)
+
+    return len(updated), failed
+
+
+def record_progress(job_id, processed, failed):
+    """Add a chunk's counts to a job, completing it when every QR code is accounted for."""
+    QRRegenerationJob.objects.filter(id=job_id).update(
+        processed=F('processed') + processed,
+        failed=F('failed') + failed
+    )
+    # Whichever chunk finishes last completes the job
+    QRRegenerationJob.objects.filter(
+        id=job_id,
+        status=QRRegenerationJob.STATUS_RUNNING,
+        processed__gte=F('total') - F('failed')
+    ).update(status=QRRegenerationJob.STATUS_COMPLETED, finished_at=timezone.now())
+
+
+def start_job(job):
+    """Mark a job as running with the current number of QR codes to process."""
+    job.total = SubjectQR.objects.count()
+    job.status = QRRegenerationJob.STATUS_RUNNING if job.total else QRRegenerationJob.STATUS_COMPLETED
+    job.started_at = timezone.now()
+    job.finished_at = None if job.total else job.started_at
+    job.save(update_fields=['total', 'status', 'started_at', 'finished_at'])
+    return job
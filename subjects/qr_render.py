@@ -0,0 +1,106 @@
+"""
+QR code rendering.
+
+The module matrix is encoded once per (data, error correction) and memoized.
+Raster sizes are produced by scaling that boolean matrix with NumPy and
+handing the result to Pillow only for encoding, and SVG output is built from
+horizontal runs of dark modules, so every size and format of a code reuses the
+same matrix instead of re-encoding it.
+"""
+
+from functools import lru_cache
+from io import BytesIO
+
+import numpy as np
+import qrcode
+from PIL import Image
+
+ERROR_CORRECTION = {
+    'L': qrcode.constants.ERROR_CORRECT_L,
+    'M': qrcode.constants.ERROR_CORRECT_M,
+    'Q': qrcode.constants.ERROR_CORRECT_Q,
+    'H': qrcode.constants.ERROR_CORRECT_H,
+}
+
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+    'webp': 'image/webp',
+}
+
+BORDER = 4  # Quiet zone in modules, as required by the QR spec
+
+
+@lru_cache(maxsize=1024)
+def qr_matrix(data, error_correction='M'):
+    """Return the QR code for data as a read-only boolean array (True = dark), without border."""
+    qr_code = qrcode.QRCode(version=1, error_correction=ERROR_CORRECTION[error_correction], border=0)
+    qr_code.add_data(data)
+    qr_code.make(fit=True)
+    matrix = np.array(qr_code.get_matrix(), dtype=bool)
+    matrix.setflags(write=False)
+    return matrix
+
+
+def rasterize(matrix, box_size, border=BORDER):
+    """Scale a module matrix to a uint8 grayscale array (0 = black, 255 = white)."""
+    padded = np.pad(matrix, border, constant_values=False)
+    pixels = np.repeat(np.repeat(padded, box_size, axis=0), box_size, axis=1)
+    return np.where(pixels, np.uint8(0), np.uint8(255))
+
+
+def to_image(matrix, box_size, border=BORDER):
+    """Return a grayscale PIL image of a module matrix."""
+    return Image.fromarray(rasterize(matrix, box_size, border), mode='L')
+
+
+def to_svg(matrix, box_size, border=BORDER):
+    """Return an SVG document drawing each horizontal run of dark modules as one path segment."""
+    size = (matrix.shape[0] + 2 * border) * box_size
+    # Run starts and ends per row, from the edges of the padded boolean rows
+    edges = np.diff(np.pad(matrix.astype(np.int8), ((0, 0), (1, 1))), axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+
+    path = ''.join(
+        f"M{(start + border) * box_size} {(row + border) * box_size}"
+        f"h{(end - start) * box_size}v{box_size}h-{(end - start) * box_size}z"
+        for row, start, end in zip(rows.tolist(), starts.tolist(), ends.tolist())
+    )
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" '
+        f'viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path fill="#000" d="{path}"/></svg>'
+    ).encode()
+
+
+def encode(matrix, box_size, image_format):
+    """Encode a module matrix as PNG, WebP or SVG bytes."""
+    if image_format == 'svg':
+        return to_svg(matrix, box_size)
+
+    buffer = BytesIO()
+    image = to_image(matrix, box_size)
+    if image_format == 'png':
+        # QR codes are pure black and white, so a 1-bit PNG loses nothing
+        image.convert('1').save(buffer, format='PNG', optimize=True)
+    elif image_format == 'webp':
+        image.save(buffer, format='WEBP', lossless=True)
+    else:
+        raise ValueError(f"Unsupported QR image format: {image_format}")
+    return buffer.getvalue()
+
+
+def render(data, box_size=10, image_format='png', error_correction='M'):
+    """Render one QR code image."""
+    return encode(qr_matrix(data, error_correction), box_size, image_format)
+
+
+def render_many(data, variants, error_correction='M'):
+    """
+    Render several (box_size, format) variants of one code from a single matrix.
+    Returns a dict keyed by (box_size, format).
+    """
+    matrix = qr_matrix(data, error_correction)
+    return {(box_size, image_format): encode(matrix, box_size, image_format) for box_size, image_format in variants}
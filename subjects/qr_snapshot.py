@@ -0,0 +1,73 @@
+"""
+Cached QR code snapshots for the anonymous scan page.
+
+GET requests for a scanned tag only need to know whether the QR code is active
+and what to show, so they read a small snapshot from Redis instead of locking
+the SubjectQR row. Snapshots are stored under a per-QR version key; saving a
+QR code or its subject publishes a new version (see subjects.receivers), so a
+reader racing with a write can never re-cache stale data under the current
+version.
+"""
+
+import logging
+import uuid as uuid_lib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import SubjectQR
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'qr_snapshot:version:{uuid}'
+SNAPSHOT_KEY = 'qr_snapshot:{uuid}:{version}'
+
+MISSING = {'exists': False}
+
+
+def _load(qr_uuid):
+    row = SubjectQR.objects.filter(uuid=qr_uuid).values(
+        'id', 'uuid', 'is_active', 'subject_id', 'subject__name', 'subject__custodian_id'
+    ).first()
+    if row is None:
+        return MISSING
+    return {
+        'exists': True,
+        'id': row['id'],
+        'uuid': str(row['uuid']),
+        'is_active': row['is_active'],
+        'subject_id': row['subject_id'],
+        'subject_name': row['subject__name'],
+        'custodian_id': row['subject__custodian_id'],
+    }
+
+
+def get_qr_snapshot(qr_uuid):
+    """Return the snapshot dict for a QR code, or None if it does not exist."""
+    try:
+        version_key = VERSION_KEY.format(uuid=qr_uuid)
+        version = cache.get(version_key)
+        if version is None:
+            version = uuid_lib.uuid4().hex
+            if not cache.add(version_key, version, None):
+                version = cache.get(version_key, version)
+
+        snapshot_key = SNAPSHOT_KEY.format(uuid=qr_uuid, version=version)
+        snapshot = cache.get(snapshot_key)
+        if snapshot is None:
+            snapshot = _load(qr_uuid)
+            cache.set(snapshot_key, snapshot, getattr(settings, 'QR_SNAPSHOT_TIMEOUT', 300))
+    except Exception as e:
+        logger.warning(f"QR snapshot cache unavailable, reading database: {str(e)}")
+        snapshot = _load(qr_uuid)
+
+    return snapshot if snapshot['exists'] else None
+
+
+def invalidate_qr_snapshots(qr_uuids):
+    """Publish new snapshot versions for the given QR codes."""
+    try:
+        cache.set_many({VERSION_KEY.format(uuid=qr_uuid): uuid_lib.uuid4().hex for qr_uuid in qr_uuids}, None)
+    except Exception as e:
+        logger.warning(f"Could not invalidate QR snapshots: {str(e)}")
+
@@ -0,0 +1,63 @@
+"""
+Write-behind tracking of SubjectQR.last_used.
+
+Scans record their timestamp in a Redis hash (QR id -> epoch seconds) once the
+alarm commits, instead of saving the QR row. The flush_qr_last_used task
+swaps the hash out and writes all pending timestamps with one bulk_update, so
+a scan costs a single alarm INSERT. If Redis is unavailable the timestamp is
+written directly with a single-column UPDATE.
+"""
+
+import logging
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from redis.exceptions import ResponseError
+
+from core.redis_client import get_redis
+from .models import SubjectQR
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = 'qr_last_used'
+FLUSHING_KEY = 'qr_last_used:flushing'
+
+
+def _record(qr_id, when):
+    try:
+        get_redis().hset(PENDING_KEY, qr_id, when.timestamp())
+    except Exception as e:
+        logger.warning(f"Could not buffer last_used for QR {qr_id}, writing it directly: {str(e)}")
+        SubjectQR.objects.filter(id=qr_id).update(last_used=when)
+
+
+def touch(qr_id, when=None):
+    """Record a scan of a QR code once the current transaction commits."""
+    when = when or timezone.now()
+    transaction.on_commit(lambda: _record(qr_id, when))
+
+
+def flush_last_used():
+    """Write buffered scan timestamps to SubjectQR.last_used. Returns the number of QR codes updated."""
+    client = get_redis()
+    # A flush that died after the swap left its batch behind; write it before taking a new one
+    if not client.exists(FLUSHING_KEY):
+        try:
+            client.rename(PENDING_KEY, FLUSHING_KEY)
+        except ResponseError:
+            # Nothing buffered since the last flush
+            return 0
+
+    pending = client.hgetall(FLUSHING_KEY)
+    qrs = [
+        SubjectQR(id=int(qr_id), last_used=datetime.fromtimestamp(float(ts), tz=dt_timezone.utc))
+        for qr_id, ts in pending.items()
+    ]
+    SubjectQR.objects.bulk_update(qrs, ['last_used'], batch_size=getattr(settings, 'QR_LAST_USED_FLUSH_BATCH_SIZE', 500))
+    client.delete(FLUSHING_KEY)
+
+    if qrs:
+        logger.info(f"Flushed last_used for {len(qrs)} QR codes")
+    return len(qrs)
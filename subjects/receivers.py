@@ -1,33 +1,77 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from alarms.models import Alarm, NotificationStatus
-from alarms.tasks import send_whatsapp_notification
+from alarms.outbox import enqueue_alarm_notification
+from alarms.transitions import transition
+from .models import Subject, SubjectQR
+from .cooldown import record_alarm
+from .qr_snapshot import invalidate_qr_snapshots
 import logging
 
 logger = logging.getLogger(__name__)
 
 @receiver(post_save, sender=Alarm)
 def send_alarm_notification(sender, instance, created, **kwargs):
-    """Send notification when a new alarm is created"""
+    """Record the notification for a new alarm in the outbox, in the alarm's transaction"""
     if created:  # Only for newly created alarms
         logger.info(f"Signal handler triggered for new alarm {instance.id}")
         
         # Check if notification hasn't been sent and status is PENDING
         if instance.notification_status == NotificationStatus.PENDING:
             try:
-                if instance.is_test:
-                    # For test alarms, log and send with test flag
-                    logger.info(f"Queueing test notification for alarm {instance.id}")
-                    send_whatsapp_notification.delay(instance.id, is_test=True)
-                else:
-                    # For regular alarms
-                    logger.info(f"Queueing notification for alarm {instance.id}")
-                    send_whatsapp_notification.delay(instance.id, is_test=False)
+                logger.info(f"Queueing {'test ' if instance.is_test else ''}notification for alarm {instance.id}")
+                enqueue_alarm_notification(instance)
             except Exception as e:
                 logger.error(f"Error queueing notification for alarm {instance.id}: {str(e)}")
-                # Update alarm status to ERROR
-                instance.notification_status = NotificationStatus.ERROR
-                instance.notification_error = str(e)
-                instance.save(update_fields=['notification_status', 'notification_error'])
+                # Update alarm status to ERROR once the alarm (and its rollup entry) is committed
+                error = str(e)
+                transaction.on_commit(lambda: transition(instance, NotificationStatus.ERROR, notification_error=error))
         else:
-            logger.info(f"Alarm {instance.id} notification status is {instance.notification_status}, skipping notification") 
\ No newline at end of file
+            logger.info(f"Alarm {instance.id} notification status is {instance.notification_status}, skipping notification")
+
+
+@receiver(post_save, sender=Alarm)
+def record_recent_scan_alarm(sender, instance, created, **kwargs):
+    """Start the duplicate-scan cooldown for the alarm's QR code once it is committed"""
+    if created and instance.qr_code_id:
+        qr_id, alarm_id = instance.qr_code_id, instance.id
+        transaction.on_commit(lambda: record_alarm(qr_id, alarm_id))
+
+
+# Fields a cached scan snapshot is built from
+QR_SNAPSHOT_FIELDS = {'is_active', 'subject'}
+
+
+def _invalidate_snapshots(qr_uuids):
+    invalidate_qr_snapshots(qr_uuids)
+    # Publish again once committed, in case a scan re-cached the old row meanwhile
+    transaction.on_commit(lambda: invalidate_qr_snapshots(qr_uuids))
+
+
+@receiver(post_save, sender=SubjectQR)
+def invalidate_qr_snapshot_on_save(sender, instance, update_fields=None, **kwargs):
+    """Publish a new scan snapshot version when a QR code changes"""
+    deactivated_siblings = getattr(instance, 'deactivated_siblings', 0)
+    if not deactivated_siblings and update_fields is not None and not QR_SNAPSHOT_FIELDS.intersection(update_fields):
+        return
+    qr_uuids = [instance.uuid]
+    if deactivated_siblings:
+        # SubjectQR.save deactivated the subject's other QR codes with a bulk update
+        qr_uuids += list(SubjectQR.objects.filter(subject_id=instance.subject_id).exclude(
+            pk=instance.pk
+        ).values_list('uuid', flat=True))
+    _invalidate_snapshots(qr_uuids)
+
+
+@receiver(post_delete, sender=SubjectQR)
+def invalidate_qr_snapshot_on_delete(sender, instance, **kwargs):
+    """Publish a new scan snapshot version when a QR code is deleted"""
+    _invalidate_snapshots([instance.uuid])
+
+
+@receiver(post_save, sender=Subject)
+def invalidate_subject_qr_snapshots(sender, instance, created, **kwargs):
+    """Publish new scan snapshot versions when a subject's display data changes"""
+    if not created:
+        _invalidate_snapshots(list(instance.qr_codes.values_list('uuid', flat=True)))
@@ -38,4 +38,55 @@ def create_test_alarm(qr_uuid, location=None):
         raise
     except Exception as e:
         logger.error(f"Error creating test alarm: {str(e)}")
-        raise 
\ No newline at end of file
+        raise 
+@shared_task
+def regenerate_qr_images(job_id):
+    """
+    Split a QR regeneration job into chunks rendered in parallel by the worker pool.
+    """
+    from .models import QRRegenerationJob
+    from .qr_jobs import iter_id_chunks, start_job
+
+    try:
+        job = start_job(QRRegenerationJob.objects.get(id=job_id))
+        chunks = 0
+        for qr_ids in iter_id_chunks():
+            regenerate_qr_image_chunk.delay(job_id, qr_ids)
+            chunks += 1
+        logger.info(f"QR regeneration job {job_id} split into {chunks} chunks for {job.total} QR codes")
+        return chunks
+    except Exception as e:
+        logger.error(f"Error starting QR regeneration job {job_id}: {str(e)}")
+        QRRegenerationJob.objects.filter(id=job_id).update(
+            status=QRRegenerationJob.STATUS_FAILED,
+            error=str(e),
+            finished_at=timezone.now()
+        )
+        raise
+
+@shared_task
+def regenerate_qr_image_chunk(job_id, qr_ids):
+    """
+    Regenerate the images for one chunk of a QR regeneration job.
+    """
+    from .models import QRRegenerationJob
+    from .qr_jobs import record_progress, regenerate_chunk
+
+    try:
+        base_url = QRRegenerationJob.objects.values_list('base_url', flat=True).get(id=job_id)
+        processed, failed = regenerate_chunk(qr_ids, base_url, job_id)
+    except Exception as e:
+        logger.error(f"QR regeneration job {job_id}: chunk of {len(qr_ids)} failed: {str(e)}")
+        record_progress(job_id, 0, len(qr_ids))
+        raise
+    logger.info(f"QR regeneration job {job_id}: chunk of {len(qr_ids)} done ({processed} ok, {failed} failed)")
+    return processed, failed
+
+@shared_task
+def flush_qr_last_used():
+    """
+    Write the buffered QR scan timestamps to SubjectQR.last_used.
+    """
+    from .qr_usage import flush_last_used
+
+    return flush_last_used()
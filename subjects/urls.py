@@ -32,4 +32,5 @@ urlpatterns = [
     path('admin/subjects/', views.subject_list, name='subject_list'),
     path('admin/subjects/stats/', views.subject_stats, name='subject_stats'),
     path('admin/qr/regenerate-all/', views.regenerate_all_qr_images, name='regenerate_all_qr_images'),
+    path('admin/qr/regenerate-all/<int:pk>/status/', views.regenerate_qr_images_status, name='regenerate_qr_images_status'),
 ] 
\ No newline at end of file
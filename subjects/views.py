@@ -1,5 +1,5 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import HttpResponse, JsonResponse, FileResponse
+from django.http import HttpResponse, JsonResponse, FileResponse, Http404
 from django.contrib import messages
 from django.db.models import Count, Q
 from django.contrib.auth.models import User
@@ -11,15 +11,12 @@ from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST, require_http_methods
 from django.utils import timezone
 from django.conf import settings
-import qrcode
-import qrcode.image.svg
 import uuid
 import io
 from PIL import Image
-from .models import Subject, SubjectQR
+from .models import Subject, SubjectQR, QRRegenerationJob
 from alarms.models import Alarm
-from alarms.tasks import send_whatsapp_notification
-from .tasks import create_test_alarm
+from .tasks import create_test_alarm, regenerate_qr_images
 from django.views.decorators.csrf import csrf_exempt
 from django.db import transaction
 from django.db.utils import OperationalError
@@ -28,10 +25,13 @@ import os
 from io import BytesIO
 from django.core.paginator import Paginator
 from django.core.cache import cache
-from functools import wraps
 from django.db import DatabaseError
 from django.core.files.base import ContentFile
 from .utils import get_location_from_ip
+from .qr_cache import parse_variant, qr_image_cache
+from . import cooldown, qr_render, qr_snapshot, qr_usage
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 
 logger = logging.getLogger(__name__)
 
@@ -228,6 +228,13 @@ def generate_qr(request):
     
     return redirect('subjects:qr_codes')
 
+def _set_qr_cache_headers(response, qr, variant):
+    """Add validators and the configured caching policy to a QR image response."""
+    response['ETag'] = variant.etag
+    response['Last-Modified'] = http_date(qr.created_at.timestamp())
+    response['Cache-Control'] = getattr(settings, 'QR_IMAGE_CACHE_CONTROL', 'private, max-age=86400')
+    return response
+
 @login_required
 def qr_image(request, uuid):
     """Generate and return a QR code image."""
@@ -238,78 +245,28 @@ def qr_image(request, uuid):
         if qr.subject.custodian != request.user.custodian:
             return HttpResponse(status=403)
         
+        url = request.build_absolute_uri(reverse('subjects:scan_qr_anonymous', args=[uuid]))
+        try:
+            variant = parse_variant(url, request.GET)
+        except ValueError as e:
+            return HttpResponse(str(e), status=400, content_type='text/plain')
+        
         # Force regeneration if requested
         force_regenerate = request.GET.get('regenerate') == '1'
         
-        # More thorough check for image existence
-        image_exists = False
-        if qr.image:
-            try:
-                # Try to access the file to confirm it truly exists and is valid
-                if qr.image.storage.exists(qr.image.path):
-                    with qr.image.open('rb') as f:
-                        # Check if file has content
-                        if f.read(10):  # Read first 10 bytes to check for empty file
-                            image_exists = True
-                            f.seek(0)  # Reset file pointer for future reads
-            except (ValueError, FileNotFoundError, OSError) as e:
-                logger.warning(f"Image file validation failed for QR {uuid}: {str(e)}")
-                image_exists = False
-        
-        # Generate QR code if it doesn't exist, is invalid, or regeneration is forced
-        if force_regenerate or not image_exists:
-            logger.debug(f"Generating new QR code image for {uuid} (forced: {force_regenerate}, exists: {image_exists})")
-            
-            # Clear existing image if there is one
-            if qr.image:
-                try:
-                    qr.image.delete(save=False)
-                except:
-                    pass
-            
-            # Create QR code instance
-            qr_code = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_M,  # Use Medium error correction
-                box_size=10,
-                border=4,
+        # The ETag is derived from the rendering inputs, so revalidation needs no image
+        if not force_regenerate:
+            response = get_conditional_response(
+                request,
+                etag=variant.etag,
+                last_modified=int(qr.created_at.timestamp())
             )
-            
-            # Add the URL data
-            url = request.build_absolute_uri(reverse('subjects:scan_qr_anonymous', args=[uuid]))
-            qr_code.add_data(url)
-            qr_code.make(fit=True)
-            
-            # Create the image
-            img = qr_code.make_image(fill_color="black", back_color="white")
-            
-            # Save to BytesIO
-            buffer = BytesIO()
-            img.save(buffer, format='PNG')
-            buffer.seek(0)  # Reset buffer position to beginning
-            
-            # Calculate file size for logging
-            file_size = buffer.getbuffer().nbytes
-            logger.debug(f"Generated QR image with size: {file_size} bytes")
-            
-            if file_size < 100:
-                logger.error(f"Generated QR image is suspiciously small: {file_size} bytes")
-                return HttpResponse("Invalid QR image generated", status=500)
-            
-            # Save to model
-            image_name = f'qr_{uuid}.png'
-            qr.image.save(image_name, ContentFile(buffer.getvalue()), save=True)
-            logger.debug(f"QR code image saved to {qr.image.path}")
-            
-        # Use FileResponse for better file handling
-        response = FileResponse(qr.image.open(), content_type='image/png')
-        
-        # Add cache control headers to prevent caching
-        response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response['Pragma'] = 'no-cache'
-        response['Expires'] = '0'
+            if response is not None:
+                return _set_qr_cache_headers(response, qr, variant)
         
-        return response
+        content = qr_image_cache.get(qr, variant, force=force_regenerate)
+        response = HttpResponse(content, content_type=variant.content_type)
+        return _set_qr_cache_headers(response, qr, variant)
             
     except Exception as e:
         logger.error(f"Error serving QR image for {uuid}: {str(e)}")
@@ -400,17 +357,7 @@ def delete_qr(request, uuid):
 
 def generate_qr_image(url):
     """Helper function to generate QR code image"""
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_M,  # Use Medium error correction
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(url)
-    qr.make(fit=True)
-    
-    # Create and return the image
-    return qr.make_image(fill_color="black", back_color="white")
+    return qr_render.to_image(qr_render.qr_matrix(url), box_size=10)
 
 @login_required
 @csrf_exempt
@@ -450,12 +397,8 @@ def scan_qr(request, uuid, view=None):
                 location=location
             )
             
-            # Update QR code last used
-            qr_code.last_used = timezone.now()
-            qr_code.save()
-            
-            # Schedule notification
-            send_whatsapp_notification.delay(alarm.id)
+            # Record the scan (the notification is queued through the alarm outbox)
+            qr_usage.touch(qr_code.id)
             
             if is_phototaker:
                 return JsonResponse({'status': 'success', 'message': 'Alarm created successfully'})
@@ -479,12 +422,8 @@ def scan_qr(request, uuid, view=None):
                     location=location
                 )
                 
-                # Update QR code last used
-                qr_code.last_used = timezone.now()
-                qr_code.save()
-                
-                # Schedule notification
-                send_whatsapp_notification.delay(alarm.id)
+                # Record the scan (the notification is queued through the alarm outbox)
+                qr_usage.touch(qr_code.id)
                 
                 return render(request, 'subjects/scan_success.html', {
                     'message': 'Test alarm created successfully'
@@ -496,58 +435,55 @@ def scan_qr(request, uuid, view=None):
         logger.error(f'Error in scan_qr: {str(e)}')
         return JsonResponse({'error': 'Internal server error'}, status=500)
 
-def prevent_duplicate_submission(timeout=5):
-    def decorator(view_func):
-        @wraps(view_func)
-        def wrapped(request, *args, **kwargs):
-            if request.method == "POST":
-                # Create a unique key based on user, URL, and QR UUID
-                cache_key = f"submission:{request.path}:{kwargs.get('uuid', '')}"
-                if cache.get(cache_key):
-                    return JsonResponse({"error": "Please wait before retrying"}, status=429)
-                cache.set(cache_key, True, timeout)
-            return view_func(request, *args, **kwargs)
-        return wrapped
-    return decorator
-
 @require_http_methods(["GET", "POST"])
-@prevent_duplicate_submission(timeout=5)
+@transaction.non_atomic_requests  # Only alarm creation needs a transaction; it opens its own
 def trigger_qr(request, uuid):
     """View to trigger a QR code scan"""
+    if request.method != "POST":
+        qr = get_object_or_404(SubjectQR, uuid=uuid)
+        return render(request, 'subjects/qr_trigger.html', {'qr': qr})
+
+    snapshot = qr_snapshot.get_qr_snapshot(uuid)
+    if snapshot is None:
+        raise Http404('QR code not found')
+
+    # Repeated triggers within the cooldown return the alarm already created
+    seconds = getattr(settings, 'QR_TRIGGER_COOLDOWN_SECONDS', 60)
+    gate = cooldown.acquire(snapshot['id'], seconds=seconds)
+    if gate.blocked:
+        if gate.alarm_id:
+            logger.info(f"Recent alarm exists for QR {uuid}, returning existing alarm {gate.alarm_id}")
+            return JsonResponse({"status": "success", "alarm_id": gate.alarm_id})
+        return JsonResponse({"error": "Please wait before retrying"}, status=429)
+
     try:
         with transaction.atomic():
             # Get QR code with select_for_update to prevent race conditions
-            qr = get_object_or_404(SubjectQR.objects.select_for_update(nowait=True), uuid=uuid)
-            
-            if request.method == "POST":
-                # Check if there's a recent pending alarm for this QR code
-                recent_alarm = Alarm.objects.filter(
-                    qr_code=qr,
-                    timestamp__gte=timezone.now() - timezone.timedelta(minutes=1)
-                ).first()
-
-                if recent_alarm:
-                    logger.info(f"Recent alarm exists for QR {uuid}, returning existing alarm {recent_alarm.id}")
-                    return JsonResponse({"status": "success", "alarm_id": recent_alarm.id})
-
-                # Create alarm with transaction
-                alarm = Alarm.objects.create(
-                    subject=qr.subject,
-                    qr_code=qr,
-                    is_test=True,
-                    notification_status='PENDING',
-                    timestamp=timezone.now()
-                )
-                
-                # Schedule notification after transaction commits
-                transaction.on_commit(lambda: send_whatsapp_notification.delay(alarm.id, is_test=True))
-                
-                logger.info(f"Created new test alarm {alarm.id} for QR {uuid}")
-                return JsonResponse({"status": "success", "alarm_id": alarm.id})
+            qr = SubjectQR.objects.select_for_update(nowait=True).filter(id=snapshot['id']).first()
+            if qr is None:
+                cooldown.release(snapshot['id'])
+                raise Http404('QR code not found')
+
+            if gate.from_database:
+                gate = cooldown.check_database(qr.id, seconds)
+                if gate.blocked:
+                    logger.info(f"Recent alarm exists for QR {uuid}, returning existing alarm {gate.alarm_id}")
+                    return JsonResponse({"status": "success", "alarm_id": gate.alarm_id})
+
+            # Create alarm; its notification is queued through the outbox in this transaction
+            alarm = Alarm.objects.create(
+                subject=qr.subject,
+                qr_code=qr,
+                is_test=True,
+                notification_status='PENDING',
+                timestamp=timezone.now()
+            )
             
-            return render(request, 'subjects/qr_trigger.html', {'qr': qr})
+            logger.info(f"Created new test alarm {alarm.id} for QR {uuid}")
+            return JsonResponse({"status": "success", "alarm_id": alarm.id})
             
     except DatabaseError as e:
+        cooldown.release(snapshot['id'])
         # Log the error and return a user-friendly message
         logger.error(f"Database error in trigger_qr: {str(e)}")
         return JsonResponse(
@@ -701,50 +637,18 @@ def regenerate_all_qr_images(request):
     """Admin-only function to regenerate all QR code images"""
     if request.method == 'POST':
         try:
-            count = 0
-            failed = 0
-            
-            # Get all QR codes
-            qr_codes = SubjectQR.objects.all()
+            # Rendering runs as a chunked background job
+            job = QRRegenerationJob.objects.create(
+                requested_by=request.user,
+                base_url=request.build_absolute_uri('/')
+            )
+            transaction.on_commit(lambda: regenerate_qr_images.delay(job.id))
+            status_url = reverse('subjects:regenerate_qr_images_status', args=[job.id])
             
-            for qr in qr_codes:
-                try:
-                    # Delete existing image
-                    if qr.image:
-                        qr.image.delete(save=False)
-                    
-                    # Create QR code instance
-                    qr_code = qrcode.QRCode(
-                        version=1,
-                        error_correction=qrcode.constants.ERROR_CORRECT_M,
-                        box_size=10,
-                        border=4,
-                    )
-                    
-                    # Add the URL data
-                    url = request.build_absolute_uri(reverse('subjects:scan_qr_anonymous', args=[qr.uuid]))
-                    qr_code.add_data(url)
-                    qr_code.make(fit=True)
-                    
-                    # Create the image
-                    img = qr_code.make_image(fill_color="black", back_color="white")
-                    
-                    # Save to BytesIO
-                    buffer = BytesIO()
-                    img.save(buffer, format='PNG')
-                    buffer.seek(0)  # Reset buffer position to beginning
-                    
-                    # Save to model
-                    image_name = f'qr_{qr.uuid}.png'
-                    qr.image.save(image_name, ContentFile(buffer.getvalue()), save=True)
-                    
-                    count += 1
-                    
-                except Exception as e:
-                    logger.error(f"Failed to regenerate QR image for {qr.uuid}: {str(e)}")
-                    failed += 1
+            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                return JsonResponse({'success': True, 'job_id': job.id, 'status_url': status_url}, status=202)
             
-            messages.success(request, f"Successfully regenerated {count} QR code images. Failed: {failed}")
+            messages.success(request, f"QR image regeneration started. Progress: {status_url}")
             return redirect('subjects:qr_codes')
         
         except Exception as e:
@@ -754,102 +658,126 @@ def regenerate_all_qr_images(request):
     # GET request - show confirmation form
     return render(request, 'subjects/regenerate_qr_images.html')
 
+@login_required
+@staff_member_required_403
+def regenerate_qr_images_status(request, pk):
+    """Return the progress of a QR image regeneration job"""
+    job = get_object_or_404(QRRegenerationJob, pk=pk)
+    return JsonResponse({
+        'id': job.id,
+        'status': job.status,
+        'total': job.total,
+        'processed': job.processed,
+        'failed': job.failed,
+        'progress': job.progress,
+        'error': job.error,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    })
+
+def _render_scan_inactive(request, qr):
+    return render(request, 'subjects/scan_result.html', {
+        'qr': qr,
+        'is_active': False,
+        'message': 'QR code is not active'
+    })
+
+def _render_scan_cooldown(request, qr, gate):
+    """Show the duplicate-scan page for a QR code still inside its cooldown"""
+    remaining_seconds = gate.remaining_seconds
+
+    message = (
+        f"A recent alarm already exists. To prevent duplicate notifications, "
+        f"please wait {remaining_seconds} seconds before scanning again."
+    )
+
+    return render(request, 'subjects/scan_result.html', {
+        'qr': qr,
+        'alarm': Alarm.objects.filter(id=gate.alarm_id).first() if gate.alarm_id else None,
+        'is_duplicate': True,
+        'cooldown_remaining': remaining_seconds,
+        'message': message
+    })
+
 @csrf_exempt
+@transaction.non_atomic_requests  # Only alarm creation needs a transaction; it opens its own
 def scan_qr_anonymous(request, uuid):
     """Handle anonymous QR code scanning with situation form"""
     logger.info(f"Received anonymous QR scan request for UUID: {uuid}")
-    
-    try:
-        with transaction.atomic():
-            # Get QR with lock to prevent race conditions
-            qr = get_object_or_404(SubjectQR.objects.select_for_update(nowait=True), uuid=uuid)
-            
-            if not qr.is_active:
-                return render(request, 'subjects/scan_result.html', {
-                    'qr': qr,
-                    'is_active': False,
-                    'message': 'QR code is not active'
-                })
 
-            # Check for recent alarms to prevent duplicates (5 seconds)
-            recent_alarm = Alarm.objects.filter(
-                qr_code=qr,
-                timestamp__gte=timezone.now() - timezone.timedelta(seconds=5)
-            ).first()
+    # The form and the early rejections are served from the cached snapshot and cooldown gate
+    snapshot = qr_snapshot.get_qr_snapshot(uuid)
+    if snapshot is None:
+        raise Http404('QR code not found')
+
+    if not snapshot['is_active']:
+        return _render_scan_inactive(request, snapshot)
+
+    if request.method != 'POST':
+        gate = cooldown.peek(snapshot['id'])
+        if gate.blocked:
+            return _render_scan_cooldown(request, snapshot, gate)
+        return render(request, 'subjects/scan_form.html', {'qr': snapshot})
+
+    situation_type = request.POST.get('situation')
+    description = request.POST.get('description', '').strip()
+    is_test = situation_type == 'TEST'
+
+    if not is_test:
+        if not situation_type or situation_type not in dict(Alarm.SITUATION_TYPES):
+            return render(request, 'subjects/scan_form.html', {
+                'qr': snapshot,
+                'error': 'Please select a valid situation type'
+            })
+
+        if not description:
+            return render(request, 'subjects/scan_form.html', {
+                'qr': snapshot,
+                'error': 'Please provide a description of the situation'
+            })
+
+    ip_address = request.META.get('REMOTE_ADDR')
+    gate = cooldown.acquire(snapshot['id'], ip_address)
+    if gate.blocked:
+        return _render_scan_cooldown(request, snapshot, gate)
 
-            if recent_alarm:
-                # Calculate remaining cooldown time
-                elapsed_time = (timezone.now() - recent_alarm.timestamp).total_seconds()
-                remaining_seconds = max(0, 5 - int(elapsed_time))
-                
-                message = (
-                    f"A recent alarm already exists. To prevent duplicate notifications, "
-                    f"please wait {remaining_seconds} seconds before scanning again."
+    try:
+        with transaction.atomic():
+            # Only alarm creation locks the QR row, to serialize concurrent reports
+            qr = SubjectQR.objects.select_for_update(nowait=True).filter(id=snapshot['id']).first()
+
+            if qr is None or not qr.is_active:
+                # Deleted or deactivated since the snapshot was cached
+                cooldown.release(snapshot['id'], ip_address)
+                return _render_scan_inactive(request, qr or snapshot)
+
+            if gate.from_database:
+                # Without Redis the recent-alarm check has to run under the lock
+                gate = cooldown.check_database(qr.id)
+                if gate.blocked:
+                    return _render_scan_cooldown(request, qr, gate)
+
+            if is_test:
+                # Create test alarm with default location
+                alarm = Alarm.objects.create(
+                    subject=qr.subject,
+                    qr_code=qr,
+                    notification_status='PENDING',
+                    timestamp=timezone.now(),
+                    is_test=True,
+                    situation_type='TEST',
+                    location='Test Scan',  # Add default location
+                    is_anonymous=True,
+                    ip_address=ip_address,
+                    user_agent=request.META.get('HTTP_USER_AGENT', '')
                 )
-                
-                return render(request, 'subjects/scan_result.html', {
-                    'qr': qr,
-                    'alarm': recent_alarm,
-                    'is_duplicate': True,
-                    'cooldown_remaining': remaining_seconds,
-                    'message': message
-                })
-
-            if request.method == 'POST':
-                situation_type = request.POST.get('situation')
-                description = request.POST.get('description', '').strip()
-                
-                if situation_type == 'TEST':
-                    # Create test alarm with default location
-                    alarm = Alarm.objects.create(
-                        subject=qr.subject,
-                        qr_code=qr,
-                        notification_status='PENDING',
-                        timestamp=timezone.now(),
-                        is_test=True,
-                        situation_type='TEST',
-                        location='Test Scan',  # Add default location
-                        is_anonymous=True,
-                        ip_address=request.META.get('REMOTE_ADDR'),
-                        user_agent=request.META.get('HTTP_USER_AGENT', '')
-                    )
-                    
-                    # Update QR code last used timestamp
-                    qr.last_used = timezone.now()
-                    qr.save(update_fields=['last_used'])
-                    
-                    # Schedule notification after transaction commits
-                    transaction.on_commit(lambda: send_whatsapp_notification.delay(alarm.id, is_test=True))
-                    
-                    logger.info(f"Created new test alarm {alarm.id} for QR {uuid}")
-                    
-                    return render(request, 'subjects/scan_result.html', {
-                        'qr': qr,
-                        'alarm': alarm,
-                        'is_test': True,
-                        'message': 'Test capture completed successfully.',
-                        'success': True
-                    })
-                
-                if not situation_type or situation_type not in dict(Alarm.SITUATION_TYPES):
-                    return render(request, 'subjects/scan_form.html', {
-                        'qr': qr,
-                        'error': 'Please select a valid situation type'
-                    })
-                
-                if not description:
-                    return render(request, 'subjects/scan_form.html', {
-                        'qr': qr,
-                        'error': 'Please provide a description of the situation'
-                    })
-                
+            else:
                 # Get location from request if available
-                location = None
                 if request.POST.get('lat') and request.POST.get('lng'):
                     location = f"{request.POST.get('lat')},{request.POST.get('lng')}"
                 else:
                     location = 'Unknown Location'  # Add default location
-                
+
                 # Create alarm with proper status
                 alarm = Alarm.objects.create(
                     subject=qr.subject,
@@ -861,34 +789,37 @@ def scan_qr_anonymous(request, uuid):
                     situation_type=situation_type,
                     description=description,
                     is_anonymous=True,
-                    ip_address=request.META.get('REMOTE_ADDR'),
+                    ip_address=ip_address,
                     user_agent=request.META.get('HTTP_USER_AGENT', '')
                 )
-                
-                # Update QR code last used timestamp
-                qr.last_used = timezone.now()
-                qr.save(update_fields=['last_used'])
-                
-                # Schedule notification after transaction commits
-                transaction.on_commit(lambda: send_whatsapp_notification.delay(alarm.id, is_test=False))
-                
-                logger.info(f"Created new anonymous alarm {alarm.id} for QR {uuid}")
-                
-                return render(request, 'subjects/scan_result.html', {
-                    'qr': qr,
-                    'alarm': alarm,
-                    'is_duplicate': False,
-                    'message': 'Thank you for your report. The custodian has been notified.',
-                    'success': True
-                })
-            
-            # GET request - show the form
-            return render(request, 'subjects/scan_form.html', {'qr': qr})
-            
+
+            # Written to last_used in bulk by the flush_qr_last_used task
+            qr_usage.touch(qr.id)
+
     except DatabaseError as e:
+        cooldown.release(snapshot['id'], ip_address)
         error_message = 'System is busy, please try again in a moment'
         logger.error(f"Database error in scan_qr_anonymous: {str(e)}")
         return render(request, 'subjects/scan_result.html', {
             'error': True,
             'message': error_message
         })
+
+    if is_test:
+        logger.info(f"Created new test alarm {alarm.id} for QR {uuid}")
+        return render(request, 'subjects/scan_result.html', {
+            'qr': qr,
+            'alarm': alarm,
+            'is_test': True,
+            'message': 'Test capture completed successfully.',
+            'success': True
+        })
+
+    logger.info(f"Created new anonymous alarm {alarm.id} for QR {uuid}")
+    return render(request, 'subjects/scan_result.html', {
+        'qr': qr,
+        'alarm': alarm,
+        'is_duplicate': False,
+        'message': 'Thank you for your report. The custodian has been notified.',
+        'success': True
+    })
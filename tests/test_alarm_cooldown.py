@@ -0,0 +1,76 @@
+from datetime import date
+from unittest.mock import patch
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.urls import reverse
+from redis.exceptions import ConnectionError
+from alarms.models import Alarm
+from subjects import cooldown
+from subjects.models import Subject, SubjectQR
+
+
+class AlarmCooldownTests(TestCase):
+    """Tests for the Redis duplicate-scan gate"""
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='cooldownuser', password='testpass123')
+        subject = Subject.objects.create(
+            name='Cooldown Subject', date_of_birth=date(2015, 1, 1), gender='O', custodian=user.custodian
+        )
+        self.qr = SubjectQR.objects.create(subject=subject, is_active=True)
+        self.url = reverse('subjects:scan_qr_anonymous', args=[self.qr.uuid])
+
+    def test_second_claim_is_rejected_without_queries(self):
+        """Only the first claim in a window succeeds and duplicates report the remaining time"""
+        self.assertFalse(cooldown.acquire(self.qr.id).blocked)
+
+        with self.assertNumQueries(0):
+            duplicate = cooldown.acquire(self.qr.id)
+        self.assertTrue(duplicate.blocked)
+        self.assertGreater(duplicate.remaining, 0)
+        self.assertIsNone(duplicate.alarm_id)
+
+        cooldown.record_alarm(self.qr.id, 42)
+        self.assertEqual(cooldown.peek(self.qr.id).alarm_id, 42)
+
+        cooldown.release(self.qr.id)
+        self.assertFalse(cooldown.acquire(self.qr.id).blocked)
+
+    def test_duplicate_post_never_reaches_alarm_table(self):
+        """A repeated report inside the cooldown is rejected before any insert"""
+        data = {'situation': 'INJURED', 'description': 'Fell down'}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, data, secure=True)
+        alarm = Alarm.objects.get(qr_code=self.qr)
+
+        response = self.client.post(self.url, data, secure=True)
+        self.assertTrue(response.context['is_duplicate'])
+        self.assertEqual(response.context['alarm'], alarm)
+        self.assertEqual(Alarm.objects.filter(qr_code=self.qr).count(), 1)
+
+    def test_invalid_post_does_not_claim_cooldown(self):
+        """A form error leaves the cooldown free for the corrected submission"""
+        self.client.post(self.url, {'situation': 'INJURED'}, secure=True)
+        self.assertFalse(cooldown.peek(self.qr.id).blocked)
+
+    def test_database_fallback_when_redis_is_down(self):
+        """Without Redis the gate falls back to the newest alarm in the database"""
+        Alarm.objects.create(subject=self.qr.subject, qr_code=self.qr, is_test=True)
+
+        with patch('subjects.cooldown.get_redis', side_effect=ConnectionError('down')):
+            gate = cooldown.acquire(self.qr.id)
+
+        self.assertTrue(gate.blocked)
+        self.assertTrue(gate.from_database)
+
+    def test_trigger_returns_existing_alarm(self):
+        """Repeated triggers inside the cooldown return the alarm already created"""
+        url = reverse('subjects:trigger_qr', args=[self.qr.uuid])
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.client.post(url, secure=True).json()
+        second = self.client.post(url, secure=True).json()
+
+        self.assertEqual(first['alarm_id'], second['alarm_id'])
+        self.assertEqual(Alarm.objects.filter(qr_code=self.qr).count(), 1)
@@ -0,0 +1,56 @@
+from datetime import date
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from subjects.models import Subject
+from alarms.exports import export_queryset
+from alarms.models import Alarm, AlarmDailyRollup, AlarmHourlyRollup, NotificationAttempt, NotificationChannel
+
+
+class AlarmCustodianTests(TestCase):
+    """Tests for the denormalized alarm owner column"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owneruser', password='testpass123')
+        self.subject = Subject.objects.create(
+            name='Owned Subject', date_of_birth=date(2013, 4, 4), gender='F', custodian=self.user.custodian
+        )
+
+    def test_alarm_and_attempt_copy_custodian(self):
+        alarm = Alarm.objects.create(subject=self.subject, is_test=True)
+        attempt = NotificationAttempt.objects.create(
+            alarm=alarm, recipient=self.user.custodian, channel=NotificationChannel.WHATSAPP
+        )
+        self.assertEqual(Alarm.objects.get(id=alarm.id).custodian_id, self.user.custodian.id)
+        self.assertEqual(NotificationAttempt.objects.get(id=attempt.id).custodian_id, self.user.custodian.id)
+
+    def test_reassigned_subject_moves_alarms(self):
+        alarm = Alarm.objects.create(subject=self.subject, is_test=True)
+        other = User.objects.create_user(username='newowner', password='testpass123')
+
+        self.subject.custodian = other.custodian
+        self.subject.save()
+
+        alarm.refresh_from_db()
+        self.assertEqual(alarm.custodian_id, other.custodian.id)
+        for model in (AlarmDailyRollup, AlarmHourlyRollup):
+            counts = model.objects.values('custodian_id').annotate(total=Sum('count'))
+            self.assertEqual({row['custodian_id']: row['total'] for row in counts}, {other.custodian.id: 1})
+
+    def test_subject_save_without_owner_change_leaves_alarms_alone(self):
+        Alarm.objects.create(subject=self.subject, is_test=True)
+        subject = Subject.objects.get(id=self.subject.id)
+        subject.name = 'Renamed Subject'
+
+        with CaptureQueriesContext(connection) as queries:
+            subject.save()
+
+        self.assertFalse([q['sql'] for q in queries if 'alarms_' in q['sql']])
+
+    def test_scoped_queries_skip_subject_join(self):
+        Alarm.objects.create(subject=self.subject, is_test=True)
+        queryset = export_queryset(self.user)
+        self.assertNotIn('subjects_subject', str(queryset.query))
+        self.assertEqual(queryset.count(), 1)
@@ -0,0 +1,99 @@
+import shutil
+import tempfile
+from unittest.mock import patch
+from datetime import date
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.urls import reverse
+from subjects.models import Subject, SubjectQR
+from alarms.models import Alarm, AlarmExport
+from alarms.tasks import build_alarm_export
+
+
+class AlarmExportTests(TestCase):
+    """Tests for the streaming alarm exports"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+        self.user = User.objects.create_user(
+            username='exportuser', password='testpass123', first_name='Ana', last_name='Lopez'
+        )
+        other = User.objects.create_user(username='otheruser', password='testpass123')
+        self.subject = Subject.objects.create(
+            name='Export Subject', date_of_birth=date(2011, 2, 3), gender='F', custodian=self.user.custodian
+        )
+        other_subject = Subject.objects.create(
+            name='Other Subject', date_of_birth=date(2011, 2, 3), gender='M', custodian=other.custodian
+        )
+        qr_code = SubjectQR.objects.create(subject=self.subject, is_active=True)
+        other_qr = SubjectQR.objects.create(subject=other_subject, is_active=True)
+        for i in range(5):
+            Alarm.objects.create(subject=self.subject, qr_code=qr_code, location=f'Spot {i}')
+        Alarm.objects.create(subject=other_subject, qr_code=other_qr, location='Elsewhere')
+
+        self.client.login(username='exportuser', password='testpass123')
+
+    def test_csv_is_streamed_without_per_row_queries(self):
+        """The CSV export streams the user's own alarms with a fixed number of queries"""
+        response = self.client.get(reverse('alarms:export_csv'), secure=True)
+        self.assertTrue(response.streaming)
+
+        with self.assertNumQueries(1):
+            content = b''.join(response.streaming_content).decode()
+
+        lines = content.strip().splitlines()
+        self.assertEqual(lines[0], 'Timestamp,Subject,Custodian,Location,Notification Status')
+        self.assertEqual(len(lines), 6)
+        self.assertIn('Export Subject,Ana Lopez,Spot 4,Pending', content)
+        self.assertNotIn('Other Subject', content)
+
+    def test_excel_export_is_scoped_to_user(self):
+        """The Excel export only includes the requesting user's alarms"""
+        with patch('alarms.exports.xlsxwriter.Workbook') as workbook_class:
+            self.client.get(reverse('alarms:export_excel'), secure=True)
+
+        options = workbook_class.call_args[0][1]
+        self.assertTrue(options['constant_memory'])
+        worksheet = workbook_class.return_value.add_worksheet.return_value
+        subjects = [c.args[2] for c in worksheet.write.call_args_list if c.args[1] == 2 and c.args[0] > 0]
+        self.assertEqual(subjects, ['Export Subject'] * 5)
+
+    def test_small_pdf_is_returned_directly(self):
+        """PDF exports under the sync limit are built in the request"""
+        response = self.client.get(reverse('alarms:export_pdf'), secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        self.assertFalse(AlarmExport.objects.exists())
+
+    @override_settings(ALARM_EXPORT_PDF_SYNC_LIMIT=2)
+    @patch('alarms.views.build_alarm_export.delay')
+    def test_large_pdf_is_built_in_background(self, delay):
+        """PDF exports over the sync limit are queued and downloaded once ready"""
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(reverse('alarms:export_pdf'), secure=True)
+
+        export = AlarmExport.objects.get()
+        download_url = reverse('alarms:export_download', args=[export.id])
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], download_url)
+        delay.assert_called_once_with(export.id)
+
+        response = self.client.get(download_url, secure=True)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Refresh'], '5')
+
+        with self.settings(MEDIA_ROOT=self.media_root):
+            build_alarm_export(export.id)
+            export.refresh_from_db()
+            self.assertEqual(export.status, AlarmExport.STATUS_READY)
+            self.assertEqual(export.row_count, 5)
+
+            status = self.client.get(reverse('alarms:export_status', args=[export.id]), secure=True).json()
+            self.assertEqual(status['download_url'], download_url)
+
+            response = self.client.get(download_url, secure=True)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+            response.close()
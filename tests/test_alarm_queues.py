@@ -0,0 +1,45 @@
+from unittest.mock import patch
+from datetime import date
+from django.test import TestCase
+from django.contrib.auth.models import User
+from core.celery import app
+from subjects.models import Subject
+from alarms.models import Alarm, NotificationStatus
+
+
+class AlarmQueueRoutingTests(TestCase):
+    """Tests for routing alarm work to its priority queue"""
+
+    def _queue(self, name, kwargs=None, **options):
+        return app.amqp.router.route(options, name, (), kwargs or {})['queue'].name
+
+    def test_notifications_are_routed_by_situation_and_test_flag(self):
+        notify = 'alarms.tasks.send_whatsapp_notification'
+        self.assertEqual(self._queue(notify, {'alarm_id': 1, 'is_test': False, 'situation_type': 'INJURED'}), 'alarms_urgent')
+        self.assertEqual(self._queue(notify, {'alarm_id': 1, 'is_test': False, 'situation_type': 'LOST'}), 'alarms_urgent')
+        self.assertEqual(self._queue(notify, {'alarm_id': 1, 'is_test': False, 'situation_type': None}), 'alarms_urgent')
+        self.assertEqual(self._queue(notify, {'alarm_id': 1, 'is_test': False, 'situation_type': 'CONTACT'}), 'alarms')
+        self.assertEqual(self._queue(notify, {'alarm_id': 1, 'is_test': True, 'situation_type': 'TEST'}), 'alarms_test')
+        # A queue chosen by the publisher wins over the router
+        self.assertEqual(self._queue(notify, {'alarm_id': 1, 'is_test': False}, queue='alarms_retry'), 'alarms_retry')
+
+    def test_other_tasks_keep_out_of_the_delivery_queues(self):
+        self.assertEqual(self._queue('alarms.tasks.escalate_undelivered_alarm', {'alarm_id': 1}), 'alarms_retry')
+        self.assertEqual(self._queue('alarms.tasks.cleanup_old_alarms'), 'maintenance')
+        self.assertEqual(self._queue('alarms.tasks.build_alarm_export', {'export_id': 1}), 'maintenance')
+        self.assertEqual(self._queue('alarms.tasks.apply_delivery_receipts'), 'alarms')
+        self.assertEqual(self._queue('subjects.tasks.regenerate_qr_images', {'job_id': 1}), 'subjects')
+
+    @patch('alarms.tasks.send_whatsapp_notification.apply_async')
+    def test_manual_retry_queues_behind_new_alarms(self, apply_async):
+        user = User.objects.create_user(username='queueuser', password='testpass123', is_staff=True)
+        subject = Subject.objects.create(
+            name='Queue Subject', date_of_birth=date(2015, 6, 6), gender='F', custodian=user.custodian
+        )
+        alarm = Alarm.objects.create(subject=subject, situation_type='INJURED')
+        Alarm.objects.filter(id=alarm.id).update(notification_status=NotificationStatus.FAILED)
+        self.client.force_login(user)
+
+        self.client.post(f'/api/v1/alarms/retry-notification/{alarm.id}', secure=True)
+
+        apply_async.assert_called_once_with((alarm.id,), queue='alarms_retry')
@@ -0,0 +1,133 @@
+from unittest.mock import patch
+from datetime import date, timedelta
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.db.models import Sum
+from django.urls import reverse
+from django.utils import timezone
+from subjects.models import Subject, SubjectQR
+from alarms.models import Alarm, AlarmDailyRollup, AlarmHourlyRollup, NotificationStatus
+from alarms.rollups import rebuild_rollups
+from alarms.statistics import api_statistics, custodian_statistics
+
+
+class AlarmRollupTests(TestCase):
+    """Tests for the incrementally maintained alarm statistics rollups"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='rollupuser', password='testpass123')
+        self.subject = Subject.objects.create(
+            name='Rollup Subject', date_of_birth=date(2013, 4, 5), gender='M', custodian=self.user.custodian
+        )
+        self.qr_code = SubjectQR.objects.create(subject=self.subject, is_active=True)
+
+    def _create_alarm(self, **kwargs):
+        return Alarm.objects.create(subject=self.subject, qr_code=self.qr_code, **kwargs)
+
+    def _counts(self, model=AlarmDailyRollup):
+        rows = model.objects.values('notification_status').annotate(total=Sum('count'))
+        return {row['notification_status']: row['total'] for row in rows if row['total']}
+
+    def test_created_alarms_are_counted(self):
+        """New alarms increment their daily and hourly buckets"""
+        self._create_alarm(situation_type='LOST')
+        self._create_alarm(situation_type='LOST')
+
+        daily = AlarmDailyRollup.objects.get()
+        self.assertEqual(daily.count, 2)
+        self.assertEqual(daily.custodian, self.user.custodian)
+        self.assertEqual(daily.situation_type, 'LOST')
+        self.assertEqual(self._counts(AlarmHourlyRollup), {NotificationStatus.PENDING: 2})
+
+    def test_status_change_moves_bucket(self):
+        """Saving a new notification status moves the alarm to the matching bucket"""
+        alarm = self._create_alarm()
+        alarm = Alarm.objects.get(id=alarm.id)
+        alarm.notification_status = NotificationStatus.DELIVERED
+        alarm.save(update_fields=['notification_status'])
+
+        self.assertEqual(self._counts(), {NotificationStatus.DELIVERED: 1})
+        self.assertEqual(self._counts(AlarmHourlyRollup), {NotificationStatus.DELIVERED: 1})
+
+        alarm.delete()
+        self.assertEqual(self._counts(), {})
+
+    def test_rebuild_matches_incremental_counts(self):
+        """Reconciling from the alarm table reproduces the incremental counters"""
+        self._create_alarm()
+        alarm = self._create_alarm()
+        # Bulk updates bypass signals and are corrected by reconciliation
+        Alarm.objects.filter(id=alarm.id).update(notification_status=NotificationStatus.SENT)
+
+        self.assertEqual(rebuild_rollups(), 2)
+        self.assertEqual(self._counts(), {NotificationStatus.PENDING: 1, NotificationStatus.SENT: 1})
+        self.assertEqual(self._counts(AlarmHourlyRollup), {NotificationStatus.PENDING: 1, NotificationStatus.SENT: 1})
+
+    def test_statistics_read_rollups(self):
+        """Statistics are answered from the rollups with a fixed number of queries"""
+        for _ in range(3):
+            self._create_alarm()
+        alarm = Alarm.objects.first()
+        alarm.notification_status = NotificationStatus.SENT
+        alarm.save()
+
+        with self.assertNumQueries(6):
+            data = api_statistics(self.user, 30)
+
+        self.assertEqual(data['total_alarms'], 3)
+        self.assertEqual(data['recent_alarms'], 3)
+        self.assertEqual(data['notifications']['sent'], 1)
+        self.assertEqual(data['notifications']['pending'], 2)
+        self.assertEqual(data['subject_stats'][0]['subject__name'], 'Rollup Subject')
+        self.assertAlmostEqual(data['subject_stats'][0]['notification_success_rate'], 100.0 / 3)
+        self.assertEqual(sum(hour['count'] for hour in data['hour_stats']), 3)
+
+        self.client.login(username='rollupuser', password='testpass123')
+        response = self.client.get(reverse('alarms:statistics_data'), {'days': 7}, secure=True)
+        self.assertEqual(response.json()['subject_data'], [3])
+
+    def test_custodian_statistics_keep_their_meaning(self):
+        """Own alarms only, totals over the range and a 7-day recent count"""
+        self.user.is_staff = True
+        self.user.save()
+        delivered = self._create_alarm()
+        Alarm.objects.filter(id=delivered.id).update(notification_status=NotificationStatus.DELIVERED)
+        self._create_alarm()
+        for days_ago in (10, 60):
+            # timestamp is auto_now_add, so older alarms are backdated afterwards
+            Alarm.objects.filter(id=self._create_alarm().id).update(timestamp=timezone.now() - timedelta(days=days_ago))
+        other = User.objects.create_user(username='otherrollup', password='testpass123')
+        other_subject = Subject.objects.create(
+            name='Other Subject', date_of_birth=date(2013, 4, 5), gender='F', custodian=other.custodian
+        )
+        Alarm.objects.create(subject=other_subject)
+        rebuild_rollups()
+
+        data = custodian_statistics(self.user, 30)
+
+        self.assertEqual(data['total_alarms'], 3)
+        self.assertEqual(data['recent_alarms'], 2)
+        self.assertEqual([s['subject__name'] for s in data['subject_stats']], ['Rollup Subject'])
+        self.assertEqual(data['notifications']['delivered'], 1)
+        # Both endpoints give the percentage of alarms sent or delivered
+        self.assertAlmostEqual(data['subject_stats'][0]['notification_success_rate'], 100.0 / 3)
+        self.assertAlmostEqual(api_statistics(self.user, 30)['subject_stats'][0]['notification_success_rate'], 100.0 / 3)
+
+    def test_windows_start_at_the_exact_time(self):
+        """Alarms earlier on the first day of the range are not counted as recent"""
+        now = timezone.localtime().replace(hour=12, minute=30, second=0, microsecond=0)
+        start = now - timedelta(days=1)
+        for offset in (timedelta(minutes=-45), timedelta(minutes=-10), timedelta(minutes=10), timedelta(hours=22)):
+            Alarm.objects.filter(id=self._create_alarm().id).update(timestamp=start + offset)
+        rebuild_rollups()
+
+        with patch('alarms.statistics.timezone.now', return_value=now):
+            data = api_statistics(self.user, 1)
+            custodian_data = custodian_statistics(self.user, 1)
+
+        self.assertEqual(data['total_alarms'], 4)
+        self.assertEqual(data['recent_alarms'], 2)
+        self.assertEqual(data['subject_stats'][0]['count'], 2)
+        self.assertEqual(sum(date['count'] for date in data['date_stats']), 2)
+        self.assertEqual(sum(hour['count'] for hour in data['hour_stats']), 2)
+        self.assertEqual(custodian_data['recent_alarms'], 2)
@@ -0,0 +1,95 @@
+from unittest.mock import patch
+from datetime import date, timedelta
+import time
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.utils import timezone
+from core.redis_client import get_redis
+from subjects.models import Subject
+from alarms.models import Alarm, NotificationStatus
+from alarms.scheduler import SCHEDULE_KEY, WAKEUP_KEY, dispatch_due
+from alarms.tasks import escalate_undelivered_alarm, send_whatsapp_notification
+
+
+@override_settings(ALARM_RETRY_BACKOFF_SECONDS=(10, 60), ALARM_ESCALATION_SECONDS=900)
+class AlarmSchedulerTests(TestCase):
+    """Tests for ETA-scheduled notification retries and escalations"""
+
+    def setUp(self):
+        get_redis().delete(SCHEDULE_KEY, WAKEUP_KEY)
+        user = User.objects.create_user(username='scheduleruser', password='testpass123')
+        user.custodian.phone_number = '+5215512345678'
+        user.custodian.save()
+        self.subject = Subject.objects.create(
+            name='Scheduler Subject', date_of_birth=date(2013, 3, 3), gender='F', custodian=user.custodian
+        )
+        self.alarm = Alarm.objects.create(subject=self.subject, is_test=True)
+
+    def tearDown(self):
+        get_redis().delete(SCHEDULE_KEY, WAKEUP_KEY)
+
+    def _scheduled(self):
+        return {member.decode(): score for member, score in get_redis().zrange(SCHEDULE_KEY, 0, -1, withscores=True)}
+
+    @patch('alarms.scheduler.app.send_task')
+    @patch('alarms.tasks.MessageService')
+    def test_failed_send_is_retried_at_its_due_time(self, service_class, send_task):
+        """A failed attempt schedules the retry at the backoff, and only then is it published"""
+        service_class.return_value.send_routes.side_effect = lambda routes, **kwargs: [
+            {'status': 'error', 'error': 'boom'} for _ in routes
+        ]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertFalse(send_whatsapp_notification(self.alarm.id))
+
+        scheduled = self._scheduled()
+        due = scheduled[f'retry:{self.alarm.id}']
+        self.assertAlmostEqual(due, time.time() + 10, delta=2)
+
+        self.assertEqual(dispatch_due(now=due - 1), 0)
+        self.assertEqual(dispatch_due(now=due), 1)
+        send_task.assert_called_once_with(
+            'alarms.tasks.send_whatsapp_notification', kwargs={'alarm_id': self.alarm.id}, queue='alarms_test'
+        )
+        self.assertEqual(self._scheduled(), {})
+
+    @patch('alarms.tasks.MessageService')
+    def test_early_retry_goes_back_on_the_schedule(self, service_class):
+        """A retry that arrives before its backoff is rescheduled instead of sent"""
+        Alarm.objects.filter(id=self.alarm.id).update(
+            notification_status=NotificationStatus.FAILED, notification_attempt_count=1,
+            last_attempt=timezone.now() - timedelta(seconds=4)
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(send_whatsapp_notification(self.alarm.id))
+
+        service_class.return_value.send_routes.assert_not_called()
+        self.assertAlmostEqual(self._scheduled()[f'retry:{self.alarm.id}'], time.time() + 6, delta=2)
+
+    @patch('alarms.tasks.MessageService')
+    def test_accepted_send_is_escalated_if_never_delivered(self, service_class):
+        """An accepted message schedules an escalation that fails it and schedules a retry"""
+        service_class.return_value.send_routes.side_effect = lambda routes, **kwargs: [
+            {'status': 'success', 'message_id': f'SM{i}'} for i, _ in enumerate(routes)
+        ]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(send_whatsapp_notification(self.alarm.id))
+        self.assertAlmostEqual(self._scheduled()[f'escalate:{self.alarm.id}'], time.time() + 900, delta=2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(escalate_undelivered_alarm(self.alarm.id))
+
+        self.alarm.refresh_from_db()
+        self.assertEqual(self.alarm.notification_status, NotificationStatus.FAILED)
+        self.assertIn(f'retry:{self.alarm.id}', self._scheduled())
+
+    def test_delivered_alarm_is_not_escalated(self):
+        Alarm.objects.filter(id=self.alarm.id).update(
+            notification_status=NotificationStatus.DELIVERED, notification_attempt_count=1
+        )
+
+        self.assertFalse(escalate_undelivered_alarm(self.alarm.id))
+        self.alarm.refresh_from_db()
+        self.assertEqual(self.alarm.notification_status, NotificationStatus.DELIVERED)
@@ -0,0 +1,75 @@
+from datetime import date, timedelta
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from subjects.models import Subject
+from alarms.models import Alarm
+
+
+class AlarmAPIPaginationTests(TestCase):
+    """Tests for cursor pagination, sparse fieldsets and delta sync on the alarms API"""
+
+    def setUp(self):
+        cache.clear()  # Throttle counters
+        self.user = User.objects.create_user(username='pageuser', password='testpass123')
+        subject = Subject.objects.create(
+            name='Paged Subject', date_of_birth=date(2012, 5, 5), gender='M', custodian=self.user.custodian
+        )
+        self.alarms = [Alarm.objects.create(subject=subject, is_test=True) for _ in range(5)]
+        # Same timestamp for two alarms so the id tie-breaker is exercised
+        base = timezone.now() - timedelta(hours=1)
+        for i, alarm in enumerate(self.alarms):
+            Alarm.objects.filter(id=alarm.id).update(
+                timestamp=base + timedelta(minutes=min(i, 3)), updated_at=base + timedelta(minutes=i)
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('alarms_api:alarm-list')
+
+    def test_cursor_pages_cover_every_alarm_once(self):
+        seen = []
+        response = self.client.get(self.url, {'page_size': 2}, secure=True)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            seen += [row['id'] for row in response.data['results']]
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'], secure=True)
+
+        self.assertEqual(seen, [alarm.id for alarm in reversed(self.alarms)])
+
+    def test_list_is_an_envelope(self):
+        """Lists return {next, results} instead of a bare array"""
+        response = self.client.get(self.url, {'page_size': 4}, secure=True)
+        self.assertEqual(set(response.data), {'next', 'results'})
+        self.assertEqual(len(response.data['results']), 4)
+        self.assertIn('cursor=', response.data['next'])
+
+        response = self.client.get(response.data['next'], secure=True)
+        self.assertEqual([row['id'] for row in response.data['results']], [self.alarms[0].id])
+        self.assertIsNone(response.data['next'])
+
+    def test_sparse_fieldset(self):
+        response = self.client.get(self.url, {'fields': 'location,notification_status'}, secure=True)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'location', 'notification_status'})
+
+    def test_delta_sync_returns_only_changed_alarms(self):
+        response = self.client.get(self.url, {'since': ''}, secure=True)
+        self.assertEqual([row['id'] for row in response.data['results']], [alarm.id for alarm in self.alarms])
+        since = response.data['since']
+
+        changed = self.alarms[1]
+        Alarm.objects.filter(id=changed.id).update(location='Moved', updated_at=timezone.now() - timedelta(minutes=1))
+        response = self.client.get(self.url, {'since': since}, secure=True)
+        self.assertEqual([row['id'] for row in response.data['results']], [changed.id])
+        self.assertFalse(response.data['has_more'])
+
+        response = self.client.get(self.url, {'since': response.data['since']}, secure=True)
+        self.assertEqual(response.data['results'], [])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'}, secure=True)
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,86 @@
+from unittest.mock import patch
+from datetime import date
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from subjects.models import Subject
+from alarms.models import Alarm, NotificationStatus
+from alarms.transitions import transition
+
+
+class ConditionalGetTests(TestCase):
+    """Tests for ETag/Last-Modified validators derived from custodian change versions"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='etaguser', password='testpass123')
+        self.subject = Subject.objects.create(
+            name='ETag Subject', date_of_birth=date(2016, 6, 6), gender='F', custodian=self.user.custodian
+        )
+        self.alarm = Alarm.objects.create(subject=self.subject, is_test=True)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('alarms_api:alarm-list')
+
+    def test_unchanged_poll_is_not_modified_without_alarm_queries(self):
+        response = self.client.get(self.url, secure=True)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, secure=True, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([q['sql'] for q in queries if 'alarms_alarm' in q['sql']])
+
+    def test_alarm_change_invalidates_etag(self):
+        etag = self.client.get(self.url, secure=True)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            transition(self.alarm, NotificationStatus.PROCESSING)
+
+        response = self.client.get(self.url, secure=True, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_other_custodians_changes_keep_etag(self):
+        etag = self.client.get(self.url, secure=True)['ETag']
+
+        other = User.objects.create_user(username='othercustodian', password='testpass123')
+        with self.captureOnCommitCallbacks(execute=True):
+            Subject.objects.create(
+                name='Other Subject', date_of_birth=date(2016, 6, 6), gender='M', custodian=other.custodian
+            )
+
+        response = self.client.get(self.url, secure=True, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_dashboard_revalidates(self):
+        self.client.force_login(self.user)
+        url = reverse('custodians:custodian_dashboard')
+        etag = self.client.get(url, secure=True)['ETag']
+        self.assertEqual(self.client.get(url, secure=True, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_alarm_list_only_shows_own_alarms(self):
+        other = User.objects.create_user(username='listother', password='testpass123')
+        other_subject = Subject.objects.create(
+            name='Other Subject', date_of_birth=date(2016, 6, 6), gender='M', custodian=other.custodian
+        )
+        Alarm.objects.create(subject=other_subject, is_test=True)
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('alarms:alarm_list'), secure=True)
+        self.assertEqual([alarm.id for alarm in response.context['page_obj']], [self.alarm.id])
+
+    def test_dashboard_etag_rolls_over_with_its_time_window(self):
+        """Counters over the last 24 hours change with time alone, so the ETag does too"""
+        self.client.force_login(self.user)
+        url = reverse('custodians:custodian_dashboard')
+        with patch('core.conditional._window_start', return_value=1700000000):
+            etag = self.client.get(url, secure=True)['ETag']
+            self.assertEqual(self.client.get(url, secure=True, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with patch('core.conditional._window_start', return_value=1700000060):
+            self.assertEqual(self.client.get(url, secure=True, HTTP_IF_NONE_MATCH=etag).status_code, 200)
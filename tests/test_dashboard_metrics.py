@@ -0,0 +1,48 @@
+from datetime import date
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from subjects.models import Subject, SubjectQR
+from alarms.models import Alarm
+from core.metrics import dashboard_metrics
+
+
+class DashboardMetricsTests(TestCase):
+    """Tests for the cached dashboard counters"""
+
+    def setUp(self):
+        cache.delete_many(['dashboard_metrics:staff'])
+        self.user = User.objects.create_user(username='metricsuser', password='testpass123')
+        self.custodian = self.user.custodian
+        self.subject = Subject.objects.create(
+            name='Metrics Subject', date_of_birth=date(2014, 6, 7), gender='F', custodian=self.custodian
+        )
+        self.qr_code = SubjectQR.objects.create(subject=self.subject, is_active=True)
+        Alarm.objects.create(subject=self.subject, qr_code=self.qr_code)
+
+    def tearDown(self):
+        cache.delete_many(['dashboard_metrics:staff', f'dashboard_metrics:custodian:{self.custodian.id}'])
+
+    def test_counters_use_one_query_per_table_and_are_cached(self):
+        """A custodian scope is computed in three queries and then served from cache"""
+        with self.assertNumQueries(3):
+            metrics = dashboard_metrics(self.custodian.id)
+
+        self.assertEqual(metrics['total_subjects'], 1)
+        self.assertEqual(metrics['active_qrs'], 1)
+        self.assertEqual(metrics['total_alarms'], 1)
+        self.assertEqual(metrics['alarms_last_24h'], 1)
+        self.assertEqual(metrics['notifications_failed'], 1)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(dashboard_metrics(self.custodian.id), metrics)
+
+    def test_writes_invalidate_cached_scopes(self):
+        """Creating an alarm drops both the custodian and system-wide counters"""
+        dashboard_metrics(self.custodian.id)
+        dashboard_metrics()
+
+        Alarm.objects.create(subject=self.subject, qr_code=self.qr_code)
+
+        self.assertEqual(dashboard_metrics(self.custodian.id)['total_alarms'], 2)
+        self.assertEqual(dashboard_metrics()['total_alarms'], 2)
@@ -0,0 +1,89 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock
+from django.test import TestCase, override_settings
+from core.messaging import MessageService
+from core.models import SystemParameter
+
+
+class FakeAsyncProvider:
+    """Provider stub that records how many sends are in flight at once"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.sessions = set()
+
+    async def send_message_async(self, session, to_number, message_data):
+        self.sessions.add(id(session))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        return {'success': True, 'message_id': f'wamid.{to_number}', 'status': 'SENT'}
+
+
+@override_settings(NOTIFICATION_PROVIDER='console', MESSAGE_DELIVERY_CONCURRENCY={'meta_whatsapp': 4})
+class DeliveryEngineTests(TestCase):
+    """Tests for MessageService sends through the async delivery engine"""
+
+    def setUp(self):
+        SystemParameter.objects.create(parameter='channel', value='1')
+        self.service = MessageService()
+        self.provider = FakeAsyncProvider()
+        self.service.whatsapp_provider = self.provider
+
+    def tearDown(self):
+        # Semaphores are sized on first use; start each test from a clean pool
+        self.service.engine.close()
+
+    def test_send_many_runs_concurrently_within_limit(self):
+        """send_many keeps several sends in flight but never above the provider limit"""
+        messages = [{'to_number': f'+52155{i:08d}', 'message': 'Hello'} for i in range(12)]
+
+        results = self.service.send_many(messages)
+
+        self.assertEqual(len(results), 12)
+        self.assertTrue(all(result['status'] == 'success' for result in results))
+        self.assertEqual(results[3]['meta_result']['message_id'], 'wamid.5215500000003')
+        self.assertEqual(self.provider.max_in_flight, 4)
+        # Every send reused the same pooled session
+        self.assertEqual(len(self.provider.sessions), 1)
+
+    def test_send_message_uses_console_provider_without_async_api(self):
+        """Blocking providers are run off the loop and still return results"""
+        self.service.whatsapp_provider = self.service.__class__().whatsapp_provider
+
+        result = self.service.send_message('+5215512345678', 'Console test')
+
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(result['meta_result']['provider'], 'console')
+
+    @override_settings(MESSAGE_DELIVERY_BLOCKING_THREADS=40)
+    def test_blocking_calls_do_not_share_the_default_executor(self):
+        """Blocking calls of many in-flight sends run side by side on the engine's own pool"""
+        engine = self.service.engine
+        engine.close()
+        started = time.monotonic()
+        engine.run_many(engine.call_sync(time.sleep, 0.1) for _ in range(40))
+        self.assertLess(time.monotonic() - started, 0.3)
+
+    @override_settings(TWILIO_ACCOUNT_SID='AC123', TWILIO_AUTH_TOKEN='token', MESSAGE_DELIVERY_TIMEOUT=7)
+    def test_twilio_requests_have_the_delivery_timeout(self):
+        """Twilio calls get the same time limit as the other providers"""
+        engine = self.service.engine
+        engine.close()
+
+        async def request():
+            http_client = engine.twilio_client().http_client
+            http_client.session = AsyncMock()
+            http_client.session.request.side_effect = ConnectionError('stop')
+            try:
+                await http_client.request('POST', 'https://api.twilio.com/Messages.json')
+            except ConnectionError:
+                pass
+            return http_client.session.request.call_args.kwargs['timeout']
+
+        self.assertEqual(engine.run(request()), 7)
+        engine.close()
@@ -0,0 +1,115 @@
+import json
+from datetime import date
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from core.redis_client import get_redis
+from subjects.models import Subject
+from alarms.models import Alarm, AlarmDailyRollup, NotificationStatus
+from alarms.receipts import GROUP, STREAM_KEY, consume
+
+
+class DeliveryReceiptTests(TestCase):
+    """Tests for the queued, batched delivery receipt webhooks"""
+
+    def setUp(self):
+        get_redis().delete(STREAM_KEY)
+        self.addCleanup(get_redis().delete, STREAM_KEY)
+        user = User.objects.create_user(username='receiptuser', password='testpass123')
+        subject = Subject.objects.create(
+            name='Receipt Subject', date_of_birth=date(2014, 3, 3), gender='F', custodian=user.custodian
+        )
+        self.twilio_alarm = Alarm.objects.create(
+            subject=subject, is_test=True, message_sid='SM123', notification_status=NotificationStatus.PROCESSING
+        )
+        self.meta_alarms = [
+            Alarm.objects.create(
+                subject=subject, is_test=True, whatsapp_message_id=f'wamid.{i}',
+                notification_status=NotificationStatus.PROCESSING
+            )
+            for i in range(2)
+        ]
+
+    def _twilio(self, status):
+        return self.client.post(
+            reverse('twilio_status_callback'), {'MessageSid': 'SM123', 'MessageStatus': status}, secure=True
+        )
+
+    def test_twilio_receipts_are_queued_and_applied_monotonically(self):
+        """The webhook only enqueues; the consumer applies the newest status and ignores late ones"""
+        self.assertEqual(self._twilio('delivered').status_code, 200)
+        self.assertEqual(self._twilio('sent').status_code, 200)
+        self.twilio_alarm.refresh_from_db()
+        self.assertEqual(self.twilio_alarm.notification_status, NotificationStatus.PROCESSING)
+
+        self.assertEqual(consume('test'), 2)
+        self.twilio_alarm.refresh_from_db()
+        self.assertEqual(self.twilio_alarm.notification_status, NotificationStatus.DELIVERED)
+        self.assertTrue(self.twilio_alarm.notification_sent)
+        self.assertEqual(consume('test'), 0)
+
+        # Rollups follow the bulk update
+        self.assertEqual(
+            AlarmDailyRollup.objects.get(notification_status=NotificationStatus.DELIVERED).count, 1
+        )
+
+    def test_meta_webhook_applies_every_status(self):
+        """All entries of the statuses array are applied, in one batch"""
+        payload = {
+            'object': 'whatsapp_business_account',
+            'entry': [{'changes': [{'value': {'statuses': [
+                {'id': 'wamid.0', 'status': 'delivered'},
+                {'id': 'wamid.1', 'status': 'failed', 'errors': [{'title': 'Unreachable'}]},
+            ]}}]}]
+        }
+        response = self.client.post(
+            reverse('alarms:notification_webhook'), json.dumps(payload), content_type='application/json', secure=True
+        )
+        self.assertEqual(response.status_code, 200)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(consume('test'), 2)
+        alarm_queries = [q['sql'].split()[0] for q in queries if 'FROM "alarms_alarm"' in q['sql'] or q['sql'].startswith('UPDATE "alarms_alarm"')]
+        # One read, then one conditional UPDATE for the batch
+        self.assertEqual(alarm_queries, ['SELECT', 'UPDATE'])
+
+        delivered, failed = (Alarm.objects.get(id=alarm.id) for alarm in self.meta_alarms)
+        self.assertEqual(delivered.notification_status, NotificationStatus.DELIVERED)
+        self.assertEqual(failed.notification_status, NotificationStatus.FAILED)
+        self.assertEqual(failed.notification_error, 'Unreachable')
+
+    def test_invalid_callback_is_rejected(self):
+        response = self.client.post(reverse('twilio_status_callback'), {'MessageStatus': 'sent'}, secure=True)
+        self.assertEqual(response.status_code, 400)
+
+    def test_receipt_before_message_id_is_retried(self):
+        """A receipt that beats its send result stays pending and is applied once the id is stored"""
+        alarm = Alarm.objects.create(
+            subject=self.twilio_alarm.subject, is_test=True, notification_status=NotificationStatus.PROCESSING
+        )
+        self.client.post(
+            reverse('twilio_status_callback'), {'MessageSid': 'SM-LATE', 'MessageStatus': 'delivered'}, secure=True
+        )
+
+        self.assertEqual(consume('test'), 1)
+        self.assertEqual(get_redis().xpending(STREAM_KEY, GROUP)['pending'], 1)
+
+        Alarm.objects.filter(id=alarm.id).update(message_sid='SM-LATE')
+        with override_settings(DELIVERY_RECEIPT_CLAIM_IDLE_MS=0):
+            self.assertEqual(consume('test'), 1)
+        alarm.refresh_from_db()
+        self.assertEqual(alarm.notification_status, NotificationStatus.DELIVERED)
+        self.assertEqual(get_redis().xpending(STREAM_KEY, GROUP)['pending'], 0)
+        self.assertEqual(get_redis().xlen(STREAM_KEY), 0)
+
+    @override_settings(DELIVERY_RECEIPT_MAX_AGE=-1)
+    def test_old_unmatched_receipt_is_dropped(self):
+        self.client.post(
+            reverse('twilio_status_callback'), {'MessageSid': 'SM-UNKNOWN', 'MessageStatus': 'delivered'}, secure=True
+        )
+
+        self.assertEqual(consume('test'), 1)
+        self.assertEqual(get_redis().xpending(STREAM_KEY, GROUP)['pending'], 0)
+        self.assertEqual(get_redis().xlen(STREAM_KEY), 0)
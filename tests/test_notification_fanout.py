@@ -0,0 +1,192 @@
+from unittest.mock import patch
+from datetime import date
+import asyncio
+import time
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from core.messaging import MessageService
+from core.redis_client import get_redis
+from subjects.models import Subject
+from alarms import fanout
+from alarms.fanout import DELIVERED_KEY, is_delivered, mark_delivered, notify
+from alarms.models import Alarm, NotificationAttempt, NotificationChannel, NotificationStatus
+from alarms.receipts import apply_receipts
+
+
+async def slow_send(self, channel, to_number, message):
+    await asyncio.sleep(0.2)
+    return {'status': 'success', 'message_id': f'SM-{channel.name}-{to_number}', 'channel': 'twilio_sms'}
+
+
+async def slow_email(self, to_email, subject, message):
+    await asyncio.sleep(0.2)
+    return {'status': 'success', 'to': to_email, 'channel': 'email'}
+
+
+@patch.object(MessageService, '_send_email', slow_email)
+@patch.object(MessageService, '_send', slow_send)
+@patch.object(MessageService, '_get_channel', lambda self: None)
+@override_settings(ALARM_FANOUT_STAGGER_SECONDS=0)
+class NotificationFanoutTests(TestCase):
+    """Tests for multi-recipient, multi-channel alarm notifications"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='fanoutuser', email='guardian@example.com', password='testpass123')
+        user.custodian.phone_number = '+12025550123'
+        user.custodian.emergency_phone = '+12025550188'
+        user.custodian.save()
+        subject = Subject.objects.create(
+            name='Fanout Subject', date_of_birth=date(2014, 4, 4), gender='M', custodian=user.custodian
+        )
+        self.alarm = Alarm.objects.create(subject=subject, situation_type='LOST')
+        client = get_redis()
+        client.delete(DELIVERED_KEY.format(alarm_id=self.alarm.id), *client.scan_iter('ratelimit:*'))
+
+    def tearDown(self):
+        get_redis().delete(DELIVERED_KEY.format(alarm_id=self.alarm.id))
+
+    def test_every_route_is_sent_concurrently(self):
+        """One attempt per contact and channel, all sent in the time of the slowest"""
+        started = time.monotonic()
+        result = notify(MessageService(), self.alarm, 'Alarm')
+        elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, 0.6)
+        self.assertEqual(result['message_id'], 'SM-META_WHATSAPP-+12025550123')
+        attempts = list(NotificationAttempt.objects.filter(alarm=self.alarm).order_by('priority'))
+        self.assertEqual(
+            [(a.channel, a.destination) for a in attempts],
+            [
+                (NotificationChannel.WHATSAPP, '+12025550123'),
+                (NotificationChannel.SMS, '+12025550123'),
+                (NotificationChannel.WHATSAPP, '+12025550188'),
+                (NotificationChannel.SMS, '+12025550188'),
+                (NotificationChannel.EMAIL, 'guardian@example.com'),
+            ]
+        )
+        self.assertEqual(attempts[-1].status, NotificationStatus.SENT)
+        for attempt in attempts:
+            self.assertGreaterEqual(attempt.latency_ms, 200)
+        # The fan-out counts as one attempt for the alarm
+        self.alarm.refresh_from_db()
+        self.assertEqual(self.alarm.notification_attempt_count, 0)
+
+    @override_settings(ALARM_FANOUT_STAGGER_SECONDS=0.05)
+    def test_delivery_suppresses_staggered_routes(self):
+        mark_delivered([self.alarm.id])
+
+        notify(MessageService(), self.alarm, 'Alarm')
+
+        statuses = list(
+            NotificationAttempt.objects.filter(alarm=self.alarm).order_by('priority').values_list('status', flat=True)
+        )
+        self.assertEqual(statuses, [NotificationStatus.ACCEPTED] + [NotificationStatus.CANCELLED] * 4)
+
+    @override_settings(ALARM_FANOUT_ROUTES=[('phone_number', 'whatsapp'), ('emergency_phone', 'sms')])
+    def test_first_delivery_wins(self):
+        """A receipt for any route delivers the alarm; one failed route does not fail it"""
+        self.alarm.notification_status = NotificationStatus.ACCEPTED
+        self.alarm.save()
+        notify(MessageService(), self.alarm, 'Alarm')
+
+        apply_receipts([{
+            'provider': 'twilio', 'message_id': 'SM-META_WHATSAPP-+12025550123',
+            'status': NotificationStatus.FAILED, 'error': 'Undelivered'
+        }])
+        self.alarm.refresh_from_db()
+        self.assertEqual(self.alarm.notification_status, NotificationStatus.ACCEPTED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_receipts([{
+                'provider': 'twilio', 'message_id': 'SM-TWILIO_SMS-+12025550188',
+                'status': NotificationStatus.DELIVERED, 'error': ''
+            }])
+        self.alarm.refresh_from_db()
+        self.assertEqual(self.alarm.notification_status, NotificationStatus.DELIVERED)
+        self.assertIsNotNone(NotificationAttempt.objects.get(message_id='SM-TWILIO_SMS-+12025550188').delivered_at)
+        self.assertTrue(is_delivered(self.alarm.id))
+
+    def test_test_alarm_only_uses_the_primary_route(self):
+        """Test alarms never reach emergency contacts"""
+        Alarm.objects.filter(id=self.alarm.id).update(is_test=True)
+        self.alarm.refresh_from_db()
+
+        notify(MessageService(), self.alarm, 'Test alarm')
+
+        self.assertEqual(
+            list(NotificationAttempt.objects.filter(alarm=self.alarm).values_list('channel', 'destination')),
+            [(NotificationChannel.WHATSAPP, '+12025550123')]
+        )
+
+    def test_retry_skips_routes_that_reached_someone(self):
+        notify(MessageService(), self.alarm, 'Alarm')
+        NotificationAttempt.objects.filter(
+            alarm=self.alarm, channel=NotificationChannel.SMS, destination='+12025550188'
+        ).update(status=NotificationStatus.DELIVERED)
+        NotificationAttempt.objects.filter(alarm=self.alarm).exclude(
+            status__in=[NotificationStatus.DELIVERED, NotificationStatus.SENT]
+        ).update(status=NotificationStatus.FAILED)
+        self.alarm.notification_attempt_count = 1
+
+        notify(MessageService(), self.alarm, 'Alarm')
+
+        retried = NotificationAttempt.objects.filter(alarm=self.alarm).order_by('-id')[:3]
+        self.assertEqual(
+            sorted((a.channel, a.destination) for a in retried),
+            [
+                (NotificationChannel.SMS, '+12025550123'),
+                (NotificationChannel.WHATSAPP, '+12025550123'),
+                (NotificationChannel.WHATSAPP, '+12025550188'),
+            ]
+        )
+
+    def test_receipts_combine_only_the_latest_round(self):
+        """An earlier round's outcome does not decide the status of a retry"""
+        notify(MessageService(), self.alarm, 'Alarm')
+        first_round = NotificationAttempt.objects.filter(alarm=self.alarm)
+        first_round.update(status=NotificationStatus.FAILED, message_id=None)
+        first_round.filter(channel=NotificationChannel.WHATSAPP, destination='+12025550123').update(
+            status=NotificationStatus.SENT
+        )
+        Alarm.objects.filter(id=self.alarm.id).update(
+            notification_status=NotificationStatus.ACCEPTED, notification_attempt_count=1
+        )
+        self.alarm.refresh_from_db()
+
+        notify(MessageService(), self.alarm, 'Alarm')
+        retry = NotificationAttempt.objects.filter(alarm=self.alarm, retry_count=1)
+        self.assertEqual(NotificationAttempt.objects.filter(alarm=self.alarm, retry_count=0).count(), 5)
+        retry.exclude(message_id='SM-META_WHATSAPP-+12025550123').update(status=NotificationStatus.FAILED)
+
+        apply_receipts([{
+            'provider': 'twilio', 'message_id': 'SM-META_WHATSAPP-+12025550123',
+            'status': NotificationStatus.FAILED, 'error': 'Undelivered'
+        }])
+        self.alarm.refresh_from_db()
+        self.assertEqual(self.alarm.notification_status, NotificationStatus.FAILED)
+
+    @override_settings(ALARM_FANOUT_STAGGER_SECONDS=0.5)
+    def test_receipt_for_first_route_cancels_waiting_routes(self):
+        """A receipt arriving while later routes wait out their head start finds its attempt"""
+        record_result = fanout._record_result
+        applied = []
+
+        def record_then_receive(attempt, result):
+            record_result(attempt, result)
+            if not applied:
+                # The provider confirms route 1 before route 2's head start is over
+                with self.captureOnCommitCallbacks(execute=True):
+                    applied.append(apply_receipts([{
+                        'provider': 'twilio', 'message_id': attempt.message_id,
+                        'status': NotificationStatus.DELIVERED, 'error': ''
+                    }]))
+
+        with patch('alarms.fanout._record_result', record_then_receive):
+            notify(MessageService(), self.alarm, 'Alarm')
+
+        self.assertEqual(applied, [1])
+        self.alarm.refresh_from_db()
+        self.assertEqual(self.alarm.notification_status, NotificationStatus.DELIVERED)
+        statuses = list(NotificationAttempt.objects.filter(alarm=self.alarm).order_by('priority').values_list('status', flat=True))
+        self.assertEqual(statuses[0], NotificationStatus.DELIVERED)
+        self.assertEqual(set(statuses[1:]), {NotificationStatus.CANCELLED})
@@ -0,0 +1,96 @@
+from unittest.mock import patch
+from datetime import date
+from django.test import TestCase
+from django.contrib.auth.models import User
+from core.redis_client import get_redis
+from subjects.models import Subject, SubjectQR
+from alarms.models import Alarm, NotificationOutbox, NotificationStatus
+from alarms.outbox import relay_pending, PUBLISHED_KEY
+from alarms.tasks import send_whatsapp_notification
+
+
+class NotificationOutboxTests(TestCase):
+    """Tests for the alarm notification outbox and relay"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='outboxuser', password='testpass123')
+        self.subject = Subject.objects.create(
+            name='Outbox Subject',
+            date_of_birth=date(2012, 5, 5),
+            gender='M',
+            custodian=self.user.custodian
+        )
+        self.qr_code = SubjectQR.objects.create(subject=self.subject, is_active=True)
+
+    def tearDown(self):
+        client = get_redis()
+        for entry in NotificationOutbox.objects.all():
+            client.delete(PUBLISHED_KEY.format(dedup_key=entry.dedup_key))
+
+    def test_alarm_creation_writes_one_outbox_entry(self):
+        """Each new alarm gets exactly one outbox entry, updates add none"""
+        alarm = Alarm.objects.create(subject=self.subject, qr_code=self.qr_code, is_test=True)
+        alarm.location = 'Updated'
+        alarm.save()
+
+        entry = NotificationOutbox.objects.get(alarm=alarm)
+        self.assertEqual(entry.dedup_key, f'alarm:{alarm.id}:notify')
+        self.assertEqual(entry.task_kwargs, {'alarm_id': alarm.id, 'is_test': True, 'situation_type': None})
+        self.assertIsNone(entry.dispatched_at)
+
+    @patch('alarms.outbox.app.send_task')
+    def test_relay_publishes_each_entry_once(self, send_task):
+        """The relay publishes pending entries once and marks them dispatched"""
+        alarms = [Alarm.objects.create(subject=self.subject, qr_code=self.qr_code) for _ in range(3)]
+
+        self.assertEqual(relay_pending(batch_size=2), 3)
+        self.assertEqual(send_task.call_count, 3)
+        send_task.assert_any_call(
+            'alarms.tasks.send_whatsapp_notification',
+            kwargs={'alarm_id': alarms[0].id, 'is_test': False, 'situation_type': None},
+            task_id=f'alarm:{alarms[0].id}:notify'
+        )
+        self.assertFalse(NotificationOutbox.objects.filter(dispatched_at__isnull=True).exists())
+
+        # A relay that crashed before marking rows must not publish them again
+        NotificationOutbox.objects.update(dispatched_at=None)
+        self.assertEqual(relay_pending(), 3)
+        self.assertEqual(send_task.call_count, 3)
+
+    @patch('alarms.outbox.app.send_task', side_effect=ConnectionError('broker down'))
+    def test_failed_publish_is_retried(self, send_task):
+        """Entries that fail to publish stay pending with the error recorded"""
+        alarm = Alarm.objects.create(subject=self.subject, qr_code=self.qr_code)
+
+        relay_pending()
+
+        entry = NotificationOutbox.objects.get(alarm=alarm)
+        self.assertIsNone(entry.dispatched_at)
+        self.assertEqual(entry.relay_attempts, 1)
+        self.assertEqual(entry.last_error, 'broker down')
+        self.assertFalse(get_redis().exists(PUBLISHED_KEY.format(dedup_key=entry.dedup_key)))
+
+    @patch('alarms.outbox.app.send_task')
+    def test_published_key_is_written_after_publishing(self, send_task):
+        """The dedup key only exists once the broker has accepted the task"""
+        alarm = Alarm.objects.create(subject=self.subject, qr_code=self.qr_code)
+        published_key = PUBLISHED_KEY.format(dedup_key=f'alarm:{alarm.id}:notify')
+        send_task.side_effect = lambda *args, **kwargs: self.assertFalse(get_redis().exists(published_key))
+
+        relay_pending()
+
+        send_task.assert_called_once()
+        self.assertTrue(get_redis().exists(published_key))
+
+    @patch('alarms.tasks.notify')
+    def test_republished_first_send_is_a_noop(self, notify):
+        """A first send the relay published twice does nothing once the alarm left PENDING"""
+        alarm = Alarm.objects.create(subject=self.subject, qr_code=self.qr_code)
+        Alarm.objects.filter(id=alarm.id).update(notification_status=NotificationStatus.FAILED)
+
+        result = send_whatsapp_notification.apply(args=(alarm.id,), task_id=f'alarm:{alarm.id}:notify')
+
+        self.assertTrue(result.get())
+        notify.assert_not_called()
+        alarm.refresh_from_db()
+        self.assertEqual(alarm.notification_status, NotificationStatus.FAILED)
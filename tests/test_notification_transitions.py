@@ -0,0 +1,111 @@
+from unittest.mock import patch
+from datetime import date
+from django.test import TestCase, override_settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from subjects.models import Subject
+from alarms.models import Alarm, AlarmDailyRollup, NotificationStatus
+from alarms.tasks import process_pending_alarms, send_whatsapp_notification
+from django.utils import timezone
+from alarms.transitions import claim, transition, transition_many
+
+
+class NotificationTransitionTests(TestCase):
+    """Tests for compare-and-swap notification status transitions"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='transitionuser', password='testpass123')
+        user.custodian.phone_number = '+5215512345678'
+        user.custodian.save()
+        self.subject = Subject.objects.create(
+            name='Transition Subject', date_of_birth=date(2011, 2, 2), gender='M', custodian=user.custodian
+        )
+        self.alarm = Alarm.objects.create(subject=self.subject, is_test=True)
+
+    def test_only_one_claim_wins(self):
+        """Two senders holding the same PENDING alarm cannot both claim it"""
+        stale = Alarm.objects.get(id=self.alarm.id)
+
+        self.assertTrue(transition(self.alarm, NotificationStatus.PROCESSING))
+        self.assertFalse(transition(stale, NotificationStatus.PROCESSING))
+        self.assertEqual(stale.notification_status, NotificationStatus.PROCESSING)
+
+    def test_claims_sharing_a_timestamp_do_not_share_alarms(self):
+        """A second claim in the same clock tick gets nothing the first one claimed"""
+        other = Alarm.objects.create(subject=self.subject, is_test=True)
+        with patch('alarms.transitions.timezone.now', return_value=timezone.now()):
+            first = claim([self.alarm.id, other.id])
+            second = claim([self.alarm.id, other.id])
+
+        self.assertEqual([alarm.id for alarm in first], [self.alarm.id, other.id])
+        self.assertEqual(second, [])
+
+    def test_batch_claim_is_one_update(self):
+        """Claiming a batch costs one UPDATE however many alarms it holds"""
+        others = [Alarm.objects.create(subject=self.subject, is_test=True) for _ in range(3)]
+        ids = [self.alarm.id] + [alarm.id for alarm in others]
+
+        with CaptureQueriesContext(connection) as queries:
+            claimed = claim(ids)
+
+        self.assertEqual([alarm.id for alarm in claimed], ids)
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE "alarms_alarm"')]), 1)
+
+    def test_claim_without_update_returning(self):
+        """Backends without UPDATE ... RETURNING lock the matching rows first"""
+        other = Alarm.objects.create(subject=self.subject, is_test=True)
+        transition(other, NotificationStatus.PROCESSING)
+
+        with patch('alarms.transitions._supports_update_returning', return_value=False):
+            claimed = claim([self.alarm.id, other.id])
+
+        self.assertEqual([alarm.id for alarm in claimed], [self.alarm.id])
+
+    def test_batch_write_loses_to_concurrent_writer_of_same_status(self):
+        """A row another writer moved to the same status is not counted as this batch's win"""
+        transition(self.alarm, NotificationStatus.PROCESSING)
+        stale = Alarm.objects.get(id=self.alarm.id)
+        transition(self.alarm, NotificationStatus.FAILED, notification_error='receipt')
+
+        stale.notification_status = NotificationStatus.FAILED
+        stale.notification_error = 'sweep'
+        self.assertEqual(transition_many([stale], NotificationStatus.PROCESSING, ['notification_status', 'notification_error']), [])
+        self.alarm.refresh_from_db()
+        self.assertEqual(self.alarm.notification_error, 'receipt')
+
+    def test_stale_writer_cannot_downgrade(self):
+        """A delivered alarm is not moved back to ACCEPTED by a slower sender"""
+        transition(self.alarm, NotificationStatus.PROCESSING)
+        stale = Alarm.objects.get(id=self.alarm.id)
+        self.assertTrue(transition(self.alarm, NotificationStatus.DELIVERED, notification_sent=True))
+
+        self.assertFalse(transition(stale, NotificationStatus.ACCEPTED, count_attempt=True, message_sid='SM1'))
+        self.alarm.refresh_from_db()
+        self.assertEqual(self.alarm.notification_status, NotificationStatus.DELIVERED)
+        self.assertEqual(self.alarm.notification_attempt_count, 0)
+        self.assertEqual(
+            AlarmDailyRollup.objects.get(notification_status=NotificationStatus.DELIVERED).count, 1
+        )
+
+    @patch('alarms.tasks.MessageService')
+    def test_task_skips_alarm_claimed_elsewhere(self, service_class):
+        """The notification task returns without sending when another sender holds the alarm"""
+        transition(self.alarm, NotificationStatus.PROCESSING)
+
+        self.assertTrue(send_whatsapp_notification(self.alarm.id))
+        service_class.return_value.send_message.assert_not_called()
+
+    @override_settings(ALARM_SWEEP_BATCH_SIZE=10)
+    @patch('alarms.tasks.MessageService')
+    def test_sweep_keeps_status_set_during_dispatch(self, service_class):
+        """A receipt applied while the sweep is sending is not overwritten by its write-back"""
+        def deliver_during_send(messages):
+            Alarm.objects.filter(id=self.alarm.id).update(notification_status=NotificationStatus.DELIVERED)
+            return [{'status': 'success', 'message_id': 'SM123'} for _ in messages]
+        service_class.return_value.send_many.side_effect = deliver_during_send
+
+        process_pending_alarms()
+
+        self.alarm.refresh_from_db()
+        self.assertEqual(self.alarm.notification_status, NotificationStatus.DELIVERED)
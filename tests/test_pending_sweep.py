@@ -0,0 +1,83 @@
+from unittest.mock import patch
+from datetime import date, timedelta
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.utils import timezone
+from subjects.models import Subject, SubjectQR
+from alarms.models import Alarm, AlarmDailyRollup, NotificationStatus
+from alarms.tasks import process_pending_alarms
+
+
+@override_settings(ALARM_SWEEP_BATCH_SIZE=2)
+class PendingSweepTests(TestCase):
+    """Tests for the batched pending alarm sweep"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='sweepuser', password='testpass123')
+        self.custodian = self.user.custodian
+        self.custodian.phone_number = '+5215512345678'
+        self.custodian.save()
+        self.subject = Subject.objects.create(
+            name='Sweep Subject',
+            date_of_birth=date(2010, 1, 1),
+            gender='F',
+            custodian=self.custodian
+        )
+        self.qr_code = SubjectQR.objects.create(subject=self.subject, is_active=True)
+
+    def _create_alarms(self, count):
+        return [
+            Alarm.objects.create(subject=self.subject, qr_code=self.qr_code, location=f'Spot {i}')
+            for i in range(count)
+        ]
+
+    @patch('alarms.tasks.MessageService')
+    def test_sweep_drains_all_batches(self, service_class):
+        """All pending alarms are sent across several keyset batches"""
+        service_class.return_value.send_many.side_effect = lambda messages: [
+            {'status': 'success', 'message_id': 'SM123'} for _ in messages
+        ]
+        alarms = self._create_alarms(5)
+
+        result = process_pending_alarms()
+
+        self.assertEqual(result, {'processed': 5, 'errors': 0})
+        # One dispatch call per batch of two
+        self.assertEqual(service_class.return_value.send_many.call_count, 3)
+        for alarm in alarms:
+            alarm.refresh_from_db()
+            self.assertEqual(alarm.notification_status, NotificationStatus.SENT)
+            self.assertTrue(alarm.notification_sent)
+            self.assertEqual(alarm.notification_attempt_count, 1)
+            self.assertEqual(alarm.message_sid, 'SM123')
+        # Bulk writes still move the alarms between statistics buckets
+        rollup = AlarmDailyRollup.objects.get(count__gt=0)
+        self.assertEqual((rollup.notification_status, rollup.count), (NotificationStatus.SENT, 5))
+
+    @patch('alarms.tasks.MessageService')
+    def test_sweep_records_errors_in_bulk(self, service_class):
+        """Failed sends are written back as ERROR with the provider message"""
+        service_class.return_value.send_many.side_effect = lambda messages: [
+            {'status': 'error', 'error': 'boom'} for _ in messages
+        ]
+        alarms = self._create_alarms(3)
+
+        result = process_pending_alarms()
+
+        self.assertEqual(result, {'processed': 0, 'errors': 3})
+        for alarm in alarms:
+            alarm.refresh_from_db()
+            self.assertEqual(alarm.notification_status, NotificationStatus.ERROR)
+            self.assertEqual(alarm.notification_error, 'boom')
+            self.assertEqual(alarm.notification_attempt_count, 1)
+
+    @patch('alarms.tasks.MessageService')
+    def test_sweep_skips_recent_attempts(self, service_class):
+        """Alarms attempted in the last two minutes are left alone"""
+        alarm = self._create_alarms(1)[0]
+        Alarm.objects.filter(id=alarm.id).update(last_attempt=timezone.now() - timedelta(seconds=30))
+
+        self.assertIsNone(process_pending_alarms())
+        service_class.return_value.send_many.assert_not_called()
+        alarm.refresh_from_db()
+        self.assertEqual(alarm.notification_status, NotificationStatus.PENDING)
@@ -0,0 +1,87 @@
+from unittest.mock import patch
+from django.test import TestCase, override_settings
+from core import provider_health
+from core.messaging import MessageChannel, MessageService
+from core.models import SystemParameter
+from core.parameters import system_parameters
+from core.redis_client import get_redis
+from notifications.providers import WhatsAppAPIProvider
+
+PROVIDERS = [channel.provider for channel in MessageChannel]
+
+
+def clear_health():
+    client = get_redis()
+    keys = list(client.scan_iter('providers:*')) + list(client.scan_iter('ratelimit:*'))
+    if keys:
+        client.delete(*keys)
+
+
+@override_settings(PROVIDER_BREAKER_FAILURES=3, PROVIDER_HEALTH_MIN_SAMPLES=5, PROVIDER_BREAKER_COOLDOWN=30)
+class ProviderHealthTests(TestCase):
+    """Tests for shared provider health and circuit breakers"""
+
+    def setUp(self):
+        clear_health()
+
+    def tearDown(self):
+        clear_health()
+
+    def test_failure_burst_opens_circuit_until_probe_succeeds(self):
+        for _ in range(3):
+            provider_health.record('meta_whatsapp', False, 100)
+
+        self.assertEqual(provider_health.stats(['meta_whatsapp'])['meta_whatsapp']['state'], provider_health.OPEN)
+        self.assertEqual(provider_health.rank(['meta_whatsapp', 'twilio_whatsapp']), ['twilio_whatsapp', 'meta_whatsapp'])
+
+        # Cooldown over: exactly one caller gets to probe
+        get_redis().delete(provider_health.OPEN_KEY.format(provider='meta_whatsapp'))
+        self.assertEqual(provider_health.rank(['twilio_whatsapp', 'meta_whatsapp']), ['meta_whatsapp', 'twilio_whatsapp'])
+        self.assertEqual(provider_health.rank(['twilio_whatsapp', 'meta_whatsapp']), ['twilio_whatsapp', 'meta_whatsapp'])
+
+        provider_health.record('meta_whatsapp', True, 100)
+        self.assertEqual(provider_health.stats(['meta_whatsapp'])['meta_whatsapp']['state'], provider_health.CLOSED)
+
+    def test_faster_provider_is_ranked_first(self):
+        for _ in range(5):
+            provider_health.record('meta_whatsapp', True, 900)
+            provider_health.record('twilio_whatsapp', True, 150)
+
+        self.assertEqual(provider_health.rank(['meta_whatsapp', 'twilio_whatsapp']), ['twilio_whatsapp', 'meta_whatsapp'])
+        self.assertEqual(provider_health.stats(['twilio_whatsapp'])['twilio_whatsapp']['p90'], 150)
+
+    @override_settings(
+        NOTIFICATION_PROVIDER='console', TWILIO_ACCOUNT_SID='AC123', TWILIO_AUTH_TOKEN='token',
+        TWILIO_WHATSAPP_NUMBER='+12025550100', TWILIO_PHONE_NUMBER='+12025550101'
+    )
+    def test_send_fails_over_to_healthy_provider(self):
+        """A failed provider call is retried on the next provider within the same send"""
+        async def send(service, channel, to_number, message):
+            if channel == MessageChannel.META_WHATSAPP:
+                return {'status': 'error', 'error': 'Meta is down', 'channel': 'meta_whatsapp'}
+            return {'status': 'success', 'message_sid': 'SM1', 'channel': channel.provider}
+
+        service = MessageService()
+        with patch.object(MessageService, '_get_channel', lambda self: MessageChannel.META_WHATSAPP), \
+                patch.object(MessageService, '_send', send):
+            result = service.send_message('+12025550123', 'Alarm')
+
+        self.assertEqual(result['channel'], 'twilio_whatsapp')
+        health = provider_health.stats(PROVIDERS)
+        self.assertEqual(health['meta_whatsapp']['samples'], 1)
+        self.assertEqual(health['twilio_whatsapp']['samples'], 1)
+        self.assertEqual(health['twilio_sms']['samples'], 0)
+
+
+class MetaProviderTests(TestCase):
+    """Tests for the provider behind the Meta WhatsApp channel"""
+
+    def tearDown(self):
+        system_parameters.invalidate()
+
+    @override_settings(NOTIFICATION_PROVIDER='meta')
+    def test_meta_sends_use_the_whatsapp_api_when_sms_is_configured(self):
+        SystemParameter.objects.create(parameter='channel', value=MessageChannel.TWILIO_SMS.value)
+        system_parameters.invalidate()
+
+        self.assertIsInstance(MessageService().whatsapp_provider, WhatsAppAPIProvider)
@@ -0,0 +1,84 @@
+import shutil
+import tempfile
+from unittest.mock import patch
+from datetime import date
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.urls import reverse
+from subjects.models import Subject, SubjectQR
+from django.core.files.base import ContentFile
+from subjects.qr_cache import qr_image_cache, render
+
+
+class QRImageCacheTests(TestCase):
+    """Tests for the cached, conditionally served QR images"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        cache.clear()
+        qr_image_cache.clear_local()
+        self.user = User.objects.create_user(username='qrcacheuser', password='testpass123')
+        subject = Subject.objects.create(
+            name='QR Subject', date_of_birth=date(2015, 1, 1), gender='O', custodian=self.user.custodian
+        )
+        self.qr = SubjectQR.objects.create(subject=subject, is_active=True)
+        self.url = reverse('subjects:qr_image', args=[self.qr.uuid])
+        self.client.login(username='qrcacheuser', password='testpass123')
+
+    def test_image_is_rendered_once_and_revalidated_with_304(self):
+        """The first request renders and stores the PNG, later ones hit the cache or return 304"""
+        with patch('subjects.qr_cache.render', wraps=render) as render_mock:
+            response = self.client.get(self.url, secure=True)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'image/png')
+            self.assertTrue(response.content.startswith(b'\x89PNG'))
+            self.assertIn('max-age', response['Cache-Control'])
+            etag = response['ETag']
+
+            self.assertEqual(self.client.get(self.url, secure=True).content, response.content)
+            not_modified = self.client.get(self.url, secure=True, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(render_mock.call_count, 1)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], etag)
+        self.qr.refresh_from_db()
+        self.assertTrue(self.qr.image)
+
+    def test_variants_have_distinct_etags(self):
+        """Size, format and error correction each produce their own cached variant"""
+        default = self.client.get(self.url, secure=True)
+        svg = self.client.get(self.url, {'format': 'svg', 'ec': 'H', 'size': 4}, secure=True)
+
+        self.assertEqual(svg['Content-Type'], 'image/svg+xml')
+        self.assertIn(b'<svg', svg.content)
+        self.assertNotEqual(default['ETag'], svg['ETag'])
+
+    def test_invalid_variant_is_rejected(self):
+        """Unsupported parameters return 400"""
+        self.assertEqual(self.client.get(self.url, {'size': 500}, secure=True).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'format': 'gif'}, secure=True).status_code, 400)
+
+    def test_stored_image_of_another_version_is_rendered_again(self):
+        """A PNG stored before the current render version is not served under the new ETag"""
+        self.qr.image.save(f'qr_{self.qr.uuid}.png', ContentFile(b'old render'), save=True)
+
+        response = self.client.get(self.url, secure=True)
+
+        self.assertTrue(response.content.startswith(b'\x89PNG'))
+        self.qr.refresh_from_db()
+        self.assertNotEqual(self.qr.image.name, f'qr_codes/qr_{self.qr.uuid}.png')
+
+    def test_storing_the_rendered_image_does_not_save_the_qr_code(self):
+        """The cache-miss path only writes the image name, without SubjectQR.save()"""
+        with patch('subjects.models.SubjectQR.save') as save:
+            self.client.get(self.url, secure=True)
+
+        save.assert_not_called()
+        self.qr.refresh_from_db()
+        self.assertTrue(self.qr.image)
@@ -0,0 +1,51 @@
+from datetime import date
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from subjects.models import Subject, SubjectQR
+from subjects.qr_usage import flush_last_used
+
+
+class QRLastUsedTests(TestCase):
+    """Tests for write-behind scan timestamps and conditional sibling deactivation"""
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='lastuseduser', password='testpass123')
+        self.subject = Subject.objects.create(
+            name='Last Used Subject', date_of_birth=date(2015, 1, 1), gender='O', custodian=user.custodian
+        )
+        self.qr = SubjectQR.objects.create(subject=self.subject, is_active=True)
+
+    def test_scan_only_inserts_and_flush_writes_last_used(self):
+        """A scan does not update the QR row; the flush writes the buffered timestamp"""
+        url = reverse('subjects:scan_qr_anonymous', args=[self.qr.uuid])
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {'situation': 'TEST'}, secure=True)
+
+        writes = [q['sql'] for q in queries if q['sql'].startswith(('INSERT', 'UPDATE'))]
+        self.assertTrue(writes[0].startswith('INSERT INTO "alarms_alarm"'))
+        self.assertFalse([sql for sql in writes if '"subjects_subjectqr"' in sql])
+
+        self.qr.refresh_from_db()
+        self.assertIsNone(self.qr.last_used)
+        self.assertEqual(flush_last_used(), 1)
+        self.qr.refresh_from_db()
+        self.assertIsNotNone(self.qr.last_used)
+        self.assertEqual(flush_last_used(), 0)
+
+    def test_siblings_deactivated_only_on_activation(self):
+        """Saving an already active QR code leaves its siblings alone"""
+        qr = SubjectQR.objects.get(id=self.qr.id)
+        with CaptureQueriesContext(connection) as queries:
+            qr.save(update_fields=['last_used'])
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+
+        second = SubjectQR.objects.create(subject=self.subject, is_active=True)
+        self.assertEqual(second.deactivated_siblings, 1)
+        self.qr.refresh_from_db()
+        self.assertFalse(self.qr.is_active)
@@ -0,0 +1,63 @@
+import shutil
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+from datetime import date
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.urls import reverse
+from subjects.models import Subject, SubjectQR, QRRegenerationJob
+from subjects.tasks import regenerate_qr_images, regenerate_qr_image_chunk
+
+
+class QRRegenerationJobTests(TestCase):
+    """Tests for the chunked bulk QR image regeneration"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, QR_REGENERATION_CHUNK_SIZE=2)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.admin = User.objects.create_user(username='qradmin', password='testpass123', is_staff=True)
+        for i in range(5):
+            subject = Subject.objects.create(
+                name=f'Subject {i}', date_of_birth=date(2010, 1, 1), gender='M', custodian=self.admin.custodian
+            )
+            SubjectQR.objects.create(subject=subject, is_active=True)
+        self.client.login(username='qradmin', password='testpass123')
+
+    @patch('subjects.tasks.regenerate_qr_image_chunk.delay')
+    def test_post_starts_job_and_chunks_report_progress(self, chunk_delay):
+        """The view queues a job whose chunks fill in the progress counters"""
+        with patch('subjects.views.regenerate_qr_images.delay') as job_delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    reverse('subjects:regenerate_all_qr_images'), secure=True, HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+                )
+        self.assertEqual(response.status_code, 202)
+        job = QRRegenerationJob.objects.get()
+        job_delay.assert_called_once_with(job.id)
+
+        # Run the planner and then each queued chunk inline
+        self.assertEqual(regenerate_qr_images(job.id), 3)
+        for call in chunk_delay.call_args_list:
+            regenerate_qr_image_chunk(*call.args)
+
+        status = self.client.get(response.json()['status_url'], secure=True).json()
+        self.assertEqual(status['status'], QRRegenerationJob.STATUS_COMPLETED)
+        self.assertEqual((status['total'], status['processed'], status['failed']), (5, 5, 0))
+        self.assertEqual(status['progress'], 100)
+        self.assertFalse(SubjectQR.objects.filter(image='').exists())
+
+    def test_command_regenerates_in_chunks(self):
+        """The management command regenerates every image and records a job"""
+        out = StringIO()
+        call_command('regenerate_qr_images', workers=1, base_url='https://example.com', stdout=out)
+
+        job = QRRegenerationJob.objects.get()
+        self.assertEqual(job.status, QRRegenerationJob.STATUS_COMPLETED)
+        self.assertEqual(job.processed, 5)
+        self.assertIn('Regenerated 5 QR code images', out.getvalue())
@@ -0,0 +1,38 @@
+import numpy as np
+import qrcode
+from django.test import SimpleTestCase
+from subjects import qr_render
+
+
+class QRRenderTests(SimpleTestCase):
+    """Tests for the NumPy QR rendering engine"""
+
+    data = 'https://keryu.mx/subjects/qr/00000000-0000-0000-0000-000000000000/scan/anonymous/'
+
+    def test_raster_matches_reference_renderer(self):
+        """Array scaling produces the same pixels as qrcode's PIL renderer"""
+        reference = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_M, box_size=10, border=4)
+        reference.add_data(self.data)
+        reference.make(fit=True)
+        expected = np.array(reference.make_image(fill_color="black", back_color="white").convert('L'))
+
+        np.testing.assert_array_equal(qr_render.rasterize(qr_render.qr_matrix(self.data), 10), expected)
+
+    def test_render_many_reuses_one_matrix(self):
+        """All sizes and formats are encoded from a single cached matrix"""
+        qr_render.qr_matrix.cache_clear()
+        images = qr_render.render_many(self.data, [(4, 'png'), (10, 'png'), (10, 'svg'), (10, 'webp')])
+
+        self.assertEqual(qr_render.qr_matrix.cache_info().misses, 1)
+        self.assertTrue(images[(4, 'png')].startswith(b'\x89PNG'))
+        self.assertLess(len(images[(4, 'png')]), len(images[(10, 'png')]))
+        self.assertTrue(images[(10, 'webp')].startswith(b'RIFF'))
+        self.assertIn(b'<path fill="#000"', images[(10, 'svg')])
+
+    def test_svg_covers_every_dark_module(self):
+        """The SVG path segments add up to the number of dark modules"""
+        matrix = qr_render.qr_matrix(self.data)
+        svg = qr_render.to_svg(matrix, 1).decode()
+        path = svg.split(' d="')[1].split('"')[0]
+        widths = [int(segment.split('h')[1].split('v')[0]) for segment in path.split('M')[1:]]
+        self.assertEqual(sum(widths), int(matrix.sum()))
@@ -0,0 +1,83 @@
+from unittest.mock import patch
+from django.test import TestCase, override_settings
+from core import rate_limit
+from core.messaging import MessageChannel, MessageService
+from core.redis_client import get_redis
+
+
+def clear_buckets():
+    client = get_redis()
+    keys = list(client.scan_iter('ratelimit:*')) + list(client.scan_iter('providers:*'))
+    if keys:
+        client.delete(*keys)
+
+
+@override_settings(
+    PROVIDER_RATE_LIMITS={'meta_whatsapp': (1, 2)}, RECIPIENT_RATE_LIMIT=(10, 10), RATE_LIMIT_BACKOFF=(2, 60)
+)
+class RateLimitTests(TestCase):
+    """Tests for the Redis token buckets in front of messaging providers"""
+
+    def setUp(self):
+        clear_buckets()
+
+    def tearDown(self):
+        clear_buckets()
+
+    def test_bucket_allows_burst_then_paces(self):
+        self.assertEqual(rate_limit.acquire('meta_whatsapp', 'acct', '+12025550123'), 0)
+        self.assertEqual(rate_limit.acquire('meta_whatsapp', 'acct', '+12025550124'), 0)
+
+        wait = rate_limit.acquire('meta_whatsapp', 'acct', '+12025550125')
+        self.assertGreater(wait, 0.9)
+        self.assertLessEqual(wait, 1)
+        # Another account has its own bucket
+        self.assertEqual(rate_limit.acquire('meta_whatsapp', 'other', '+12025550125'), 0)
+
+    @override_settings(RECIPIENT_RATE_LIMIT=(0.2, 1))
+    def test_recipient_bucket_is_checked_with_account_bucket(self):
+        """A send refused by the recipient bucket takes no token from the account bucket"""
+        self.assertEqual(rate_limit.acquire('meta_whatsapp', 'acct', '+12025550123'), 0)
+        self.assertGreater(rate_limit.acquire('meta_whatsapp', 'acct', '+12025550123'), 4)
+        self.assertEqual(rate_limit.acquire('meta_whatsapp', 'acct', '+12025550124'), 0)
+
+    def test_consecutive_429s_back_off_exponentially(self):
+        self.assertEqual(rate_limit.throttled('meta_whatsapp', 'acct'), 2)
+        self.assertEqual(rate_limit.throttled('meta_whatsapp', 'acct'), 4)
+        self.assertGreater(rate_limit.acquire('meta_whatsapp', 'acct', '+12025550123'), 3)
+
+    @override_settings(
+        NOTIFICATION_PROVIDER='console', TWILIO_ACCOUNT_SID='AC123', TWILIO_AUTH_TOKEN='token',
+        TWILIO_WHATSAPP_NUMBER='+12025550100', TWILIO_PHONE_NUMBER='+12025550101',
+        PROVIDER_RATE_LIMITS={}, WHATSAPP_PHONE_NUMBER_ID='acct'
+    )
+    def test_429_backs_off_provider_and_fails_over(self):
+        calls = []
+
+        async def send(service, channel, to_number, message):
+            calls.append(channel)
+            if channel == MessageChannel.META_WHATSAPP:
+                return {'status': 'error', 'channel': 'meta_whatsapp',
+                        'meta_result': {'success': False, 'code': 130429, 'status_code': 429}}
+            return {'status': 'success', 'message_sid': 'SM1', 'channel': channel.provider}
+
+        with patch.object(MessageService, '_get_channel', lambda self: MessageChannel.META_WHATSAPP), \
+                patch.object(MessageService, '_send', send):
+            result = MessageService().send_message('+12025550123', 'Alarm')
+
+        self.assertEqual(result['channel'], 'twilio_whatsapp')
+        self.assertEqual(calls, [MessageChannel.META_WHATSAPP, MessageChannel.TWILIO_WHATSAPP])
+        self.assertGreater(rate_limit.acquire('meta_whatsapp', 'acct', '+12025550999'), 1)
+
+    @patch('core.messaging.rate_limit.acquire', return_value=60)
+    def test_last_provider_waits_a_bounded_time(self, acquire):
+        """With every bucket empty for a long time the send fails instead of blocking the worker"""
+        async def send(self, channel, to_number, message):
+            raise AssertionError('sent without a token')
+
+        with patch.object(MessageService, '_get_channel', lambda self: MessageChannel.META_WHATSAPP), \
+                patch.object(MessageService, '_send', send):
+            result = MessageService().send_message('+12025550123', 'Alarm')
+
+        self.assertEqual(result['status'], 'error')
+        self.assertIn('rate limit reached', result['error'])
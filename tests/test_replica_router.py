@@ -0,0 +1,50 @@
+from unittest.mock import patch
+from django.test import TestCase, RequestFactory
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from alarms.models import Alarm
+from core.db_router import ReplicaRouter, ReplicaStickinessMiddleware, read_database, replica_reads
+
+
+@patch('core.db_router.replica_alias', return_value='replica')
+class ReplicaRouterTests(TestCase):
+    """Tests for read-replica routing and read-your-writes stickiness"""
+
+    def setUp(self):
+        cache.clear()
+        self.router = ReplicaRouter()
+        self.user = User.objects.create_user(username='replicauser', password='testpass123')
+
+    def _request(self, user, view):
+        request = RequestFactory().get('/')
+        request.user = user
+        return ReplicaStickinessMiddleware(view)(request)
+
+    def test_only_replica_blocks_read_from_replica(self, _):
+        self.assertEqual(self.router.db_for_read(Alarm), 'default')
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Alarm), 'replica')
+        self.assertEqual(self.router.db_for_write(Alarm), 'default')
+
+    def test_user_who_wrote_reads_from_primary(self, _):
+        """A write pins the rest of the request and the user's next requests to the primary"""
+        seen = []
+
+        def writing_view(request):
+            seen.append(read_database())
+            self.router.db_for_write(Alarm)
+            seen.append(read_database())
+
+        def reading_view(request):
+            seen.append(read_database())
+
+        self._request(self.user, writing_view)
+        self._request(self.user, reading_view)
+        self._request(User.objects.create_user(username='otheruser'), reading_view)
+        self.assertEqual(seen, ['replica', 'default', 'default', 'replica'])
+
+    def test_anonymous_writes_do_not_pin(self, _):
+        seen = []
+        self._request(AnonymousUser(), lambda request: self.router.db_for_write(Alarm))
+        self._request(self.user, lambda request: seen.append(read_database()))
+        self.assertEqual(seen, ['replica'])
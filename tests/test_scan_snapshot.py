@@ -0,0 +1,56 @@
+from datetime import date
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.urls import reverse
+from alarms.models import Alarm
+from subjects.models import Subject, SubjectQR
+
+
+class ScanSnapshotTests(TestCase):
+    """Tests for the cached, lock-free anonymous scan form"""
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='scanuser', password='testpass123')
+        self.subject = Subject.objects.create(
+            name='Scan Subject', date_of_birth=date(2015, 1, 1), gender='O', custodian=user.custodian
+        )
+        self.qr = SubjectQR.objects.create(subject=self.subject, is_active=True)
+        self.url = reverse('subjects:scan_qr_anonymous', args=[self.qr.uuid])
+
+    def test_form_is_served_from_snapshot(self):
+        """Repeated scans of an active QR code do not query the database"""
+        response = self.client.get(self.url, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'subjects/scan_form.html')
+        self.assertEqual(response.context['qr']['subject_name'], 'Scan Subject')
+
+        with self.assertNumQueries(0):
+            self.client.get(self.url, secure=True)
+
+    def test_saves_publish_new_snapshot(self):
+        """Deactivating a QR code, directly or by activating a sibling, shows up on the next scan"""
+        self.client.get(self.url, secure=True)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SubjectQR.objects.create(subject=self.subject, is_active=True)
+        response = self.client.get(self.url, secure=True)
+        self.assertTemplateUsed(response, 'subjects/scan_result.html')
+        self.assertFalse(response.context['is_active'])
+
+        missing = reverse('subjects:scan_qr_anonymous', args=['00000000-0000-0000-0000-000000000000'])
+        self.assertEqual(self.client.get(missing, secure=True).status_code, 404)
+
+    def test_post_creates_alarm_and_starts_cooldown(self):
+        """The POST creates the alarm under a row lock and later scans see the cooldown"""
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {'situation': 'TEST'}, secure=True)
+        self.assertTrue(response.context['success'])
+        alarm = Alarm.objects.get(qr_code=self.qr)
+
+        self.client.get(self.url, secure=True)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, secure=True)
+        self.assertTrue(response.context['is_duplicate'])
+        self.assertEqual(response.context['alarm'], alarm)
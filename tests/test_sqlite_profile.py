@@ -0,0 +1,35 @@
+from io import StringIO
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth.models import User
+
+
+class SQLiteProfileTests(TestCase):
+    """Tests for the SQLite connection profile and read-only views"""
+
+    def test_new_connections_get_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 20000)
+
+    @override_settings(SQLITE_PRAGMAS={'journal_mode': 'WAL', 'synchronous': 'NORMAL'})
+    def test_benchmark_compares_profiles(self):
+        out = StringIO()
+        call_command('benchmark_sqlite', duration=0.2, readers=1, writers=1, rows=100, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[1].startswith('baseline'))
+        self.assertTrue(lines[2].startswith('tuned'))
+
+    def test_dashboard_runs_outside_request_transaction(self):
+        """Read-only views opt out of ATOMIC_REQUESTS"""
+        user = User.objects.create_user(username='profileuser', password='testpass123')
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('custodians:custodian_dashboard'), secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q['sql'] for q in queries if 'SAVEPOINT' in q['sql']])
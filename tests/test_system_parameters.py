@@ -0,0 +1,42 @@
+from django.test import TestCase
+from core.models import SystemParameter
+from core.parameters import system_parameters
+
+
+class SystemParameterStoreTests(TestCase):
+    """Tests for the cached SystemParameter store"""
+
+    def setUp(self):
+        system_parameters.invalidate()
+        SystemParameter.objects.create(parameter='channel', value='3')
+        SystemParameter.objects.create(parameter='max_retries', value='5')
+        SystemParameter.objects.create(parameter='escalate', value='Yes')
+
+    def test_reads_are_served_from_snapshot(self):
+        """After the first load, lookups run no queries"""
+        self.assertEqual(system_parameters.get('channel'), '3')
+        with self.assertNumQueries(0):
+            self.assertEqual(system_parameters.get('channel'), '3')
+            self.assertEqual(SystemParameter.get_param('max_retries'), '5')
+            self.assertEqual(system_parameters.get('missing', 'fallback'), 'fallback')
+
+    def test_typed_accessors(self):
+        """Typed accessors convert values and fall back on bad input"""
+        SystemParameter.objects.create(parameter='ratio', value='not-a-number')
+        self.assertEqual(system_parameters.get_int('max_retries'), 5)
+        self.assertTrue(system_parameters.get_bool('escalate'))
+        self.assertFalse(system_parameters.get_bool('missing'))
+        self.assertIsNone(system_parameters.get_float('ratio'))
+        self.assertEqual(system_parameters.get_int('missing', 3), 3)
+
+    def test_save_and_delete_invalidate(self):
+        """Changing a parameter is visible on the next read"""
+        self.assertEqual(system_parameters.get('channel'), '3')
+
+        param = SystemParameter.objects.get(parameter='channel')
+        param.value = '1'
+        param.save()
+        self.assertEqual(system_parameters.get('channel'), '1')
+
+        param.delete()
+        self.assertIsNone(system_parameters.get('channel'))